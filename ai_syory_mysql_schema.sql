@@ -11,8 +11,15 @@ USE ai_syory;
 
 -- Drop tables if they exist (for clean setup)
 SET FOREIGN_KEY_CHECKS = 0;
+DROP TABLE IF EXISTS search_index;
+DROP TABLE IF EXISTS refresh_tokens;
+DROP TABLE IF EXISTS ai_messages;
 DROP TABLE IF EXISTS ai_conversations;
 DROP TABLE IF EXISTS user_settings;
+DROP TABLE IF EXISTS project_daily_stats;
+DROP TABLE IF EXISTS project_stats;
+DROP TABLE IF EXISTS document_revisions;
+DROP TABLE IF EXISTS compendium_tags;
 DROP TABLE IF EXISTS compendium_entries;
 DROP TABLE IF EXISTS documents;
 DROP TABLE IF EXISTS projects;
@@ -62,18 +69,58 @@ CREATE TABLE documents (
     project_id INT NOT NULL,
     parent_id INT NULL,
     is_active BOOLEAN DEFAULT TRUE,
+    word_count INT NOT NULL DEFAULT 0,
+    char_count INT NOT NULL DEFAULT 0,
+    version INT NOT NULL DEFAULT 1,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     
     FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
     FOREIGN KEY (parent_id) REFERENCES documents(id) ON DELETE SET NULL,
     INDEX idx_project (project_id),
+    INDEX idx_documents_project_order (project_id, order_index, id),
     INDEX idx_parent (parent_id),
     INDEX idx_type (document_type),
     INDEX idx_order (order_index),
     INDEX idx_active (is_active)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Project stats table - Running totals over each project's active documents
+CREATE TABLE project_stats (
+    project_id INT PRIMARY KEY,
+    word_count INT NOT NULL DEFAULT 0,
+    char_count INT NOT NULL DEFAULT 0,
+    document_count INT NOT NULL DEFAULT 0,
+    
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Project daily stats table - Words written and removed per project and UTC day
+CREATE TABLE project_daily_stats (
+    project_id INT NOT NULL,
+    day DATE NOT NULL,
+    words_added INT NOT NULL DEFAULT 0,
+    words_removed INT NOT NULL DEFAULT 0,
+    
+    PRIMARY KEY (project_id, day),
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Document revisions table - Compressed history: periodic snapshots plus reverse deltas
+CREATE TABLE document_revisions (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    document_id INT NOT NULL,
+    version INT NOT NULL,
+    kind VARCHAR(10) NOT NULL,
+    data LONGBLOB NOT NULL,
+    char_count INT NOT NULL,
+    word_count INT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE,
+    UNIQUE INDEX idx_document_revisions_document_version (document_id, version)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Compendium entries table - Store world-building elements
 CREATE TABLE compendium_entries (
     id INT PRIMARY KEY AUTO_INCREMENT,
@@ -81,16 +128,29 @@ CREATE TABLE compendium_entries (
     content TEXT,
     entry_type VARCHAR(50),
     tags JSON,
+    aliases JSON,
     project_id INT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     
     FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
-    INDEX idx_project (project_id),
-    INDEX idx_type (entry_type),
+    INDEX idx_compendium_entries_project (project_id, id),
+    INDEX idx_compendium_entries_project_type (project_id, entry_type, id),
     INDEX idx_title (title)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Compendium tags table - One row per entry tag, lowercased, for tag filters
+CREATE TABLE compendium_tags (
+    entry_id INT NOT NULL,
+    tag VARCHAR(100) NOT NULL,
+    project_id INT NOT NULL,
+    
+    PRIMARY KEY (entry_id, tag),
+    FOREIGN KEY (entry_id) REFERENCES compendium_entries(id) ON DELETE CASCADE,
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
+    INDEX idx_compendium_tags_project_tag (project_id, tag, entry_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- User settings table - Store user preferences
 CREATE TABLE user_settings (
     id INT PRIMARY KEY AUTO_INCREMENT,
@@ -114,6 +174,9 @@ CREATE TABLE ai_conversations (
     project_id INT NULL,
     document_id INT NULL,
     messages JSON,
+    summary TEXT NULL,
+    summary_seq INT NOT NULL DEFAULT 0,
+    summary_token_count INT NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     
@@ -126,6 +189,39 @@ CREATE TABLE ai_conversations (
     INDEX idx_created (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- AI messages table - One row per chat message, appended each turn
+CREATE TABLE ai_messages (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    conversation_id INT NOT NULL,
+    seq INT NOT NULL,
+    role VARCHAR(20) NOT NULL,
+    content LONGTEXT NOT NULL,
+    token_count INT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    FOREIGN KEY (conversation_id) REFERENCES ai_conversations(id) ON DELETE CASCADE,
+    UNIQUE INDEX idx_ai_messages_conversation_seq (conversation_id, seq)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Refresh tokens table - Hashed, rotating refresh tokens grouped by login
+CREATE TABLE refresh_tokens (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    user_id INT NOT NULL,
+    token_hash CHAR(64) NOT NULL UNIQUE,
+    family_id VARCHAR(32) NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    used_at TIMESTAMP NULL,
+    revoked_at TIMESTAMP NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_user (user_id),
+    INDEX idx_family (family_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- The search_index table (ngram FULLTEXT over documents and compendium entries)
+-- is created by the backend at startup and filled from the rows above
+
 -- Insert default admin user (password: admin123)
 INSERT INTO users (username, email, hashed_password, full_name, is_active) VALUES
 ('admin', 'admin@writingway.com', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewdBPj6hsxq5S/kS', 'Administrator', TRUE);
@@ -157,6 +253,10 @@ INSERT INTO compendium_entries (title, content, entry_type, project_id, tags) VA
 ('魔法系统', '在这个世界里，创造力本身就是一种魔法。作家可以通过想象力和AI辅助的力量让文字变成现实。', 'worldbuilding', 1, '["魔法", "创造力", "写作"]'),
 ('作家公会', '一个古老的作家组织，他们掌握了创意魔法的艺术。他们指导新作家踏上写作之旅。', 'organization', 1, '["公会", "作家", "组织"]');
 
+INSERT INTO compendium_tags (entry_id, tag, project_id) VALUES
+(1, '魔法', 1), (1, '创造力', 1), (1, '写作', 1),
+(2, '公会', 1), (2, '作家', 1), (2, '组织', 1);
+
 -- Create views for common queries
 CREATE VIEW active_projects AS
 SELECT p.*, u.username as owner_name,
@@ -234,7 +334,7 @@ CREATE INDEX idx_users_created ON users(created_at);
 -- Display success message and table information
 SELECT 'ai_syory数据库结构创建成功！' as status;
 SELECT 'Database: ai_syory' as database_name;
-SELECT 'Tables created: 6' as table_count;
+SELECT 'Tables created: 12' as table_count;
 SELECT 'Sample data inserted: Yes' as sample_data;
 SELECT 'Views created: 2' as views_count;
 SELECT 'Stored procedures: 3' as procedures_count;
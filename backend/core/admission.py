@@ -0,0 +1,145 @@
+"""
+Admission control for AI endpoints: global and per-user concurrency caps with a bounded wait queue
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+from fastapi import HTTPException, Request, status
+
+class AdmissionController:
+    """Bounds in-flight AI calls so a burst from a few users cannot starve everyone else
+    
+    A request first has to be under its user's in-flight cap (else 429), then
+    gets a global slot or waits for one in a bounded queue. A full queue or a
+    wait past the deadline is rejected with 503. Both rejections carry a
+    Retry-After estimated from recent call durations.
+    
+    A request that runs several calls at once (a batch) is admitted with a
+    weight: it takes that many global slots but counts once against its
+    user's cap.
+    """
+
+    def __init__(self, max_concurrent: int, max_per_user: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        # Weighted requests take their slots one at a time; only one may be
+        # doing so, or two could each hold part of what they need and wait forever
+        self._weighted = asyncio.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+        self._per_user: Dict[int, int] = {}
+        self._wait_times: deque = deque(maxlen=200)
+        self._hold_times: deque = deque(maxlen=200)
+        self.admitted = 0
+        self.rejected = {"user_limit": 0, "queue_full": 0, "timeout": 0}
+
+    async def acquire(self, user_id: int, weight: int = 1) -> float:
+        """Wait for weight slots; returns the admission time to pass to release()"""
+        weight = max(1, min(weight, self.max_concurrent))
+        if self._per_user.get(user_id, 0) >= self.max_per_user:
+            self._reject("user_limit", status.HTTP_429_TOO_MANY_REQUESTS,
+                         "Too many AI requests in progress for this user")
+        if self.max_concurrent - self._in_flight < weight and self._waiting >= self.max_queue:
+            self._reject("queue_full", status.HTTP_503_SERVICE_UNAVAILABLE,
+                         "AI service is busy, please retry shortly")
+        
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        self._waiting += 1
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(self._take_slots(weight), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._release_user(user_id)
+            self._reject("timeout", status.HTTP_503_SERVICE_UNAVAILABLE,
+                         "AI service is busy, please retry shortly")
+        except BaseException:
+            self._release_user(user_id)
+            raise
+        finally:
+            self._waiting -= 1
+        
+        admitted_at = time.monotonic()
+        self._wait_times.append(admitted_at - queued_at)
+        self._in_flight += weight
+        self.admitted += 1
+        return admitted_at
+
+    def release(self, user_id: int, admitted_at: float, weight: int = 1) -> None:
+        """Give back the slots taken by acquire() with the same weight"""
+        weight = max(1, min(weight, self.max_concurrent))
+        self._hold_times.append(time.monotonic() - admitted_at)
+        self._in_flight -= weight
+        for _ in range(weight):
+            self._slots.release()
+        self._release_user(user_id)
+
+    @asynccontextmanager
+    async def admit(self, user_id: int, weight: int = 1) -> AsyncIterator[None]:
+        """Hold weight slots for the duration of the block"""
+        admitted_at = await self.acquire(user_id, weight)
+        try:
+            yield
+        finally:
+            self.release(user_id, admitted_at, weight)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, wait times and rejection counters"""
+        waits = list(self._wait_times)
+        return {
+            "in_flight": self._in_flight,
+            "queue_depth": self._waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_wait_seconds": sum(waits) / len(waits) if waits else 0.0,
+            "max_wait_seconds": max(waits) if waits else 0.0
+        }
+
+    async def _take_slots(self, weight: int) -> None:
+        """Take weight slots, giving back any already taken if the wait is abandoned"""
+        if weight == 1:
+            await self._slots.acquire()
+            return
+        taken = 0
+        try:
+            async with self._weighted:
+                for _ in range(weight):
+                    await self._slots.acquire()
+                    taken += 1
+        except BaseException:
+            for _ in range(taken):
+                self._slots.release()
+            raise
+
+    def _release_user(self, user_id: int) -> None:
+        remaining = self._per_user.get(user_id, 0) - 1
+        if remaining > 0:
+            self._per_user[user_id] = remaining
+        else:
+            self._per_user.pop(user_id, None)
+
+    def _reject(self, reason: str, status_code: int, detail: str) -> None:
+        self.rejected[reason] += 1
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self._retry_after())}
+        )
+
+    def _retry_after(self) -> int:
+        """Seconds until a slot is likely free, from the recent average call duration"""
+        holds = list(self._hold_times)
+        average = sum(holds) / len(holds) if holds else 1.0
+        return max(1, math.ceil(average * (self._waiting + 1) / self.max_concurrent))
+
+def get_admission_controller(request: Request) -> AdmissionController:
+    """Dependency returning the app's admission controller"""
+    return request.app.state.admission
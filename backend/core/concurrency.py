@@ -0,0 +1,128 @@
+"""
+Worker pools for running blocking database, AI provider and password hashing work off the event loop
+"""
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, TypeVar
+
+import anyio.to_thread
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+
+T = TypeVar("T")
+
+# Dedicated pool for provider calls; created in the app lifespan
+_ai_executor: Optional[ThreadPoolExecutor] = None
+
+# Process pool for bcrypt, which holds the GIL and would stall every thread
+_password_executor: Optional[ProcessPoolExecutor] = None
+
+def configure_thread_pools() -> None:
+    """Size the shared worker pool and start the AI provider and password pools"""
+    global _ai_executor
+    # Sync endpoints, sync dependencies and run_blocking all share this limiter
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.worker_threads
+    if _ai_executor is None:
+        _ai_executor = ThreadPoolExecutor(
+            max_workers=settings.ai_worker_threads,
+            thread_name_prefix="ai-provider"
+        )
+    _start_password_pool()
+
+def _start_password_pool() -> ProcessPoolExecutor:
+    """Create the password hashing pool and start its processes up front"""
+    global _password_executor
+    if _password_executor is None:
+        # spawn, not fork: the parent already runs threads and holds DB connections
+        _password_executor = ProcessPoolExecutor(
+            max_workers=settings.password_hash_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        # Workers start on demand; starting them now keeps their import cost
+        # away from the first burst of logins
+        for _ in range(settings.password_hash_workers):
+            _password_executor.submit(int)
+    return _password_executor
+
+def shutdown_thread_pools() -> None:
+    """Stop the AI provider and password pools, dropping work that has not started yet"""
+    global _ai_executor, _password_executor
+    if _ai_executor is not None:
+        _ai_executor.shutdown(wait=False, cancel_futures=True)
+        _ai_executor = None
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run blocking database work in the shared worker pool"""
+    return await run_in_threadpool(func, *args, **kwargs)
+
+async def run_ai_call(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking AI provider call in the dedicated AI pool"""
+    if _ai_executor is None:
+        configure_thread_pools()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_ai_executor, functools.partial(func, *args, **kwargs))
+
+async def run_password_hashing(func: Callable[..., T], *args: Any) -> T:
+    """Run a core.passwords function in the password hashing process pool
+    
+    Only password_hash_workers hashes run at once; further calls queue.
+    """
+    executor = _start_password_pool()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+async def stream_ai_call(stream: Iterator[T]) -> AsyncIterator[T]:
+    """Drive a blocking provider stream in the AI pool and yield its chunks on the event loop
+    
+    The stream must be lazy (e.g. a generator) so creating it does no I/O.
+    Closing the returned iterator (e.g. on client disconnect) makes the worker
+    stop at the next chunk and close the provider stream, which aborts the
+    upstream generation.
+    """
+    if _ai_executor is None:
+        configure_thread_pools()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    end = object()
+
+    def publish(item: Any, error: Optional[BaseException] = None) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:
+            # Event loop already closed; nobody is listening any more
+            cancelled.set()
+
+    def pump() -> None:
+        try:
+            for item in stream:
+                if cancelled.is_set():
+                    break
+                publish(item)
+        except BaseException as e:
+            publish(end, e)
+        else:
+            publish(end)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+    loop.run_in_executor(_ai_executor, pump)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        cancelled.set()
@@ -8,15 +8,72 @@ import os
 class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite:///./writingway.db"
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_recycle: int = 300  # Seconds
     
     # Security
     secret_key: str = "your-secret-key-change-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    refresh_token_expire_days: int = 30  # Sliding: every refresh starts a new period
+    refresh_token_reuse_grace_seconds: float = 30.0  # A just-rotated token still refreshes (another tab raced it)
+    auth_cache_ttl_seconds: float = 60.0  # How long a verified token skips the users query
+    auth_cache_max_entries: int = 10000
+    bcrypt_rounds: int = 12  # Existing hashes with another cost are upgraded at login
+    password_hash_workers: int = 2  # Processes for bcrypt; also caps concurrent hashes
     
     # AI Services
     openai_api_key: Optional[str] = None
     gemini_api_key: Optional[str] = None
+    openai_base_url: Optional[str] = None  # Any OpenAI-compatible endpoint
+    ai_request_timeout: float = 60.0  # Seconds
+    ai_connect_timeout: float = 5.0  # Seconds
+    ai_max_connections: int = 20
+    ai_max_keepalive_connections: int = 10
+    
+    # Provider routing
+    ai_openai_timeout: float = 30.0  # Seconds per call
+    ai_gemini_timeout: float = 30.0  # Seconds per call
+    ai_circuit_failure_threshold: int = 3  # Consecutive failures before a provider is skipped
+    ai_circuit_reset_seconds: float = 30.0  # How long an open circuit waits before a trial call
+    ai_latency_window: int = 50  # Calls kept for rolling latency/error stats
+    ai_hedge_enabled: bool = False  # Start the next provider once the current one passes its p95
+    ai_hedge_min_samples: int = 10  # Latency samples needed before hedging kicks in
+    
+    # AI admission control
+    ai_max_concurrent_calls: int = 16  # Global cap on in-flight AI calls
+    ai_max_calls_per_user: int = 3  # Per-user cap; more is rejected with 429
+    ai_max_queue: int = 64  # Requests allowed to wait for a slot; more is rejected with 503
+    ai_queue_timeout: float = 10.0  # Seconds a request may wait before a 503
+    ai_batch_concurrency: int = 4  # Items of one batch request run in parallel
+    ai_batch_max_items: int = 100
+    
+    # Chat context window (token counts are estimates)
+    chat_context_token_budget: int = 3000  # History + summary sent with each message
+    chat_summary_token_budget: int = 500  # Upper bound for the running summary
+    chat_summary_batch_tokens: int = 800  # Fold old turns into the summary once this many overflow
+    chat_compendium_token_budget: int = 1000  # Compendium entries the active document mentions
+    compendium_matcher_cache_size: int = 64  # Projects whose entry matcher stays compiled
+    compendium_matcher_ttl_seconds: float = 300.0  # Bounds staleness when another worker edits entries
+    
+    # Writing assistance result cache
+    ai_cache_enabled: bool = True
+    ai_cache_max_entries: int = 1000
+    ai_cache_max_bytes: int = 32 * 1024 * 1024  # 32MB
+    ai_cache_ttl_seconds: int = 24 * 3600
+    ai_cache_path: Optional[str] = None  # SQLite file for a persistent tier, e.g. "ai_cache.db"
+    
+    # Request execution (blocking work is kept off the event loop)
+    worker_threads: int = 40  # Shared pool for blocking DB work and sync endpoints
+    ai_worker_threads: int = 16  # Separate pool so slow LLM calls cannot starve DB work
+    
+    # Documents
+    document_snapshot_interval: int = 50  # Full copy every N revisions; bounds restore cost to N deltas
+    document_bulk_max_operations: int = 1000  # Operations accepted by one bulk request
+    import_max_files: int = 10000  # Markdown/text files accepted from one archive
+    import_max_total_size: int = 200 * 1024 * 1024  # 200MB of uncompressed text per archive
+    import_batch_size: int = 500  # Documents inserted per batch during an import
     
     # File Storage
     upload_dir: str = "uploads"
@@ -0,0 +1,37 @@
+"""
+Password hashing
+
+Kept free of database imports so the hashing process pool can load it cheaply.
+"""
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+from core.config import settings
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.bcrypt_rounds
+)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password: str) -> str:
+    """Hash a password"""
+    return pwd_context.hash(password)
+
+def verify_and_rehash(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also return a new hash if the stored one uses a different cost"""
+    if not pwd_context.verify(plain_password, hashed_password):
+        return False, None
+    if hash_rounds(hashed_password) != settings.bcrypt_rounds:
+        return True, pwd_context.hash(plain_password)
+    return True, None
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """The bcrypt cost of a stored hash, e.g. 12 for "$2b$12$..." """
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
@@ -0,0 +1,102 @@
+"""
+In-process cache of authenticated principals so requests skip the users query
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database.models import User
+from core.config import settings
+
+@dataclass(frozen=True)
+class Principal:
+    """The user fields routers need, detached from any database session"""
+    id: int
+    username: str
+    email: str
+    full_name: Optional[str]
+    is_active: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            full_name=user.full_name,
+            is_active=user.is_active,
+            created_at=user.created_at
+        )
+
+class PrincipalCache:
+    """LRU + TTL map from bearer token to principal
+
+    An entry never outlives its token's exp claim, and all entries of a user
+    are dropped when that user row changes.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Principal]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Principal]:
+        """Return the cached principal for a token, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def set(self, token: str, principal: Principal, token_expires_at: Optional[float] = None) -> None:
+        """Cache a principal until the TTL or the token's expiry, whichever is first"""
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._entries[token] = (expires_at, principal)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop every cached token of a user"""
+        with self._lock:
+            stale = [token for token, (_, principal) in self._entries.items() if principal.id == user_id]
+            for token in stale:
+                del self._entries[token]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache(
+    max_entries=settings.auth_cache_max_entries,
+    ttl_seconds=settings.auth_cache_ttl_seconds
+)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: User) -> None:
+    """Updates and deletes made through the ORM (e.g. deactivation) take effect immediately"""
+    principal_cache.invalidate_user(target.id)
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_after_bulk(orm_execute_state) -> None:
+    """UPDATE/DELETE statements on users do not say which rows changed, so drop everything"""
+    mapper = orm_execute_state.bind_mapper
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and mapper is not None and mapper.class_ is User:
+        principal_cache.clear()
@@ -1,31 +1,24 @@
 """
 Security utilities for authentication and authorization
 """
+import hashlib
+import secrets
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from database.database import get_db
-from database.models import User
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.database import get_async_db
+from database.models import User, RefreshToken
 from core.config import settings
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from core.passwords import pwd_context, verify_password, get_password_hash
+from core.principals import Principal, principal_cache
 
 # JWT token security
 security = HTTPBearer()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str) -> str:
-    """Hash a password"""
-    return pwd_context.hash(password)
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -38,39 +31,149 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
+def hash_refresh_token(token: str) -> str:
+    """Refresh tokens are stored as SHA-256 digests, never in plain text"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+async def issue_refresh_token(db: AsyncSession, user_id: int, family_id: Optional[str] = None) -> str:
+    """Add a refresh token for the user to the session; the caller commits
+    
+    A new login starts a new family; rotations stay in the family they came from.
+    """
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or secrets.token_hex(16),
+        expires_at=datetime.utcnow() + timedelta(days=settings.refresh_token_expire_days)
+    ))
+    return token
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> Tuple[User, str]:
+    """Exchange a refresh token for a new one, returning its user
+    
+    Each token can be used once. Presenting an already rotated token means it
+    leaked (or was replayed), so the whole family is revoked - unless it was
+    rotated within the last few seconds, which is another tab of the same
+    browser refreshing at the same moment; that one gets a token of its own.
+    """
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    now = datetime.utcnow()
+    result = await db.execute(
+        select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(token))
+    )
+    stored = result.scalars().first()
+    if stored is None or stored.revoked_at is not None or stored.expires_at <= now:
+        raise invalid_token
+    
+    # Claim the token atomically; a refresh that loses the claim is a reuse
+    claimed = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == stored.id, RefreshToken.used_at.is_(None))
+        .values(used_at=now)
+    )
+    if claimed.rowcount == 0:
+        # Read used_at again: a concurrent refresh may have set it after the select
+        used_at = (await db.execute(
+            select(RefreshToken.used_at).where(RefreshToken.id == stored.id)
+        )).scalar()
+        grace = timedelta(seconds=settings.refresh_token_reuse_grace_seconds)
+        if used_at is None or used_at < now - grace:
+            await db.execute(
+                update(RefreshToken)
+                .where(RefreshToken.family_id == stored.family_id, RefreshToken.revoked_at.is_(None))
+                .values(revoked_at=now)
+            )
+            await db.commit()
+            raise invalid_token
+    
+    user = await db.get(User, stored.user_id)
+    if user is None or not user.is_active:
+        await db.rollback()
+        raise invalid_token
+    
+    new_token = await issue_refresh_token(db, user.id, stored.family_id)
+    await db.commit()
+    return user, new_token
+
+async def revoke_refresh_token(db: AsyncSession, token: str) -> None:
+    """Revoke every token of the family the given token belongs to"""
+    family_id = (await db.execute(
+        select(RefreshToken.family_id).where(RefreshToken.token_hash == hash_refresh_token(token))
+    )).scalar()
+    if family_id is None:
+        return
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    await db.commit()
+
+async def prune_refresh_tokens(db: AsyncSession, user_id: int) -> None:
+    """Delete the user's expired refresh tokens; the caller commits"""
+    await db.execute(
+        delete(RefreshToken).where(
+            RefreshToken.user_id == user_id,
+            RefreshToken.expires_at <= datetime.utcnow()
+        )
+    )
+
 def verify_token(token: str) -> Optional[str]:
     """Verify a JWT token and return the username"""
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    return payload.get("sub")
+
+def decode_token(token: str) -> Optional[dict]:
+    """Verify a JWT token and return its claims"""
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        username: str = payload.get("sub")
-        if username is None:
+        if payload.get("sub") is None:
             return None
-        return username
+        return payload
     except JWTError:
         return None
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get the current authenticated user"""
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Get the current authenticated user
+    
+    Verified tokens are cached briefly, so most requests skip both the JWT
+    check and the users query.
+    """
+    token = credentials.credentials
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    username = verify_token(credentials.credentials)
-    if username is None:
+    payload = decode_token(token)
+    if payload is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    result = await db.execute(select(User).where(User.username == payload["sub"]))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
     
-    return user
+    principal = Principal.from_user(user)
+    principal_cache.set(token, principal, payload.get("exp"))
+    return principal
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     """Get the current active user"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -1,31 +1,52 @@
 """
 Database configuration and session management
 """
+from typing import Tuple
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from core.config import settings
 
-# Create database engine
-if "mysql" in settings.database_url:
+# Driver pairs per backend; DATABASE_URL may name either side of the pair
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "mysql": "mysql+aiomysql"}
+SYNC_DRIVERS = {"sqlite": "sqlite", "mysql": "mysql+pymysql"}
+
+def _split_database_url(raw_url: str) -> Tuple[URL, URL]:
+    """Return the (sync, async) URLs for the configured database"""
+    url = make_url(raw_url)
+    backend = url.get_backend_name()
+    if url.get_driver_name() in ("aiosqlite", "aiomysql", "asyncmy"):
+        return url.set(drivername=SYNC_DRIVERS[backend]), url
+    return url, url.set(drivername=ASYNC_DRIVERS.get(backend, url.drivername))
+
+sync_database_url, async_database_url = _split_database_url(settings.database_url)
+
+# Create database engines
+if sync_database_url.get_backend_name() == "mysql":
     # MySQL configuration
-    engine = create_engine(
-        settings.database_url,
+    pool_options = dict(
         pool_pre_ping=True,
-        pool_recycle=300,
+        pool_recycle=settings.db_pool_recycle,
         echo=False,  # Set to True to see SQL queries in logs
-        pool_size=10,
-        max_overflow=20
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow
     )
+    engine = create_engine(sync_database_url, **pool_options)
+    async_engine = create_async_engine(async_database_url, **pool_options)
 else:
     # SQLite configuration (fallback)
     engine = create_engine(
-        settings.database_url,
+        sync_database_url,
         connect_args={"check_same_thread": False}
     )
+    async_engine = create_async_engine(async_database_url)
 
-# Create session factory
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay readable after commit; lazy reloads are not possible on an AsyncSession
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Create base class for models
 Base = declarative_base()
@@ -37,3 +58,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependency to get an async database session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
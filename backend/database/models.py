@@ -1,7 +1,7 @@
 """
 Database models for Writingway
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, ForeignKey, JSON, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database.database import Base
@@ -41,6 +41,10 @@ class Project(Base):
 
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # Serves the outline's keyset pagination within a project
+        Index("idx_documents_project_order", "project_id", "order_index", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
@@ -50,6 +54,9 @@ class Document(Base):
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
     parent_id = Column(Integer, ForeignKey("documents.id"))  # For hierarchical structure
     is_active = Column(Boolean, default=True)
+    word_count = Column(Integer, nullable=False, default=0, server_default="0")  # Kept in step with content
+    char_count = Column(Integer, nullable=False, default=0, server_default="0")  # Characters of the text, whitespace excluded
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Bumped on every content change
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -58,14 +65,53 @@ class Document(Base):
     parent = relationship("Document", remote_side=[id])
     children = relationship("Document")
 
+class ProjectStats(Base):
+    __tablename__ = "project_stats"
+    
+    # Totals over the project's active documents, changed in the same transaction as they are
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    word_count = Column(Integer, nullable=False, default=0, server_default="0")
+    char_count = Column(Integer, nullable=False, default=0, server_default="0")
+    document_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+class ProjectDailyStats(Base):
+    __tablename__ = "project_daily_stats"
+    
+    # Writing progress per project and UTC day
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    words_added = Column(Integer, nullable=False, default=0, server_default="0")
+    words_removed = Column(Integer, nullable=False, default=0, server_default="0")
+
+class DocumentRevision(Base):
+    __tablename__ = "document_revisions"
+    __table_args__ = (
+        Index("idx_document_revisions_document_version", "document_id", "version", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False)  # Document version whose content this stores
+    kind = Column(String(10), nullable=False)  # "snapshot" (full content) or "delta" (reverse delta to version + 1)
+    data = Column(LargeBinary(length=2**32 - 1), nullable=False)  # zlib compressed
+    char_count = Column(Integer, nullable=False)
+    word_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class CompendiumEntry(Base):
     __tablename__ = "compendium_entries"
+    __table_args__ = (
+        # Serve keyset pagination of a project's entries, optionally by type
+        Index("idx_compendium_entries_project", "project_id", "id"),
+        Index("idx_compendium_entries_project_type", "project_id", "entry_type", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     content = Column(Text)
     entry_type = Column(String(50))  # character, location, item, etc.
-    tags = Column(JSON)  # List of tags
+    tags = Column(JSON)  # List of tags as entered; compendium_tags indexes them
+    aliases = Column(JSON)  # Other names the entry is mentioned by
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -73,6 +119,17 @@ class CompendiumEntry(Base):
     # Relationships
     project = relationship("Project", back_populates="compendium_entries")
 
+class CompendiumTag(Base):
+    __tablename__ = "compendium_tags"
+    __table_args__ = (
+        # Finds a project's entries with a tag in entry order
+        Index("idx_compendium_tags_project_tag", "project_id", "tag", "entry_id"),
+    )
+    
+    entry_id = Column(Integer, ForeignKey("compendium_entries.id", ondelete="CASCADE"), primary_key=True)
+    tag = Column(String(100), primary_key=True)  # Lowercased for matching
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+
 class UserSettings(Base):
     __tablename__ = "user_settings"
     
@@ -96,6 +153,36 @@ class AIConversation(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     project_id = Column(Integer, ForeignKey("projects.id"))
     document_id = Column(Integer, ForeignKey("documents.id"))
-    messages = Column(JSON)  # List of conversation messages
+    messages = Column(JSON)  # Legacy message list; moved to ai_messages at startup
+    summary = Column(Text)  # Running summary of messages up to summary_seq
+    summary_seq = Column(Integer, nullable=False, default=0, server_default="0")
+    summary_token_count = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class AIMessage(Base):
+    __tablename__ = "ai_messages"
+    __table_args__ = (
+        # One row per turn position; also serves ordered reads of a conversation
+        Index("idx_ai_messages_conversation_seq", "conversation_id", "seq", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("ai_conversations.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)  # Position within the conversation, starting at 1
+    role = Column(String(20), nullable=False)  # "user" or "assistant"
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)  # SHA-256 of the token
+    family_id = Column(String(32), index=True, nullable=False)  # Shared by all rotations of one login
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    used_at = Column(DateTime(timezone=True))  # Set when rotated; presenting it again is reuse
+    revoked_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,219 @@
+"""
+In-place schema upgrades for existing databases
+
+create_all() only creates missing tables, so columns and indexes added to
+existing models are added here when the app starts, and new derived
+columns are filled in for the rows that already exist.
+"""
+from typing import Callable, Dict, List
+from sqlalchemy import exists, func, insert, inspect, null, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
+from database.database import Base
+from database.models import AIConversation, AIMessage, CompendiumEntry, CompendiumTag, Document, ProjectStats
+from services.compendium_tags import MAX_TAG_LENGTH, normalize_tags, tag_rows
+from services.context_window import count_tokens
+from services.search_index import create_search_index, rebuild_search_index
+from services.text_stats import count_chars, count_words
+
+BACKFILL_BATCH_SIZE = 500
+
+def upgrade_schema(connection: Connection) -> List[str]:
+    """Add missing columns and indexes, then backfill new derived columns"""
+    added = add_missing_columns(connection)
+    for column in added:
+        backfill = BACKFILLS.get(column)
+        if backfill is not None:
+            backfill(connection)
+    added += add_missing_indexes(connection)
+    if _backfill_compendium_tags(connection):
+        added.append("compendium_tags")
+    if _backfill_project_stats(connection):
+        added.append("project_stats")
+    if migrate_message_blobs(connection):
+        added.append("ai_messages")
+    # The search index is not an ORM table; fill it from existing rows when first created
+    if create_search_index(connection):
+        rebuild_search_index(connection)
+        added.append("search_index")
+    return added
+
+def add_missing_columns(connection: Connection) -> List[str]:
+    """Add model columns that the database tables do not have yet"""
+    inspector = inspect(connection)
+    added = []
+    
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            # New columns must be nullable or carry a server_default for existing rows
+            column_sql = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column_sql}")
+            added.append(f"{table.name}.{column.name}")
+    
+    return added
+
+def add_missing_indexes(connection: Connection) -> List[str]:
+    """Create model indexes that the database tables do not have yet"""
+    inspector = inspect(connection)
+    added = []
+    
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = inspector.get_indexes(table.name)
+        names = {index["name"] for index in existing}
+        # Databases made from the SQL scripts name their indexes differently
+        columns = {tuple(index["column_names"]) for index in existing}
+        for index in table.indexes:
+            if index.name in names or tuple(column.name for column in index.columns) in columns:
+                continue
+            index.create(connection)
+            added.append(index.name)
+    
+    return added
+
+def _backfill_word_counts(connection: Connection) -> None:
+    """Count words of documents saved before word_count existed"""
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(Document.id, Document.content)
+            .where(Document.id > last_id)
+            .order_by(Document.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        for row in rows:
+            connection.execute(
+                update(Document).where(Document.id == row.id).values(word_count=count_words(row.content))
+            )
+        last_id = rows[-1].id
+
+def _backfill_char_counts(connection: Connection) -> None:
+    """Count characters of documents saved before char_count existed"""
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(Document.id, Document.content)
+            .where(Document.id > last_id)
+            .order_by(Document.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        for row in rows:
+            connection.execute(
+                update(Document).where(Document.id == row.id).values(char_count=count_chars(row.content))
+            )
+        last_id = rows[-1].id
+
+def _backfill_compendium_tags(connection: Connection) -> bool:
+    """Fill compendium_tags from the JSON tags of entries made before it existed
+    
+    Only runs while the table is still empty; returns True if it ran.
+    """
+    if connection.execute(select(exists().select_from(CompendiumTag))).scalar():
+        return False
+    
+    ran = False
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(CompendiumEntry.id, CompendiumEntry.project_id, CompendiumEntry.tags)
+            .where(CompendiumEntry.id > last_id, CompendiumEntry.tags.isnot(None))
+            .order_by(CompendiumEntry.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return ran
+        values = []
+        for row in rows:
+            tags = [tag[:MAX_TAG_LENGTH] for tag in row.tags or [] if isinstance(tag, str)]
+            values += tag_rows(row.id, row.project_id, normalize_tags(tags))
+        if values:
+            connection.execute(insert(CompendiumTag), values)
+            ran = True
+        last_id = rows[-1].id
+
+def _backfill_project_stats(connection: Connection) -> bool:
+    """Total up the stored counts of projects whose documents predate project_stats
+    
+    Only runs while the table is still empty; returns True if it added rows.
+    """
+    if connection.execute(select(exists().select_from(ProjectStats))).scalar():
+        return False
+    
+    result = connection.execute(
+        insert(ProjectStats).from_select(
+            ["project_id", "word_count", "char_count", "document_count"],
+            select(
+                Document.project_id,
+                func.sum(Document.word_count),
+                func.sum(Document.char_count),
+                func.count()
+            ).where(Document.is_active == True).group_by(Document.project_id)
+        )
+    )
+    return result.rowcount > 0
+
+def migrate_message_blobs(connection: Connection) -> bool:
+    """Move legacy AIConversation.messages blobs into ai_messages rows
+    
+    A conversation that already has rows (it got new turns before the blob
+    was moved) keeps them after the older blob turns: its rows and summary
+    position shift up to make room. Returns True if any blob was moved.
+    """
+    ran = False
+    while True:
+        # Moved blobs are cleared, so this always finds the next batch
+        conversations = connection.execute(
+            select(AIConversation.id, AIConversation.messages, AIConversation.summary_seq)
+            .where(AIConversation.messages.isnot(None))
+            .order_by(AIConversation.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not conversations:
+            return ran
+        for conversation in conversations:
+            messages = conversation.messages if isinstance(conversation.messages, list) else []
+            rows = [
+                {
+                    "conversation_id": conversation.id,
+                    "seq": seq,
+                    "role": message.get("role", "user"),
+                    "content": message.get("content") or "",
+                    "token_count": count_tokens(message.get("content"))
+                }
+                for seq, message in enumerate(messages, start=1)
+                if isinstance(message, dict)
+            ]
+            if rows:
+                shift = len(rows)
+                in_conversation = AIMessage.conversation_id == conversation.id
+                # (conversation_id, seq) is unique and checked row by row, so go
+                # through negative positions rather than shifting in place
+                connection.execute(update(AIMessage).where(in_conversation).values(seq=-AIMessage.seq))
+                connection.execute(
+                    update(AIMessage).where(in_conversation, AIMessage.seq < 0).values(seq=shift - AIMessage.seq)
+                )
+                connection.execute(insert(AIMessage), rows)
+            # Turns older than the summarized ones count as summarized too
+            summary_seq = conversation.summary_seq + len(rows) if conversation.summary_seq else 0
+            connection.execute(
+                update(AIConversation)
+                .where(AIConversation.id == conversation.id)
+                .values(messages=null(), summary_seq=summary_seq)
+            )
+            ran = True
+
+# Columns whose values are derived from existing data, by "table.column"
+BACKFILLS: Dict[str, Callable[[Connection], None]] = {
+    "documents.word_count": _backfill_word_counts,
+    "documents.char_count": _backfill_char_counts
+}
@@ -10,6 +10,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from sqlalchemy.orm import Session
 from database.database import engine, SessionLocal
 from database.models import Base, User, UserSettings
+from database.schema_upgrade import upgrade_schema
 from core.security import get_password_hash
 
 def init_database():
@@ -19,6 +20,9 @@ def init_database():
     # Create all tables
     print("📊 Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for change in upgrade_schema(connection):
+            print(f"   Added {change}")
     print("✅ Database tables created successfully!")
     
     # Create a session
@@ -9,9 +9,15 @@ import uvicorn
 import os
 from dotenv import load_dotenv
 
-from database.database import engine, Base
-from routers import auth, projects, documents, ai_assistant, settings
+from database.database import async_engine, engine, Base
+from database.schema_upgrade import upgrade_schema
+from routers import auth, projects, documents, compendium, ai_assistant, settings
 from core.config import settings as app_settings
+from core.admission import AdmissionController
+from core.concurrency import configure_thread_pools, shutdown_thread_pools
+from services.ai_cache import AssistanceCache
+from services.ai_providers import AIProviderRegistry
+from services.ai_service import AIService
 
 # Load environment variables
 load_dotenv()
@@ -19,10 +25,33 @@ load_dotenv()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+    configure_thread_pools()
+    app.state.admission = AdmissionController(
+        max_concurrent=app_settings.ai_max_concurrent_calls,
+        max_per_user=app_settings.ai_max_calls_per_user,
+        max_queue=app_settings.ai_max_queue,
+        queue_timeout=app_settings.ai_queue_timeout
+    )
+    app.state.ai_providers = AIProviderRegistry()
+    app.state.ai_cache = AssistanceCache(
+        max_entries=app_settings.ai_cache_max_entries,
+        max_bytes=app_settings.ai_cache_max_bytes,
+        ttl_seconds=app_settings.ai_cache_ttl_seconds,
+        persist_path=app_settings.ai_cache_path
+    ) if app_settings.ai_cache_enabled else None
+    app.state.ai_service = AIService(app.state.ai_providers, app.state.ai_cache)
     yield
     # Shutdown
-    pass
+    shutdown_thread_pools()
+    app.state.ai_service.close()
+    app.state.ai_providers.close()
+    if app.state.ai_cache is not None:
+        app.state.ai_cache.close()
+    await async_engine.dispose()
+    engine.dispose()
 
 # Create FastAPI app
 app = FastAPI(
@@ -39,12 +68,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(projects.router, prefix="/api/projects", tags=["projects"])
 app.include_router(documents.router, prefix="/api/documents", tags=["documents"])
+app.include_router(compendium.router, prefix="/api/compendium", tags=["compendium"])
 app.include_router(ai_assistant.router, prefix="/api/ai", tags=["ai-assistant"])
 app.include_router(settings.router, prefix="/api/settings", tags=["settings"])
 
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Migration script for Writingway
+Moves the AIConversation.messages JSON blobs into the ai_messages table
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import engine
+from database.models import Base, AIMessage
+from database.schema_upgrade import migrate_message_blobs
+
+def migrate_conversations():
+    """Copy every legacy message blob into ai_messages and clear the blob
+    
+    The app does the same at startup; conversations that already have rows
+    keep them after their older blob turns.
+    """
+    print("📊 Creating ai_messages table...")
+    Base.metadata.create_all(bind=engine, tables=[AIMessage.__table__])
+    
+    try:
+        with engine.begin() as connection:
+            migrated = migrate_message_blobs(connection)
+        
+        if migrated:
+            print("✅ Migrated legacy conversation messages")
+        else:
+            print("✅ No legacy conversation messages left to migrate")
+        
+    except Exception as e:
+        print(f"❌ Error migrating conversations: {e}")
+        raise
+
+if __name__ == "__main__":
+    print("🚀 Writingway AI Message Migration")
+    print("=" * 40)
+    
+    try:
+        migrate_conversations()
+    except Exception as e:
+        print(f"💥 Migration failed: {e}")
+        sys.exit(1)
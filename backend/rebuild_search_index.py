@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Search index rebuild script for Writingway
+Re-indexes every document and compendium entry, e.g. after a restore or bulk import
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import engine
+from services.search_index import rebuild_search_index
+
+def rebuild():
+    """Drop all indexed rows and index everything again in one transaction"""
+    print("🔎 Rebuilding search index...")
+    with engine.begin() as connection:
+        count = rebuild_search_index(connection)
+    print(f"✅ Indexed {count} documents and compendium entries")
+
+if __name__ == "__main__":
+    print("🚀 Writingway Search Index Rebuild")
+    print("=" * 40)
+    
+    try:
+        rebuild()
+    except Exception as e:
+        print(f"💥 Rebuild failed: {e}")
+        sys.exit(1)
@@ -1,15 +1,31 @@
 """
 AI Assistant routes for writing assistance
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, func, insert, null, select, update
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Optional
 from pydantic import BaseModel
 
-from database.database import get_db
-from database.models import User, Project, Document, AIConversation
+from database.database import get_db, SessionLocal
+from database.models import Project, Document, AIConversation, AIMessage
+from core.admission import AdmissionController, get_admission_controller
+from core.config import settings
+from core.principals import Principal
 from core.security import get_current_active_user
-from services.ai_service import AIService
+from core.concurrency import run_blocking, run_ai_call, stream_ai_call
+from services.ai_service import AIService, get_ai_service
+from services.compendium_context import compendium_context
+from services.context_window import (
+    ConversationContext,
+    ContextWindow,
+    build_context_window,
+    count_tokens,
+    summarize_messages
+)
 
 router = APIRouter()
 
@@ -36,106 +52,486 @@ class WritingAssistanceResponse(BaseModel):
     result: str
     suggestions: Optional[List[str]] = None
 
+class BatchWritingAssistanceRequest(BaseModel):
+    assistance_type: str  # "improve", "continue", "summarize", "analyze"
+    document_ids: Optional[List[int]] = None
+    texts: Optional[List[str]] = None
+
+def _load_conversation(db: Session, user_id: int, request: ChatRequest) -> ConversationContext:
+    """Get or create the conversation a chat message belongs to
+    
+    Only messages not yet folded into the running summary are loaded.
+    """
+    conversation = None
+    if request.project_id:
+        conversation = db.query(AIConversation).filter(
+            AIConversation.user_id == user_id,
+            AIConversation.project_id == request.project_id
+        ).first()
+    
+    if not conversation:
+        conversation = AIConversation(
+            user_id=user_id,
+            project_id=request.project_id,
+            document_id=request.document_id,
+            summary_seq=0,
+            summary_token_count=0
+        )
+        db.add(conversation)
+        db.flush()
+    
+    rows = db.query(AIMessage.seq, AIMessage.role, AIMessage.content, AIMessage.token_count).filter(
+        AIMessage.conversation_id == conversation.id,
+        AIMessage.seq > conversation.summary_seq
+    ).order_by(AIMessage.seq).all()
+    history = [
+        {
+            "seq": row.seq,
+            "role": row.role,
+            "content": row.content,
+            # Rows migrated from the JSON blob have no cached count yet
+            "token_count": row.token_count if row.token_count is not None else count_tokens(row.content)
+        }
+        for row in rows
+    ]
+    
+    context = ConversationContext(
+        conversation_id=conversation.id,
+        summary=conversation.summary,
+        summary_seq=conversation.summary_seq,
+        summary_tokens=conversation.summary_token_count,
+        history=history
+    )
+    # Release the connection so it is not held while the AI call runs
+    db.commit()
+    return context
+
+def _chat_context(db: Session, user_id: int, request: ChatRequest) -> Optional[str]:
+    """The client's context plus the compendium entries the active document mentions"""
+    parts = [request.context] if request.context else []
+    if request.document_id:
+        compendium = compendium_context(db, user_id, request.document_id, settings.chat_compendium_token_budget)
+        if compendium:
+            parts.append(compendium)
+    # Release the connection so it is not held while the AI call runs
+    db.commit()
+    return "\n\n".join(parts) or None
+
+def _append_turn(db: Session, context: ConversationContext, user_content: str, reply: str) -> None:
+    """Store a user message and its reply with one two-row INSERT
+    
+    Positions are taken from MAX(seq) inside this transaction, not from the
+    history read before the AI call. Updating the conversation row first
+    takes its write lock (a row lock on MySQL, the database lock on SQLite),
+    so concurrent turns of one conversation queue here instead of colliding
+    on the unique (conversation_id, seq) index.
+    """
+    db.execute(
+        update(AIConversation)
+        .where(AIConversation.id == context.conversation_id)
+        .values(updated_at=func.now())
+    )
+    last_seq = db.scalar(
+        select(func.max(AIMessage.seq)).where(AIMessage.conversation_id == context.conversation_id)
+    ) or 0
+    db.execute(insert(AIMessage), [
+        {
+            "conversation_id": context.conversation_id,
+            "seq": last_seq + 1,
+            "role": "user",
+            "content": user_content,
+            "token_count": count_tokens(user_content)
+        },
+        {
+            "conversation_id": context.conversation_id,
+            "seq": last_seq + 2,
+            "role": "assistant",
+            "content": reply,
+            "token_count": count_tokens(reply)
+        }
+    ])
+    db.commit()
+
+def _load_batch_texts(db: Session, user_id: int, document_ids: List[int]) -> dict:
+    """Contents of the requested documents the user owns, keyed by document id"""
+    rows = db.query(Document.id, Document.content).join(
+        Project, Document.project_id == Project.id
+    ).filter(
+        Document.id.in_(document_ids),
+        Document.is_active == True,
+        Project.owner_id == user_id
+    ).all()
+    return {row.id: row.content or "" for row in rows}
+
+def _store_summary(context: ConversationContext, summary_seq: int, summary: str) -> None:
+    """Save a new running summary unless another request already advanced it"""
+    db = SessionLocal()
+    try:
+        db.query(AIConversation).filter(
+            AIConversation.id == context.conversation_id,
+            AIConversation.summary_seq == context.summary_seq
+        ).update({
+            AIConversation.summary: summary,
+            AIConversation.summary_seq: summary_seq,
+            AIConversation.summary_token_count: count_tokens(summary)
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+async def _fold_into_summary(ai_service: AIService, context: ConversationContext, window: ContextWindow) -> None:
+    """Background task: fold turns that no longer fit the window into the summary"""
+    summary = await run_ai_call(
+        summarize_messages,
+        ai_service.chat_without_fallback,
+        context.summary,
+        window.overflow,
+        max_tokens=settings.chat_summary_token_budget,
+        max_input_tokens=settings.chat_context_token_budget
+    )
+    await run_blocking(_store_summary, context, window.overflow[-1]["seq"], summary)
+
+def _schedule_summary(
+    background_tasks: BackgroundTasks,
+    ai_service: AIService,
+    context: ConversationContext,
+    window: ContextWindow
+) -> None:
+    """Summarize in batches so most turns cost no extra provider call"""
+    if window.overflow and window.overflow_tokens >= settings.chat_summary_batch_tokens:
+        background_tasks.add_task(_fold_into_summary, ai_service, context, window)
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """Streaming response that runs on_close once it is sent or abandoned
+    
+    A generator's own finally never runs if the client disconnects before
+    Starlette starts iterating it, so a slot released there would leak.
+    """
+
+    def __init__(self, content: AsyncIterator[str], on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Stop the body first so its upstream work ends before the slot is reused
+            await self.body_iterator.aclose()
+            if self.on_close is not None:
+                self.on_close()
+
+def _sse_response(
+    http_request: Request,
+    stream: Iterator[str],
+    on_complete: Callable[[str], Awaitable[dict]],
+    start: Optional[dict] = None,
+    on_close: Optional[Callable[[], None]] = None
+) -> StreamingResponse:
+    """Relay a provider stream as SSE: start, token*, then done or error
+    
+    If the client goes away the provider stream is closed, which cancels the
+    upstream call, and on_complete is not run. on_close always runs last,
+    even if the client left before the stream started.
+    """
+    async def events():
+        parts = []
+        chunks = stream_ai_call(stream)
+        try:
+            yield _sse_event("start", start or {})
+            async for chunk in chunks:
+                if await http_request.is_disconnected():
+                    return
+                parts.append(chunk)
+                yield _sse_event("token", {"content": chunk})
+            
+            extra = await on_complete("".join(parts))
+            yield _sse_event("done", {"content": "".join(parts), **extra})
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"AI service error: {str(e)}"})
+        finally:
+            await chunks.aclose()
+    
+    return _ClosingStreamingResponse(
+        events(),
+        on_close=on_close,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_ai(
     request: ChatRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
     """Chat with AI assistant"""
     try:
-        ai_service = AIService()
-        
         # Get or create conversation
-        conversation = None
-        if request.project_id:
-            conversation = db.query(AIConversation).filter(
-                AIConversation.user_id == current_user.id,
-                AIConversation.project_id == request.project_id
-            ).first()
+        context = await run_blocking(_load_conversation, db, current_user.id, request)
         
-        if not conversation:
-            conversation = AIConversation(
-                user_id=current_user.id,
-                project_id=request.project_id,
-                document_id=request.document_id,
-                messages=[]
-            )
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
+        # Recent turns within the token budget, the summary and the new message
+        window = build_context_window(context, request.message, settings.chat_context_token_budget)
+        system_context = await run_blocking(_chat_context, db, current_user.id, request)
         
-        # Add user message to conversation
-        messages = conversation.messages or []
-        messages.append({"role": "user", "content": request.message})
+        # Get AI response without holding the event loop
+        async with admission.admit(current_user.id):
+            response = await run_ai_call(
+                ai_service.chat,
+                messages=window.messages,
+                context=system_context
+            )
         
-        # Get AI response
-        response = ai_service.chat(
-            messages=messages,
-            context=request.context
-        )
+        # Append the turn to the conversation
+        await run_blocking(_append_turn, db, context, request.message, response)
+        _schedule_summary(background_tasks, ai_service, context, window)
         
-        # Add AI response to conversation
-        messages.append({"role": "assistant", "content": response})
-        conversation.messages = messages
+        return ChatResponse(response=response, conversation_id=context.conversation_id)
         
-        db.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"AI service error: {str(e)}"
+        )
+
+@router.post("/chat/stream")
+async def stream_chat_with_ai(
+    request: ChatRequest,
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service),
+    admission: AdmissionController = Depends(get_admission_controller)
+):
+    """Chat with AI assistant, streaming the reply as server-sent events"""
+    admitted_at = await admission.acquire(current_user.id)
+    try:
+        context = await run_blocking(_load_conversation, db, current_user.id, request)
+        window = build_context_window(context, request.message, settings.chat_context_token_budget)
+        system_context = await run_blocking(_chat_context, db, current_user.id, request)
         
-        return ChatResponse(response=response, conversation_id=conversation.id)
+        stream = ai_service.chat_stream(messages=window.messages, context=system_context)
         
     except Exception as e:
+        admission.release(current_user.id, admitted_at)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"AI service error: {str(e)}"
         )
+    
+    async def on_complete(response: str) -> dict:
+        # Persist the assembled reply once the stream has finished
+        await run_blocking(_append_turn, db, context, request.message, response)
+        return {"conversation_id": context.conversation_id}
+    
+    # Runs after the stream has finished
+    _schedule_summary(background_tasks, ai_service, context, window)
+    
+    return _sse_response(
+        http_request, stream, on_complete,
+        start={"conversation_id": context.conversation_id},
+        on_close=lambda: admission.release(current_user.id, admitted_at)
+    )
 
 @router.post("/writing-assistance", response_model=WritingAssistanceResponse)
 async def get_writing_assistance(
     request: WritingAssistanceRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
     """Get writing assistance from AI"""
     try:
-        ai_service = AIService()
-        
-        result = ai_service.writing_assistance(
-            text=request.text,
-            assistance_type=request.assistance_type
-        )
+        async with admission.admit(current_user.id):
+            result = await run_ai_call(
+                ai_service.writing_assistance,
+                text=request.text,
+                assistance_type=request.assistance_type
+            )
         
         return WritingAssistanceResponse(
             result=result.get("result", ""),
             suggestions=result.get("suggestions", [])
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"AI service error: {str(e)}"
         )
 
+@router.post("/writing-assistance/stream")
+async def stream_writing_assistance(
+    request: WritingAssistanceRequest,
+    http_request: Request,
+    current_user: Principal = Depends(get_current_active_user),
+    ai_service: AIService = Depends(get_ai_service),
+    admission: AdmissionController = Depends(get_admission_controller)
+):
+    """Get writing assistance from AI, streaming the result as server-sent events"""
+    admitted_at = await admission.acquire(current_user.id)
+    try:
+        stream = ai_service.writing_assistance_stream(
+            text=request.text,
+            assistance_type=request.assistance_type
+        )
+        
+    except Exception as e:
+        admission.release(current_user.id, admitted_at)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"AI service error: {str(e)}"
+        )
+    
+    async def on_complete(result: str) -> dict:
+        return {
+            "suggestions": ai_service.assistance_suggestions(request.text, request.assistance_type)
+        }
+    
+    return _sse_response(
+        http_request, stream, on_complete,
+        on_close=lambda: admission.release(current_user.id, admitted_at)
+    )
+
+@router.post("/writing-assistance/batch")
+async def batch_writing_assistance(
+    request: BatchWritingAssistanceRequest,
+    http_request: Request,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service),
+    admission: AdmissionController = Depends(get_admission_controller)
+):
+    """Get writing assistance for many documents or texts at once
+    
+    Items run in parallel (up to ai_batch_concurrency) and each result is
+    streamed as one NDJSON line as soon as it is ready, so lines arrive out
+    of order; "index" is the item's position in the request.
+    """
+    items = []
+    if request.document_ids:
+        texts = await run_blocking(_load_batch_texts, db, current_user.id, request.document_ids)
+        items.extend({"document_id": document_id, "text": texts.get(document_id)}
+                     for document_id in request.document_ids)
+    if request.texts:
+        items.extend({"text": text} for text in request.texts)
+    
+    if not items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide document_ids or texts"
+        )
+    if len(items) > settings.ai_batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.ai_batch_max_items} items per batch"
+        )
+    
+    # The batch holds a global slot for every item it may have in flight,
+    # but counts once against the user's cap
+    weight = min(settings.ai_batch_concurrency, len(items), admission.max_concurrent)
+    admitted_at = await admission.acquire(current_user.id, weight)
+    limit = asyncio.Semaphore(weight)
+    
+    async def run_item(index: int, item: dict) -> dict:
+        line = {"index": index, **{k: v for k, v in item.items() if k != "text"}}
+        if item["text"] is None:
+            return {**line, "error": "Document not found"}
+        try:
+            async with limit:
+                # Unchanged inputs are answered from the assistance cache
+                result = await run_ai_call(
+                    ai_service.writing_assistance,
+                    text=item["text"],
+                    assistance_type=request.assistance_type
+                )
+            return {**line, "result": result.get("result", ""), "suggestions": result.get("suggestions", [])}
+        except Exception as e:
+            return {**line, "error": f"AI service error: {str(e)}"}
+    
+    async def lines():
+        tasks = [asyncio.create_task(run_item(index, item)) for index, item in enumerate(items)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                line = await finished
+                if await http_request.is_disconnected():
+                    return
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return _ClosingStreamingResponse(
+        lines(),
+        on_close=lambda: admission.release(current_user.id, admitted_at, weight),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/cache/stats")
+async def get_cache_stats(
+    current_user: Principal = Depends(get_current_active_user),
+    ai_service: AIService = Depends(get_ai_service)
+):
+    """Hit/miss counters of the writing assistance cache"""
+    if ai_service.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **ai_service.cache.stats()}
+
+@router.get("/providers/status")
+async def get_provider_status(
+    current_user: Principal = Depends(get_current_active_user),
+    ai_service: AIService = Depends(get_ai_service)
+):
+    """Rolling latency, error rate and circuit state of each AI provider"""
+    return {"providers": ai_service.router.stats()}
+
+@router.get("/admission/stats")
+async def get_admission_stats(
+    current_user: Principal = Depends(get_current_active_user),
+    admission: AdmissionController = Depends(get_admission_controller)
+):
+    """Queue depth, wait times and rejections of the AI admission controller"""
+    return admission.metrics()
+
 @router.get("/conversations/{project_id}")
-async def get_conversation_history(
+def get_conversation_history(
     project_id: int,
-    current_user: User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get conversation history for a project"""
-    conversation = db.query(AIConversation).filter(
+    conversation_id = db.query(AIConversation.id).filter(
         AIConversation.user_id == current_user.id,
         AIConversation.project_id == project_id
-    ).first()
+    ).scalar()
     
-    if not conversation:
+    if not conversation_id:
         return {"messages": []}
     
-    return {"messages": conversation.messages or []}
+    rows = db.query(AIMessage.role, AIMessage.content).filter(
+        AIMessage.conversation_id == conversation_id
+    ).order_by(AIMessage.seq).all()
+    
+    return {"messages": [{"role": row.role, "content": row.content} for row in rows]}
 
 @router.delete("/conversations/{conversation_id}")
-async def clear_conversation(
+def clear_conversation(
     conversation_id: int,
-    current_user: User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Clear conversation history"""
@@ -150,7 +546,11 @@ async def clear_conversation(
             detail="Conversation not found"
         )
     
-    conversation.messages = []
+    db.execute(delete(AIMessage).where(AIMessage.conversation_id == conversation_id))
+    conversation.messages = null()
+    conversation.summary = None
+    conversation.summary_seq = 0
+    conversation.summary_token_count = 0
     db.commit()
     
     return {"message": "Conversation cleared successfully"}
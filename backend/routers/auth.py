@@ -3,29 +3,39 @@ Authentication routes
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
+from typing import Optional
 
-from database.database import get_db
+from database.database import get_async_db
 from database.models import User, UserSettings
-from schemas.user import UserCreate, UserResponse, Token, LoginRequest
+from schemas.user import UserCreate, UserResponse, Token, LoginRequest, RefreshRequest
+from core.passwords import get_password_hash, verify_and_rehash
 from core.security import (
-    verify_password, 
-    get_password_hash, 
     create_access_token,
-    get_current_active_user
+    get_current_active_user,
+    issue_refresh_token,
+    prune_refresh_tokens,
+    revoke_refresh_token,
+    rotate_refresh_token
 )
+from core.concurrency import run_password_hashing
+from core.principals import Principal
 from core.config import settings
 
 router = APIRouter()
 
 @router.post("/register", response_model=UserResponse)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     # Check if user already exists
-    db_user = db.query(User).filter(
-        (User.username == user.username) | (User.email == user.email)
-    ).first()
+    result = await db.execute(
+        select(User).where(
+            (User.username == user.username) | (User.email == user.email)
+        )
+    )
+    db_user = result.scalars().first()
     
     if db_user:
         raise HTTPException(
@@ -33,8 +43,11 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
             detail="Username or email already registered"
         )
     
-    # Create new user
-    hashed_password = get_password_hash(user.password)
+    # Release the connection so it is not held while waiting for a hashing worker
+    await db.commit()
+    
+    # Create new user; bcrypt is CPU bound so it runs in the hashing process pool
+    hashed_password = await run_password_hashing(get_password_hash, user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -43,22 +56,33 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
     
     # Create default user settings
     user_settings = UserSettings(user_id=db_user.id)
     db.add(user_settings)
-    db.commit()
+    await db.commit()
+    await db.refresh(db_user)
     
     return db_user
 
 @router.post("/login", response_model=Token)
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """Login user and return access token"""
-    user = db.query(User).filter(User.username == login_data.username).first()
+    result = await db.execute(
+        select(User).where(User.username == login_data.username)
+    )
+    user = result.scalars().first()
+    
+    # Release the connection so it is not held while waiting for a hashing worker
+    await db.commit()
     
-    if not user or not verify_password(login_data.password, user.hashed_password):
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await run_password_hashing(
+            verify_and_rehash, login_data.password, user.hashed_password
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -71,19 +95,41 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
             detail="Inactive user"
         )
     
+    if new_hash:
+        # The configured bcrypt cost changed since this hash was made
+        user.hashed_password = new_hash
+    
+    await prune_refresh_tokens(db, user.id)
+    refresh_token = await issue_refresh_token(db, user.id)
+    await db.commit()
+    
+    return _token_response(user, refresh_token)
+
+@router.post("/refresh", response_model=Token)
+async def refresh(request: RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """Exchange a refresh token for a new access token and refresh token
+    
+    No password check, so keeping a session alive costs no bcrypt work.
+    """
+    user, refresh_token = await rotate_refresh_token(db, request.refresh_token)
+    return _token_response(user, refresh_token)
+
+def _token_response(user: User, refresh_token: str) -> dict:
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
+async def read_users_me(current_user: Principal = Depends(get_current_active_user)):
     """Get current user information"""
     return current_user
 
 @router.post("/logout")
-async def logout():
-    """Logout user (client should remove token)"""
+async def logout(request: Optional[RefreshRequest] = None, db: AsyncSession = Depends(get_async_db)):
+    """Logout user (client should remove token); a given refresh token is revoked"""
+    if request is not None:
+        await revoke_refresh_token(db, request.refresh_token)
     return {"message": "Successfully logged out"}
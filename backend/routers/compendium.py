@@ -0,0 +1,218 @@
+"""
+Compendium routes
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import and_, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from typing import List, Optional
+
+from database.database import get_async_db
+from database.models import Project, CompendiumEntry, CompendiumTag
+from schemas.project import (
+    CompendiumEntryCreate,
+    CompendiumEntryUpdate,
+    CompendiumEntryResponse,
+    CompendiumEntryPage,
+    CompendiumTagCount
+)
+from core.principals import Principal
+from core.security import get_current_active_user
+from routers.projects import get_owned_project
+from services.compendium_tags import normalize_tags, tag_key, tag_rows
+from services.search_index import in_session, index_compendium_entry, remove_compendium_entry
+
+router = APIRouter()
+
+MAX_FILTER_TAGS = 10
+
+async def get_owned_entry(entry_id: int, user_id: int, db: AsyncSession) -> CompendiumEntry:
+    """Load a compendium entry in an active project owned by the user or raise 404"""
+    result = await db.execute(
+        select(CompendiumEntry).join(Project).where(
+            CompendiumEntry.id == entry_id,
+            Project.owner_id == user_id,
+            Project.is_active == True
+        )
+    )
+    entry = result.scalars().first()
+    
+    if not entry:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Compendium entry not found"
+        )
+    
+    return entry
+
+def _normalized_tags(tags: Optional[List[str]]) -> List[str]:
+    try:
+        return normalize_tags(tags)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+def _normalized_aliases(aliases: Optional[List[str]]) -> List[str]:
+    return list(dict.fromkeys(" ".join(alias.split()) for alias in aliases or [] if alias.strip()))
+
+async def _replace_tags(db: AsyncSession, entry: CompendiumEntry) -> None:
+    """Make the entry's compendium_tags rows match its tags; the caller commits"""
+    await db.execute(delete(CompendiumTag).where(CompendiumTag.entry_id == entry.id))
+    rows = tag_rows(entry.id, entry.project_id, entry.tags)
+    if rows:
+        await db.execute(insert(CompendiumTag), rows)
+
+@router.get("/project/{project_id}", response_model=CompendiumEntryPage)
+async def get_project_compendium(
+    project_id: int,
+    entry_type: Optional[str] = None,
+    tag: List[str] = Query([]),
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=500),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a page of a project's compendium entries, optionally of one type and with all of the given tags
+    
+    Each tag is an index lookup joined on the entry id, so the intersection
+    runs in the database and pages stop as soon as they are full.
+    """
+    await get_owned_project(project_id, current_user.id, db)
+    
+    keys = list(dict.fromkeys(tag_key(value) for value in tag if value.strip()))
+    if len(keys) > MAX_FILTER_TAGS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Filter by at most {MAX_FILTER_TAGS} tags"
+        )
+    
+    query = select(CompendiumEntry).where(CompendiumEntry.project_id == project_id)
+    for key in keys:
+        tagged = aliased(CompendiumTag)
+        query = query.join(tagged, and_(
+            tagged.entry_id == CompendiumEntry.id,
+            tagged.project_id == project_id,
+            tagged.tag == key
+        ))
+    if entry_type:
+        query = query.where(CompendiumEntry.entry_type == entry_type)
+    if cursor is not None:
+        query = query.where(CompendiumEntry.id > cursor)
+    
+    # One extra row tells whether there is a next page
+    result = await db.execute(query.order_by(CompendiumEntry.id).limit(limit + 1))
+    entries = result.scalars().all()
+    
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = str(entries[-1].id)
+    
+    return CompendiumEntryPage(
+        items=[CompendiumEntryResponse.model_validate(entry) for entry in entries],
+        next_cursor=next_cursor
+    )
+
+@router.get("/project/{project_id}/tags", response_model=List[CompendiumTagCount])
+async def get_project_compendium_tags(
+    project_id: int,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the tags used in a project's compendium with how many entries have each"""
+    await get_owned_project(project_id, current_user.id, db)
+    
+    result = await db.execute(
+        select(CompendiumTag.tag, func.count().label("count"))
+        .where(CompendiumTag.project_id == project_id)
+        .group_by(CompendiumTag.tag)
+        .order_by(CompendiumTag.tag)
+    )
+    return [CompendiumTagCount(tag=row.tag, count=row.count) for row in result.all()]
+
+@router.post("/", response_model=CompendiumEntryResponse)
+async def create_compendium_entry(
+    entry: CompendiumEntryCreate,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create a new compendium entry"""
+    await get_owned_project(entry.project_id, current_user.id, db)
+    
+    db_entry = CompendiumEntry(
+        title=entry.title,
+        content=entry.content,
+        entry_type=entry.entry_type,
+        tags=_normalized_tags(entry.tags),
+        aliases=_normalized_aliases(entry.aliases),
+        project_id=entry.project_id
+    )
+    
+    db.add(db_entry)
+    await db.flush()
+    await _replace_tags(db, db_entry)
+    await in_session(
+        db, index_compendium_entry,
+        db_entry.id, db_entry.project_id, db_entry.title, db_entry.content, db_entry.tags
+    )
+    await db.commit()
+    await db.refresh(db_entry)
+    
+    return db_entry
+
+@router.get("/{entry_id}", response_model=CompendiumEntryResponse)
+async def get_compendium_entry(
+    entry_id: int,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a specific compendium entry"""
+    return await get_owned_entry(entry_id, current_user.id, db)
+
+@router.put("/{entry_id}", response_model=CompendiumEntryResponse)
+async def update_compendium_entry(
+    entry_id: int,
+    entry_update: CompendiumEntryUpdate,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Update a compendium entry"""
+    entry = await get_owned_entry(entry_id, current_user.id, db)
+    
+    # Update fields
+    update_data = entry_update.dict(exclude_unset=True)
+    if "tags" in update_data:
+        update_data["tags"] = _normalized_tags(update_data["tags"])
+    if "aliases" in update_data:
+        update_data["aliases"] = _normalized_aliases(update_data["aliases"])
+    for field, value in update_data.items():
+        setattr(entry, field, value)
+    
+    if "tags" in update_data:
+        await _replace_tags(db, entry)
+    await in_session(
+        db, index_compendium_entry,
+        entry.id, entry.project_id, entry.title, entry.content, entry.tags
+    )
+    await db.commit()
+    await db.refresh(entry)
+    
+    return entry
+
+@router.delete("/{entry_id}")
+async def delete_compendium_entry(
+    entry_id: int,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Delete a compendium entry"""
+    entry = await get_owned_entry(entry_id, current_user.id, db)
+    
+    await db.execute(delete(CompendiumTag).where(CompendiumTag.entry_id == entry.id))
+    await in_session(db, remove_compendium_entry, entry.id)
+    await db.delete(entry)
+    await db.commit()
+    
+    return {"message": "Compendium entry deleted successfully"}
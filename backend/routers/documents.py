@@ -1,24 +1,56 @@
 """
 Document management routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import Dict, List, Optional, Tuple
 
-from database.database import get_db
-from database.models import User, Project, Document
-from schemas.project import DocumentCreate, DocumentUpdate, DocumentResponse
+from core.config import settings
+from database.database import get_async_db
+from database.models import Project, Document
+from schemas.project import (
+    DocumentCreate,
+    DocumentUpdate,
+    DocumentResponse,
+    DocumentBulkRequest,
+    DocumentBulkResponse,
+    DocumentBulkResult,
+    DocumentOutlineItem,
+    DocumentOutlinePage,
+    DocumentPatch,
+    DocumentPatchResponse,
+    DocumentRevisionInfo,
+    DocumentRevisionContent
+)
+from core.principals import Principal
 from core.security import get_current_active_user
+from services.project_stats import record_counts
+from services.revisions import list_revisions, reconstruct_revision, record_revision
+from services.search_index import in_session, index_document, remove_document
+from services.text_patch import apply_edits
+from services.text_stats import count_chars, count_words, updated_counts
 
 router = APIRouter()
 
-def verify_project_access(project_id: int, user_id: int, db: Session) -> Project:
+BULK_OPERATIONS = ("create", "update", "reorder", "delete")
+# Fields each bulk operation may change besides content
+BULK_FIELDS = {
+    "update": ("title", "document_type", "order_index", "parent_id"),
+    "reorder": ("order_index", "parent_id")
+}
+
+async def verify_project_access(project_id: int, user_id: int, db: AsyncSession) -> Project:
     """Verify user has access to the project"""
-    project = db.query(Project).filter(
-        Project.id == project_id,
-        Project.owner_id == user_id,
-        Project.is_active == True
-    ).first()
+    result = await db.execute(
+        select(Project).where(
+            Project.id == project_id,
+            Project.owner_id == user_id,
+            Project.is_active == True
+        )
+    )
+    project = result.scalars().first()
     
     if not project:
         raise HTTPException(
@@ -28,30 +60,329 @@ def verify_project_access(project_id: int, user_id: int, db: Session) -> Project
     
     return project
 
+async def get_active_document(document_id: int, user_id: int, db: AsyncSession) -> Document:
+    """Load an active document the user has access to or raise 404"""
+    result = await db.execute(
+        select(Document).where(
+            Document.id == document_id,
+            Document.is_active == True
+        )
+    )
+    document = result.scalars().first()
+    
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    # Verify user has access to the project
+    await verify_project_access(document.project_id, user_id, db)
+    
+    return document
+
 @router.get("/project/{project_id}", response_model=List[DocumentResponse])
 async def get_project_documents(
     project_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all documents for a project"""
-    verify_project_access(project_id, current_user.id, db)
+    await verify_project_access(project_id, current_user.id, db)
     
-    documents = db.query(Document).filter(
+    result = await db.execute(
+        select(Document).where(
+            Document.project_id == project_id,
+            Document.is_active == True
+        ).order_by(Document.order_index)
+    )
+    
+    return result.scalars().all()
+
+def document_etag(document_id: int, version: int) -> str:
+    """ETag of a document's content at a version"""
+    return f'"{document_id}-{version}"'
+
+async def save_content(db: AsyncSession, document: Document, content: str, base_version: int) -> int:
+    """Write new content if the document is still at base_version and keep the old one as a revision
+    
+    Counts are updated from the old ones by counting only the changed text,
+    and the difference goes to the project's totals. Returns the new
+    version; raises 409 with the current version if another save got there
+    first. The caller commits.
+    """
+    document_id = document.id  # The rollback below expires the instance
+    word_count, char_count = updated_counts(document.content, content, document.word_count, document.char_count)
+    # Only succeeds if nobody saved in between the read and this write
+    result = await db.execute(
+        update(Document)
+        .where(Document.id == document_id, Document.version == base_version)
+        .values(content=content, word_count=word_count, char_count=char_count, version=Document.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        await db.rollback()
+        current = await db.scalar(select(Document.version).where(Document.id == document_id))
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Document has changed since this version", "version": current},
+            headers={"ETag": document_etag(document_id, current)}
+        )
+    
+    await record_revision(
+        db, document.id, base_version, document.content, content, document.word_count, document.char_count
+    )
+    await in_session(db, index_document, document.id, document.project_id, document.title, content)
+    await record_counts(db, document.project_id, word_count - document.word_count, char_count - document.char_count)
+    set_committed_value(document, "word_count", word_count)
+    set_committed_value(document, "char_count", char_count)
+    return base_version + 1
+
+def _parse_outline_cursor(cursor: str) -> Tuple[int, int]:
+    """Decode an outline cursor, "<order_index>:<id>" of the last item seen"""
+    try:
+        order_index, document_id = cursor.split(":")
+        return int(order_index), int(document_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+@router.get("/project/{project_id}/outline", response_model=DocumentOutlinePage)
+async def get_project_outline(
+    project_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(200, ge=1, le=1000),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a page of a project's document outline, without document content
+    
+    Pages are keyed on (order_index, id), so each page is an index range scan
+    however deep into the project it starts.
+    """
+    await verify_project_access(project_id, current_user.id, db)
+    
+    query = select(
+        Document.id,
+        Document.title,
+        Document.document_type,
+        Document.order_index,
+        Document.parent_id,
+        Document.updated_at,
+        Document.word_count,
+        Document.char_count
+    ).where(
         Document.project_id == project_id,
         Document.is_active == True
-    ).order_by(Document.order_index).all()
+    )
+    if cursor:
+        after_order, after_id = _parse_outline_cursor(cursor)
+        query = query.where(or_(
+            Document.order_index > after_order,
+            and_(Document.order_index == after_order, Document.id > after_id)
+        ))
+    
+    # One extra row tells whether there is a next page
+    result = await db.execute(query.order_by(Document.order_index, Document.id).limit(limit + 1))
+    rows = result.all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1].order_index}:{rows[-1].id}"
+    
+    return DocumentOutlinePage(
+        items=[DocumentOutlineItem.model_validate(row) for row in rows],
+        next_cursor=next_cursor
+    )
+
+def _bulk_error(index: int, message: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Operation {index}: {message}"
+    )
+
+@router.post("/project/{project_id}/bulk", response_model=DocumentBulkResponse)
+async def bulk_document_operations(
+    project_id: int,
+    bulk: DocumentBulkRequest,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create, update, reorder and soft-delete documents of one project in a single transaction
+    
+    Creates run first (as one multi-row INSERT), then field changes (one
+    UPDATE per set of changed columns), then content updates, then deletes.
+    Any failure rolls back the whole batch. Content updates go through the
+    same version check and revision history as PATCH.
+    """
+    await verify_project_access(project_id, current_user.id, db)
+    
+    operations = bulk.operations
+    if not operations or len(operations) > settings.document_bulk_max_operations:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A bulk request takes 1 to {settings.document_bulk_max_operations} operations"
+        )
+    
+    # Validate everything before writing anything
+    refs = set()
+    for index, operation in enumerate(operations):
+        if operation.op not in BULK_OPERATIONS:
+            raise _bulk_error(index, f"op must be one of {', '.join(BULK_OPERATIONS)}")
+        if operation.op == "create":
+            if not operation.title:
+                raise _bulk_error(index, "create needs a title")
+            if operation.ref is not None:
+                if operation.ref in refs:
+                    raise _bulk_error(index, f"ref {operation.ref!r} is used twice")
+                refs.add(operation.ref)
+        elif operation.id is None:
+            raise _bulk_error(index, f"{operation.op} needs an id")
+    
+    referenced = set()
+    for index, operation in enumerate(operations):
+        if operation.parent_ref is not None and operation.parent_ref not in refs:
+            raise _bulk_error(index, f"parent_ref {operation.parent_ref!r} is not created in this batch")
+        if operation.id is not None and operation.id == operation.parent_id:
+            raise _bulk_error(index, "a document cannot be its own parent")
+        referenced.update(value for value in (operation.id, operation.parent_id) if value is not None)
+    
+    if referenced:
+        result = await db.execute(
+            select(Document.id).where(
+                Document.project_id == project_id,
+                Document.is_active == True,
+                Document.id.in_(referenced)
+            )
+        )
+        missing = referenced - set(result.scalars().all())
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Documents not found: {', '.join(str(value) for value in sorted(missing))}"
+            )
+    
+    create_operations = [operation for operation in operations if operation.op == "create"]
+    created = [
+        Document(
+            title=operation.title,
+            content=operation.content,
+            document_type=operation.document_type or "scene",
+            order_index=operation.order_index or 0,
+            project_id=project_id,
+            parent_id=operation.parent_id,
+            word_count=count_words(operation.content),
+            char_count=count_chars(operation.content)
+        )
+        for operation in create_operations
+    ]
+    db.add_all(created)
+    await db.flush()
+    if created:
+        await record_counts(
+            db,
+            project_id,
+            sum(document.word_count for document in created),
+            sum(document.char_count for document in created),
+            len(created)
+        )
+    ref_ids = {
+        operation.ref: document.id
+        for operation, document in zip(create_operations, created)
+        if operation.ref is not None
+    }
+    
+    # Column changes merged per document, applied as an UPDATE by primary key
+    changes: Dict[int, dict] = {}
+    for operation, document in zip(create_operations, created):
+        if operation.parent_ref is not None:
+            changes[document.id] = {"id": document.id, "parent_id": ref_ids[operation.parent_ref]}
+    contents: Dict[int, Tuple[str, Optional[int]]] = {}
+    deleted = []
+    for operation in operations:
+        if operation.op == "create":
+            continue
+        if operation.op == "delete":
+            deleted.append(operation.id)
+            continue
+        fields = operation.dict(exclude_unset=True)
+        values = {name: fields[name] for name in BULK_FIELDS[operation.op] if name in fields}
+        if values.get("title", "") is None:
+            del values["title"]
+        if operation.parent_ref is not None:
+            values["parent_id"] = ref_ids[operation.parent_ref]
+        if values:
+            changes.setdefault(operation.id, {"id": operation.id}).update(values)
+        if operation.op == "update" and operation.content is not None:
+            contents[operation.id] = (operation.content, operation.version)
+    
+    if changes:
+        await db.execute(update(Document), list(changes.values()))
+    
+    if contents:
+        result = await db.execute(select(Document).where(Document.id.in_(contents)))
+        for document in result.scalars().all():
+            content, base_version = contents[document.id]
+            if content != document.content or base_version not in (None, document.version):
+                await save_content(db, document, content, document.version if base_version is None else base_version)
+    
+    # Keep the search index in step with new titles that came without new content
+    retitled = [document_id for document_id, values in changes.items() if "title" in values and document_id not in contents]
+    if retitled:
+        result = await db.execute(
+            select(Document.id, Document.title, Document.content).where(Document.id.in_(retitled))
+        )
+        for row in result.all():
+            await in_session(db, index_document, row.id, project_id, row.title, row.content)
+    for document in created:
+        await in_session(db, index_document, document.id, project_id, document.title, document.content)
+    
+    if deleted:
+        result = await db.execute(
+            select(func.sum(Document.word_count), func.sum(Document.char_count), func.count())
+            .where(Document.id.in_(deleted))
+        )
+        words, chars, count = result.one()
+        await record_counts(db, project_id, -(words or 0), -(chars or 0), -count, writing=False)
+        await db.execute(
+            update(Document)
+            .where(Document.id.in_(deleted))
+            .values(is_active=False)
+            .execution_options(synchronize_session=False)
+        )
+        for document_id in deleted:
+            await in_session(db, remove_document, document_id)
+    
+    await db.commit()
+    
+    ids = [operation.id for operation in operations if operation.op != "create"]
+    ids += [document.id for document in created]
+    result = await db.execute(select(Document.id, Document.version).where(Document.id.in_(ids)))
+    versions = dict(result.all())
     
-    return documents
+    created_ids = iter(document.id for document in created)
+    results = []
+    for operation in operations:
+        document_id = next(created_ids) if operation.op == "create" else operation.id
+        results.append(DocumentBulkResult(
+            op=operation.op,
+            id=document_id,
+            ref=operation.ref,
+            version=versions[document_id]
+        ))
+    return DocumentBulkResponse(results=results)
 
 @router.post("/", response_model=DocumentResponse)
 async def create_document(
     document: DocumentCreate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new document"""
-    verify_project_access(document.project_id, current_user.id, db)
+    await verify_project_access(document.project_id, current_user.id, db)
     
     db_document = Document(
         title=document.title,
@@ -59,92 +390,171 @@ async def create_document(
         document_type=document.document_type,
         order_index=document.order_index,
         project_id=document.project_id,
-        parent_id=document.parent_id
+        parent_id=document.parent_id,
+        word_count=count_words(document.content),
+        char_count=count_chars(document.content)
     )
     
     db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+    await db.flush()
+    await record_counts(db, db_document.project_id, db_document.word_count, db_document.char_count, 1)
+    await in_session(
+        db, index_document, db_document.id, db_document.project_id, db_document.title, db_document.content
+    )
+    await db.commit()
+    await db.refresh(db_document)
     
     return db_document
 
 @router.get("/{document_id}", response_model=DocumentResponse)
 async def get_document(
     document_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific document"""
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.is_active == True
-    ).first()
-    
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
-        )
-    
-    # Verify user has access to the project
-    verify_project_access(document.project_id, current_user.id, db)
-    
+    document = await get_active_document(document_id, current_user.id, db)
+    response.headers["ETag"] = document_etag(document.id, document.version)
     return document
 
 @router.put("/{document_id}", response_model=DocumentResponse)
 async def update_document(
     document_id: int,
     document_update: DocumentUpdate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a document"""
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.is_active == True
-    ).first()
+    document = await get_active_document(document_id, current_user.id, db)
     
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
-        )
-    
-    # Verify user has access to the project
-    verify_project_access(document.project_id, current_user.id, db)
-    
-    # Update fields
+    # Update fields; content goes through save_content so it gets a revision
     update_data = document_update.dict(exclude_unset=True)
+    content = update_data.pop("content", None)
+    title_changed = update_data.get("title", document.title) != document.title
     for field, value in update_data.items():
         setattr(document, field, value)
+    if content is not None and content != document.content:
+        await save_content(db, document, content, document.version)
+    elif title_changed:
+        await in_session(db, index_document, document.id, document.project_id, document.title, document.content)
     
-    db.commit()
-    db.refresh(document)
+    await db.commit()
+    await db.refresh(document)
     
+    response.headers["ETag"] = document_etag(document.id, document.version)
     return document
 
-@router.delete("/{document_id}")
-async def delete_document(
+@router.patch("/{document_id}", response_model=DocumentPatchResponse)
+async def patch_document(
     document_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    patch: DocumentPatch,
+    response: Response,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Delete a document (soft delete)"""
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.is_active == True
-    ).first()
+    """Apply text edits to a document's content
     
-    if not document:
+    The edits must have been made against the current version; otherwise the
+    request fails with 409 and the current version, and the client has to
+    rebase. The upload is the size of the edits, not the document.
+    """
+    document = await get_active_document(document_id, current_user.id, db)
+    
+    if patch.version != document.version:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Document has changed since this version", "version": document.version},
+            headers={"ETag": document_etag(document.id, document.version)}
+        )
+    
+    try:
+        content = apply_edits(
+            document.content or "",
+            [(edit.start, edit.end, edit.text) for edit in patch.edits]
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    version = await save_content(db, document, content, patch.version)
+    await db.commit()
+    
+    response.headers["ETag"] = document_etag(document.id, version)
+    return DocumentPatchResponse(
+        id=document.id,
+        version=version,
+        word_count=document.word_count,
+        char_count=document.char_count
+    )
+
+@router.get("/{document_id}/revisions", response_model=List[DocumentRevisionInfo])
+async def get_document_revisions(
+    document_id: int,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List a document's stored revisions, newest first"""
+    document = await get_active_document(document_id, current_user.id, db)
+    return [DocumentRevisionInfo.model_validate(row) for row in await list_revisions(db, document.id)]
+
+@router.get("/{document_id}/revisions/{version}", response_model=DocumentRevisionContent)
+async def get_document_revision(
+    document_id: int,
+    version: int,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a document's content as it was at a version"""
+    document = await get_active_document(document_id, current_user.id, db)
+    content = await reconstruct_revision(db, document, version)
+    if content is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
+            detail="Revision not found"
+        )
+    return DocumentRevisionContent(version=version, content=content)
+
+@router.post("/{document_id}/revisions/{version}/restore", response_model=DocumentResponse)
+async def restore_document_revision(
+    document_id: int,
+    version: int,
+    response: Response,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Make an earlier revision the current content; the replaced content stays in history"""
+    document = await get_active_document(document_id, current_user.id, db)
+    content = await reconstruct_revision(db, document, version)
+    if content is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Revision not found"
         )
     
-    # Verify user has access to the project
-    verify_project_access(document.project_id, current_user.id, db)
+    if content != (document.content or ""):
+        await save_content(db, document, content, document.version)
+        await db.commit()
+    await db.refresh(document)
+    
+    response.headers["ETag"] = document_etag(document.id, document.version)
+    return document
+
+@router.delete("/{document_id}")
+async def delete_document(
+    document_id: int,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Delete a document (soft delete)"""
+    document = await get_active_document(document_id, current_user.id, db)
     
     document.is_active = False
-    db.commit()
+    await in_session(db, remove_document, document.id)
+    await record_counts(db, document.project_id, -document.word_count, -document.char_count, -1, writing=False)
+    await db.commit()
     
     return {"message": "Document deleted successfully"}
@@ -1,34 +1,171 @@
 """
 Project management routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+import hashlib
+import json
+import re
+import zipfile
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Sequence
 
-from database.database import get_db
-from database.models import User, Project
-from schemas.project import ProjectCreate, ProjectUpdate, ProjectResponse
+from core.concurrency import run_blocking
+from core.config import settings
+from database.database import get_async_db
+from database.models import Project, Document, ProjectDailyStats, ProjectStats, UserSettings
+from schemas.project import (
+    ProjectCreate,
+    ProjectUpdate,
+    ProjectResponse,
+    ProjectAnalysisResponse,
+    ProjectStatsResponse,
+    SearchResult,
+    DocumentTreeNode
+)
+from core.principals import Principal
 from core.security import get_current_active_user
+from services.manuscript_export import (
+    EXPORT_FORMATS,
+    ExportNode,
+    flatten_tree,
+    html_to_text,
+    load_contents,
+    render_epub,
+    render_markdown,
+    render_text
+)
+from services.manuscript_import import plan_import, run_import
+from services.project_stats import chapter_stats
+from services.search_index import in_session, search_project
+from services.text_analysis import TextCounts, count_text, describe, merge_counts
 
 router = APIRouter()
 
+async def get_owned_project(project_id: int, user_id: int, db: AsyncSession) -> Project:
+    """Load an active project owned by the user or raise 404"""
+    result = await db.execute(
+        select(Project).where(
+            Project.id == project_id,
+            Project.owner_id == user_id,
+            Project.is_active == True
+        )
+    )
+    project = result.scalars().first()
+    
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
+    
+    return project
+
+def build_document_tree(rows: Sequence) -> List[dict]:
+    """Nest document rows under their parents in one pass; rows must already be in sibling order
+    
+    Documents whose parent is missing, inactive or part of a cycle become
+    top-level nodes, so every row appears exactly once.
+    """
+    nodes = {}
+    for row in rows:
+        nodes[row.id] = {
+            "id": row.id,
+            "title": row.title,
+            "document_type": row.document_type,
+            "order_index": row.order_index,
+            "updated_at": row.updated_at,
+            "word_count": row.word_count,
+            "char_count": row.char_count,
+            "children": []
+        }
+    
+    roots = []
+    for row in rows:
+        parent = nodes.get(row.parent_id)
+        if parent is None or row.parent_id == row.id:
+            roots.append(nodes[row.id])
+        else:
+            parent["children"].append(nodes[row.id])
+    
+    # Nodes on a parent cycle are unreachable from the roots; cut each cycle once
+    visited = set()
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        visited.add(node["id"])
+        stack.extend(node["children"])
+    if len(visited) < len(nodes):
+        for row in rows:
+            if row.id in visited:
+                continue
+            node = nodes[row.id]
+            nodes[row.parent_id]["children"].remove(node)
+            roots.append(node)
+            stack = [node]
+            while stack:
+                node = stack.pop()
+                visited.add(node["id"])
+                stack.extend(node["children"])
+    
+    return roots
+
+def document_tree_etag(rows: Sequence) -> str:
+    """ETag of a tree: a digest of every field it is built from"""
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(repr(tuple(row)).encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+def content_counts(content: Optional[str]) -> TextCounts:
+    """Analysis counts of a document's HTML content"""
+    return count_text(html_to_text(content) if content else "")
+
+async def load_tree_rows(project_id: int, db: AsyncSession) -> Sequence:
+    """Rows build_document_tree() needs: the project's active documents in sibling order, without content"""
+    result = await db.execute(
+        select(
+            Document.id,
+            Document.parent_id,
+            Document.title,
+            Document.document_type,
+            Document.order_index,
+            Document.updated_at,
+            Document.word_count,
+            Document.char_count
+        ).where(
+            Document.project_id == project_id,
+            Document.is_active == True
+        ).order_by(Document.order_index, Document.id)
+    )
+    return result.all()
+
+async def load_outline(project_id: int, db: AsyncSession) -> List[ExportNode]:
+    """The project's active documents in reading order, without content"""
+    return flatten_tree(build_document_tree(await load_tree_rows(project_id, db)))
+
 @router.get("/", response_model=List[ProjectResponse])
 async def get_projects(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all projects for the current user"""
-    projects = db.query(Project).filter(
-        Project.owner_id == current_user.id,
-        Project.is_active == True
-    ).all()
-    return projects
+    result = await db.execute(
+        select(Project).where(
+            Project.owner_id == current_user.id,
+            Project.is_active == True
+        )
+    )
+    return result.scalars().all()
 
 @router.post("/", response_model=ProjectResponse)
 async def create_project(
     project: ProjectCreate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new project"""
     db_project = Project(
@@ -39,82 +176,243 @@ async def create_project(
     )
     
     db.add(db_project)
-    db.commit()
-    db.refresh(db_project)
+    await db.commit()
+    await db.refresh(db_project)
     
     return db_project
 
 @router.get("/{project_id}", response_model=ProjectResponse)
 async def get_project(
     project_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific project"""
-    project = db.query(Project).filter(
-        Project.id == project_id,
-        Project.owner_id == current_user.id,
-        Project.is_active == True
-    ).first()
+    return await get_owned_project(project_id, current_user.id, db)
+
+@router.get("/{project_id}/search", response_model=List[SearchResult])
+async def search_project_text(
+    project_id: int,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Search a project's documents and compendium entries, best matches first"""
+    await get_owned_project(project_id, current_user.id, db)
+    return await in_session(db, search_project, project_id, q, limit)
+
+@router.get("/{project_id}/tree", response_model=List[DocumentTreeNode])
+async def get_project_tree(
+    project_id: int,
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a project's documents as a nested tree, without content
     
-    if not project:
+    All nodes come from one query whatever the tree's size or depth. Send
+    the ETag back as If-None-Match to get 304 while nothing has changed.
+    """
+    await get_owned_project(project_id, current_user.id, db)
+    
+    rows = await load_tree_rows(project_id, db)
+    
+    etag = document_tree_etag(rows)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    response.headers["ETag"] = etag
+    return build_document_tree(rows)
+
+@router.get("/{project_id}/stats", response_model=ProjectStatsResponse)
+async def get_project_stats(
+    project_id: int,
+    days: int = Query(30, ge=1, le=366),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Word and character totals, daily writing progress and a per-chapter breakdown
+    
+    Totals and progress are rows kept up to date on every save. Chapters
+    add up the stored counts of the document tree, so no content is read
+    and the number of queries does not grow with the project.
+    """
+    await get_owned_project(project_id, current_user.id, db)
+    
+    totals = await db.get(ProjectStats, project_id)
+    
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    result = await db.execute(
+        select(ProjectDailyStats).where(
+            ProjectDailyStats.project_id == project_id,
+            ProjectDailyStats.day >= since
+        ).order_by(ProjectDailyStats.day)
+    )
+    daily = result.scalars().all()
+    
+    rows = await load_tree_rows(project_id, db)
+    
+    return ProjectStatsResponse(
+        word_count=totals.word_count if totals else 0,
+        char_count=totals.char_count if totals else 0,
+        document_count=totals.document_count if totals else 0,
+        daily=daily,
+        chapters=chapter_stats(build_document_tree(rows))
+    )
+
+@router.get("/{project_id}/analysis", response_model=ProjectAnalysisResponse)
+async def analyze_project(
+    project_id: int,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Readability and style metrics for each document and for the whole manuscript
+    
+    Each document is tokenized once; the manuscript's metrics come from
+    adding up the documents' counts, not from analysing the joined text.
+    """
+    await get_owned_project(project_id, current_user.id, db)
+    
+    outline = await load_outline(project_id, db)
+    documents = []
+    counts = []
+    async for node in load_contents(outline):
+        document_counts = await run_blocking(content_counts, node.content)
+        counts.append(document_counts)
+        documents.append({"id": node.id, "title": node.title, **describe(document_counts)})
+    
+    return ProjectAnalysisResponse(
+        overall=describe(merge_counts(counts)),
+        documents=documents
+    )
+
+@router.get("/{project_id}/export")
+async def export_project(
+    project_id: int,
+    format: str = Query("markdown", pattern="^(markdown|text|epub)$"),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Download the whole manuscript as Markdown, plain text or EPUB
+    
+    Documents follow the tree in reading order. The file is streamed while
+    documents are loaded a few at a time, so memory use stays flat however
+    long the manuscript is.
+    """
+    project = await get_owned_project(project_id, current_user.id, db)
+    
+    # The outline is small (no content); content is read while streaming
+    outline = await load_outline(project_id, db)
+    nodes = load_contents(outline)
+    
+    if format == "epub":
+        language = await db.scalar(
+            select(UserSettings.language).where(UserSettings.user_id == current_user.id)
+        )
+        author = current_user.full_name or current_user.username
+        body = render_epub(project.id, project.name, author, language or "en", outline, nodes)
+    elif format == "text":
+        body = render_text(project.name, nodes)
+    else:
+        body = render_markdown(project.name, nodes)
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    stem = re.sub(r"[^\w\- ]+", "", project.name).strip() or "manuscript"
+    filename = f"{stem}.{extension}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename=\"manuscript.{extension}\"; filename*=UTF-8''{quote(filename)}"
+        }
+    )
+
+@router.post("/{project_id}/import")
+async def import_project_archive(
+    project_id: int,
+    file: UploadFile = File(...),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Import a zip of Markdown/text files: folders become chapters, files become scenes
+    
+    Imported documents go after the project's existing top-level documents.
+    The response is NDJSON: a progress line after each batch is inserted,
+    then a final line with "done" or "error". Problems with the archive
+    itself are reported as 400 before anything is written.
+    """
+    await get_owned_project(project_id, current_user.id, db)
+    
+    try:
+        archive = await run_blocking(zipfile.ZipFile, file.file)
+        plan = plan_import(
+            archive,
+            max_files=settings.import_max_files,
+            max_file_size=settings.max_file_size,
+            max_total_size=settings.import_max_total_size
+        )
+    except zipfile.BadZipFile:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The upload is not a zip archive"
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
     
-    return project
+    last_order_index = await db.scalar(
+        select(func.max(Document.order_index)).where(
+            Document.project_id == project_id,
+            Document.parent_id == None,
+            Document.is_active == True
+        )
+    )
+    first_order_index = 0 if last_order_index is None else last_order_index + 1
+    
+    async def lines():
+        async for line in run_import(project_id, archive, plan, first_order_index, settings.import_batch_size):
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.put("/{project_id}", response_model=ProjectResponse)
 async def update_project(
     project_id: int,
     project_update: ProjectUpdate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a project"""
-    project = db.query(Project).filter(
-        Project.id == project_id,
-        Project.owner_id == current_user.id,
-        Project.is_active == True
-    ).first()
-    
-    if not project:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found"
-        )
+    project = await get_owned_project(project_id, current_user.id, db)
     
     # Update fields
     update_data = project_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(project, field, value)
     
-    db.commit()
-    db.refresh(project)
+    await db.commit()
+    await db.refresh(project)
     
     return project
 
 @router.delete("/{project_id}")
 async def delete_project(
     project_id: int,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a project (soft delete)"""
-    project = db.query(Project).filter(
-        Project.id == project_id,
-        Project.owner_id == current_user.id,
-        Project.is_active == True
-    ).first()
-    
-    if not project:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Project not found"
-        )
+    project = await get_owned_project(project_id, current_user.id, db)
     
     project.is_active = False
-    db.commit()
+    await db.commit()
     
     return {"message": "Project deleted successfully"}
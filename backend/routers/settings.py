@@ -1,13 +1,15 @@
 """
 User settings routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 
-from database.database import get_db
-from database.models import User, UserSettings
+from database.database import get_async_db
+from database.models import UserSettings
+from core.principals import Principal
 from core.security import get_current_active_user
 
 router = APIRouter()
@@ -26,22 +28,27 @@ class SettingsUpdate(BaseModel):
     auto_save: Optional[bool] = None
     ai_settings: Optional[Dict[str, Any]] = None
 
+async def _load_settings(user_id: int, db: AsyncSession) -> Optional[UserSettings]:
+    """Load the settings row of a user"""
+    result = await db.execute(
+        select(UserSettings).where(UserSettings.user_id == user_id)
+    )
+    return result.scalars().first()
+
 @router.get("/", response_model=SettingsResponse)
 async def get_user_settings(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user settings"""
-    settings = db.query(UserSettings).filter(
-        UserSettings.user_id == current_user.id
-    ).first()
+    settings = await _load_settings(current_user.id, db)
     
     if not settings:
         # Create default settings if they don't exist
         settings = UserSettings(user_id=current_user.id)
         db.add(settings)
-        db.commit()
-        db.refresh(settings)
+        await db.commit()
+        await db.refresh(settings)
     
     return SettingsResponse(
         theme=settings.theme,
@@ -54,13 +61,11 @@ async def get_user_settings(
 @router.put("/", response_model=SettingsResponse)
 async def update_user_settings(
     settings_update: SettingsUpdate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update user settings"""
-    settings = db.query(UserSettings).filter(
-        UserSettings.user_id == current_user.id
-    ).first()
+    settings = await _load_settings(current_user.id, db)
     
     if not settings:
         settings = UserSettings(user_id=current_user.id)
@@ -71,8 +76,8 @@ async def update_user_settings(
     for field, value in update_data.items():
         setattr(settings, field, value)
     
-    db.commit()
-    db.refresh(settings)
+    await db.commit()
+    await db.refresh(settings)
     
     return SettingsResponse(
         theme=settings.theme,
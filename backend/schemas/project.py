@@ -3,7 +3,7 @@ Pydantic schemas for project-related operations
 """
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 class ProjectBase(BaseModel):
     name: str
@@ -49,17 +49,163 @@ class DocumentResponse(DocumentBase):
     id: int
     project_id: int
     is_active: bool
+    version: int = 1
     created_at: datetime
     updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
 
+class TextEdit(BaseModel):
+    start: int  # Offsets in UTF-16 code units, as JavaScript strings count them
+    end: int
+    text: str = ""
+
+class DocumentPatch(BaseModel):
+    version: int  # Version the edits were made against
+    edits: List[TextEdit]
+
+class DocumentPatchResponse(BaseModel):
+    id: int
+    version: int
+    word_count: int
+    char_count: int
+
+class DocumentBulkOperation(BaseModel):
+    op: str  # "create", "update", "reorder" or "delete"
+    id: Optional[int] = None  # Existing document; not used by create
+    ref: Optional[str] = None  # Name a created document so later operations can use it as parent_ref
+    version: Optional[int] = None  # Base version for a content update; a stale one fails the batch with 409
+    title: Optional[str] = None
+    content: Optional[str] = None
+    document_type: Optional[str] = None
+    order_index: Optional[int] = None
+    parent_id: Optional[int] = None
+    parent_ref: Optional[str] = None
+
+class DocumentBulkRequest(BaseModel):
+    operations: List[DocumentBulkOperation]
+
+class DocumentBulkResult(BaseModel):
+    op: str
+    id: int
+    ref: Optional[str] = None
+    version: int
+
+class DocumentBulkResponse(BaseModel):
+    results: List[DocumentBulkResult]  # One per operation, in request order
+
+class DocumentRevisionInfo(BaseModel):
+    version: int
+    kind: str  # "snapshot" or "delta"
+    char_count: int
+    word_count: int
+    stored_bytes: int
+    created_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class DocumentRevisionContent(BaseModel):
+    version: int
+    content: str
+
+class DocumentOutlineItem(BaseModel):
+    id: int
+    title: str
+    document_type: Optional[str] = None
+    order_index: Optional[int] = None
+    parent_id: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    word_count: int = 0
+    char_count: int = 0
+    
+    class Config:
+        from_attributes = True
+
+class DocumentOutlinePage(BaseModel):
+    items: List[DocumentOutlineItem]
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= for the next page
+
+class DocumentTreeNode(BaseModel):
+    id: int
+    title: str
+    document_type: Optional[str] = None
+    order_index: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    word_count: int = 0
+    char_count: int = 0
+    children: List["DocumentTreeNode"] = []
+
+class DailyProgress(BaseModel):
+    day: date  # UTC
+    words_added: int
+    words_removed: int
+    
+    class Config:
+        from_attributes = True
+
+class ChapterStats(BaseModel):
+    id: int
+    title: str
+    word_count: int  # Counts include the chapter's scenes and other descendants
+    char_count: int
+    document_count: int
+
+class ProjectStatsResponse(BaseModel):
+    word_count: int = 0
+    char_count: int = 0
+    document_count: int = 0
+    daily: List[DailyProgress]  # Days in the requested range with writing, oldest first
+    chapters: List[ChapterStats]  # In reading order
+
+class SentenceLengthBucket(BaseModel):
+    words: str  # e.g. "6-10", or "41+" for the last bucket
+    sentences: int
+
+class SentenceLengths(BaseModel):
+    mean: float
+    median: int
+    p90: int
+    longest: int
+    histogram: List[SentenceLengthBucket]
+
+class RepeatedWord(BaseModel):
+    word: str  # Lowercased; a CJK entry is a pair of characters
+    count: int
+
+class TextAnalysis(BaseModel):
+    characters: int
+    words: int
+    sentences: int
+    paragraphs: int
+    reading_ease: Optional[float] = None  # Flesch reading ease; None for mostly CJK text
+    sentence_length: SentenceLengths
+    dialogue_ratio: float  # Share of characters inside quotation marks
+    passive_ratio: float  # Share of sentences with a passive construction
+    repeated_words: List[RepeatedWord]
+
+class DocumentAnalysis(TextAnalysis):
+    id: int
+    title: str
+
+class ProjectAnalysisResponse(BaseModel):
+    overall: TextAnalysis
+    documents: List[DocumentAnalysis]  # In reading order
+
+class SearchResult(BaseModel):
+    kind: str  # "document" or "compendium"
+    id: int
+    title: str
+    snippet: str  # HTML-escaped, with matches wrapped in <mark>
+    score: float
+
 class CompendiumEntryBase(BaseModel):
     title: str
     content: Optional[str] = None
     entry_type: Optional[str] = None
     tags: Optional[List[str]] = None
+    aliases: Optional[List[str]] = None
 
 class CompendiumEntryCreate(CompendiumEntryBase):
     project_id: int
@@ -69,6 +215,7 @@ class CompendiumEntryUpdate(BaseModel):
     content: Optional[str] = None
     entry_type: Optional[str] = None
     tags: Optional[List[str]] = None
+    aliases: Optional[List[str]] = None
 
 class CompendiumEntryResponse(CompendiumEntryBase):
     id: int
@@ -78,3 +225,11 @@ class CompendiumEntryResponse(CompendiumEntryBase):
     
     class Config:
         from_attributes = True
+
+class CompendiumEntryPage(BaseModel):
+    items: List[CompendiumEntryResponse]
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= for the next page
+
+class CompendiumTagCount(BaseModel):
+    tag: str
+    count: int
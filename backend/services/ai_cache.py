@@ -0,0 +1,128 @@
+"""
+Content-addressed cache for writing assistance results
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+class AssistanceCache:
+    """LRU + TTL cache with a byte cap and an optional SQLite tier that survives restarts"""
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_seconds: float = 24 * 3600,
+        persist_path: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS assistance_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "DELETE FROM assistance_cache WHERE created_at < ?",
+                (time.time() - ttl_seconds,)
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(text: str, assistance_type: str, provider: str, model: str, temperature: float) -> str:
+        """Hash the request so unchanged text maps to the same entry"""
+        normalized = unicodedata.normalize("NFC", text).replace("\r\n", "\n").strip()
+        payload = json.dumps(
+            [normalized, assistance_type, provider, model, temperature],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result, or None on a miss or expired entry"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[1])
+            if entry is not None:
+                self._remove(key)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM assistance_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl_seconds:
+                    # Promote to the memory tier
+                    self._insert(key, row[0], row[1])
+                    self.hits += 1
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a result in memory and, if configured, on disk"""
+        now = time.time()
+        encoded = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._insert(key, encoded, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO assistance_cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, encoded, now)
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current memory usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "persistent": self._db is not None
+            }
+
+    def close(self) -> None:
+        """Close the persistent tier"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _insert(self, key: str, encoded: str, created_at: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (created_at, encoded)
+        self._bytes += self._size(key, encoded)
+        # Evict least recently used entries until both caps hold
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        _, encoded = self._entries.pop(key)
+        self._bytes -= self._size(key, encoded)
+
+    @staticmethod
+    def _size(key: str, encoded: str) -> int:
+        return len(key) + len(encoded.encode("utf-8"))
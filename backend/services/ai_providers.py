@@ -0,0 +1,52 @@
+"""
+Process-wide AI provider clients, created once in the app lifespan
+"""
+import httpx
+import openai
+import google.generativeai as genai
+from core.config import settings
+
+OPENAI_MODEL = "gpt-3.5-turbo"
+GEMINI_MODEL = "gemini-1.5-flash"
+CHAT_TEMPERATURE = 0.7
+
+class AIProviderRegistry:
+    """Holds keep-alive provider clients shared by every request"""
+
+    def __init__(self):
+        self.openai_client = None
+        self.gemini_client = None
+        self._http_client = None
+
+        if settings.openai_api_key:
+            try:
+                # One pooled HTTP client keeps connections and TLS sessions alive across requests
+                self._http_client = httpx.Client(
+                    timeout=httpx.Timeout(settings.ai_request_timeout, connect=settings.ai_connect_timeout),
+                    limits=httpx.Limits(
+                        max_connections=settings.ai_max_connections,
+                        max_keepalive_connections=settings.ai_max_keepalive_connections
+                    )
+                )
+                self.openai_client = openai.OpenAI(
+                    api_key=settings.openai_api_key,
+                    base_url=settings.openai_base_url,
+                    http_client=self._http_client
+                )
+            except Exception:
+                self.close()
+
+        if settings.gemini_api_key:
+            try:
+                genai.configure(api_key=settings.gemini_api_key)
+                self.gemini_client = genai.GenerativeModel(GEMINI_MODEL)
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        """Release pooled connections"""
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+        self.openai_client = None
+        self.gemini_client = None
@@ -1,105 +1,238 @@
 """
 AI Service for writing assistance
 """
-import openai
-import google.generativeai as genai
-from typing import List, Dict, Any, Optional
+import logging
+import time
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from fastapi import Request
 from core.config import settings
+from .ai_cache import AssistanceCache
+from .ai_providers import AIProviderRegistry, OPENAI_MODEL, GEMINI_MODEL, CHAT_TEMPERATURE
 from .mock_ai_service import mock_ai_service
+from .provider_router import AllProvidersFailed, Provider, ProviderRouter
 
-class AIService:
-    def __init__(self):
-        self.openai_client = None
-        self.gemini_client = None
+logger = logging.getLogger(__name__)
 
-        if settings.openai_api_key:
-            try:
-                self.openai_client = openai.OpenAI(api_key=settings.openai_api_key)
-            except Exception:
-                pass
+class AIService:
+    def __init__(self, providers: AIProviderRegistry, cache: Optional[AssistanceCache] = None):
+        self.openai_client = providers.openai_client
+        self.gemini_client = providers.gemini_client
+        self.cache = cache
 
-        if settings.gemini_api_key:
-            try:
-                genai.configure(api_key=settings.gemini_api_key)
-                self.gemini_client = genai.GenerativeModel('gemini-1.5-flash')
-            except Exception:
-                pass
+        # Try OpenAI first, then Gemini
+        routed = []
+        if self.openai_client:
+            routed.append(Provider("openai", self._chat_openai, self._stream_openai))
+        if self.gemini_client:
+            routed.append(Provider("gemini", self._chat_gemini, self._stream_gemini))
+        self.router = ProviderRouter(
+            routed,
+            hedge=settings.ai_hedge_enabled,
+            window=settings.ai_latency_window,
+            failure_threshold=settings.ai_circuit_failure_threshold,
+            reset_seconds=settings.ai_circuit_reset_seconds,
+            min_samples=settings.ai_hedge_min_samples,
+            max_workers=settings.ai_worker_threads
+        )
     
     def chat(self, messages: List[Dict[str, str]], context: Optional[str] = None) -> str:
         """Chat with AI assistant"""
+        response, _ = self._chat_with_provider(messages, context)
+        return response
+
+    def chat_without_fallback(self, messages: List[Dict[str, str]]) -> str:
+        """Chat through the real providers only, raising instead of answering from the mock service
+        
+        For callers that would store the reply, such as the running summary,
+        where a canned mock answer is worse than no answer.
+        """
         if not self.openai_client and not self.gemini_client:
             raise Exception("No AI service configured. Please set API keys.")
+        response, _ = self.router.call(messages)
+        return response
 
-        # Add context to the conversation if provided
-        if context:
-            system_message = {
-                "role": "system",
-                "content": f"You are a creative writing assistant. Here's the context: {context}"
-            }
-            messages = [system_message] + messages
+    def _chat_with_provider(self, messages: List[Dict[str, str]], context: Optional[str] = None) -> Tuple[str, str]:
+        """Chat with AI assistant, returning the reply and the provider that produced it"""
+        if not self.openai_client and not self.gemini_client:
+            raise Exception("No AI service configured. Please set API keys.")
 
-        # Try OpenAI first, then Gemini
-        openai_error = None
-        gemini_error = None
+        messages = self._with_context(messages, context)
 
-        if self.openai_client:
-            try:
-                response = self._chat_openai(messages)
-                return response
-            except Exception as e:
-                openai_error = str(e)
-                print(f"OpenAI failed: {openai_error}")
+        try:
+            return self.router.call(messages)
+        except AllProvidersFailed as e:
+            # If every provider failed, use mock service as fallback
+            logger.warning("All AI services failed (%s), using mock AI service for demonstration", e)
+            return mock_ai_service.chat(messages, context), "mock"
 
-        if self.gemini_client:
+    def chat_stream(self, messages: List[Dict[str, str]], context: Optional[str] = None) -> Iterator[str]:
+        """Chat with AI assistant, yielding the reply in chunks as they arrive"""
+        if not self.openai_client and not self.gemini_client:
+            raise Exception("No AI service configured. Please set API keys.")
+
+        return self._chat_stream(self._with_context(messages, context), context)
+
+    def _chat_stream(self, messages: List[Dict[str, str]], context: Optional[str]) -> Iterator[str]:
+        """Stream from the first healthy provider that answers, falling back like chat()"""
+        for provider, trial in self.router.ordered():
+            started = False
+            start = time.monotonic()
             try:
-                return self._chat_gemini(messages)
+                for chunk in provider.stream(messages):
+                    if not started:
+                        # Time to first token is what the stream's latency means to the user
+                        self.router.record(provider, time.monotonic() - start)
+                        started = True
+                    yield chunk
+                if not started:
+                    self.router.record(provider, time.monotonic() - start)
+                return
+            except GeneratorExit:
+                # The client went away; before the first token that says nothing
+                # about the provider, but a trial slot it held must be given back
+                if not started:
+                    self.router.release(provider, trial)
+                raise
             except Exception as e:
-                gemini_error = str(e)
-                print(f"Gemini failed: {gemini_error}")
+                self.router.record(provider, None, e)
+                # Once text has reached the client we cannot switch providers
+                if started:
+                    raise
+                logger.warning("%s failed: %s", provider.name, e)
+
+        logger.warning("All AI services failed, using mock AI service for demonstration")
+        yield from mock_ai_service.chat_stream(messages, context)
 
-        # If both services failed, use mock service as fallback
-        print("⚠️  All AI services failed, using mock AI service for demonstration")
-        return mock_ai_service.chat(messages, context)
+    def close(self) -> None:
+        """Stop the router's worker threads"""
+        self.router.close()
+
+    def _with_context(self, messages: List[Dict[str, str]], context: Optional[str]) -> List[Dict[str, str]]:
+        """Add context to the conversation if provided"""
+        if not context:
+            return messages
+        system_message = {
+            "role": "system",
+            "content": f"You are a creative writing assistant. Here's the context: {context}"
+        }
+        return [system_message] + messages
     
     def _chat_openai(self, messages: List[Dict[str, str]]) -> str:
         """Chat using OpenAI"""
         try:
             response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
+                model=OPENAI_MODEL,
                 messages=messages,
                 max_tokens=1000,
-                temperature=0.7
+                temperature=CHAT_TEMPERATURE,
+                timeout=settings.ai_openai_timeout
             )
             return response.choices[0].message.content
         except Exception as e:
             raise Exception(f"OpenAI API error: {str(e)}")
     
+    def _stream_openai(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        """Stream a chat completion from OpenAI"""
+        try:
+            stream = self.openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                max_tokens=1000,
+                temperature=CHAT_TEMPERATURE,
+                stream=True,
+                timeout=settings.ai_openai_timeout
+            )
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closing the response aborts the upstream generation
+            stream.close()
+    
     def _chat_gemini(self, messages: List[Dict[str, str]]) -> str:
         """Chat using Google Gemini"""
         try:
-            # Convert messages to Gemini format
-            prompt_parts = []
-
-            for msg in messages:
-                if msg["role"] == "system":
-                    prompt_parts.append(f"System: {msg['content']}")
-                elif msg["role"] == "user":
-                    prompt_parts.append(f"User: {msg['content']}")
-                elif msg["role"] == "assistant":
-                    prompt_parts.append(f"Assistant: {msg['content']}")
-
-            # Combine all parts into a single prompt
-            full_prompt = "\n\n".join(prompt_parts)
-
-            # Generate response
-            response = self.gemini_client.generate_content(full_prompt)
+            response = self.gemini_client.generate_content(
+                self._gemini_prompt(messages),
+                request_options={"timeout": settings.ai_gemini_timeout}
+            )
             return response.text
 
         except Exception as e:
             raise Exception(f"Gemini API error: {str(e)}")
+
+    def _stream_gemini(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        """Stream a response from Google Gemini"""
+        try:
+            response = self.gemini_client.generate_content(
+                self._gemini_prompt(messages),
+                stream=True,
+                request_options={"timeout": settings.ai_gemini_timeout}
+            )
+        except Exception as e:
+            raise Exception(f"Gemini API error: {str(e)}")
+
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    def _gemini_prompt(self, messages: List[Dict[str, str]]) -> str:
+        """Convert messages to Gemini format"""
+        prompt_parts = []
+
+        for msg in messages:
+            if msg["role"] == "system":
+                prompt_parts.append(f"System: {msg['content']}")
+            elif msg["role"] == "user":
+                prompt_parts.append(f"User: {msg['content']}")
+            elif msg["role"] == "assistant":
+                prompt_parts.append(f"Assistant: {msg['content']}")
+
+        # Combine all parts into a single prompt
+        return "\n\n".join(prompt_parts)
     
     def writing_assistance(self, text: str, assistance_type: str) -> Dict[str, Any]:
         """Provide writing assistance"""
+        provider, model, temperature = self._preferred_model()
+        cache_key = None
+        if self.cache is not None and provider:
+            cache_key = self.cache.make_key(text, assistance_type, provider, model, temperature)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        response, answered_by = self._chat_with_provider(self._assistance_messages(text, assistance_type))
+        
+        result = {
+            "result": response,
+            "suggestions": self.assistance_suggestions(text, assistance_type)
+        }
+        # Fallback answers are not cached under the preferred provider's key
+        if cache_key is not None and answered_by == provider:
+            self.cache.set(cache_key, result)
+        return result
+
+    def _preferred_model(self) -> Tuple[Optional[str], Optional[str], Optional[float]]:
+        """Provider, model and temperature a request is expected to be served by"""
+        models = {
+            "openai": (OPENAI_MODEL, CHAT_TEMPERATURE),
+            "gemini": (GEMINI_MODEL, None)
+        }
+        for provider in self.router.providers:
+            if self.router.health[provider.name].state != "open":
+                return (provider.name,) + models[provider.name]
+        return None, None, None
+
+    def writing_assistance_stream(self, text: str, assistance_type: str) -> Iterator[str]:
+        """Provide writing assistance, yielding the result in chunks as they arrive"""
+        return self.chat_stream(self._assistance_messages(text, assistance_type))
+
+    def _assistance_messages(self, text: str, assistance_type: str) -> List[Dict[str, str]]:
+        """Build the prompt for a writing assistance request"""
         prompts = {
             "improve": f"Please improve the following text while maintaining its original meaning and style:\n\n{text}",
             "continue": f"Please continue the following text in a natural and engaging way:\n\n{text}",
@@ -120,13 +253,13 @@ Text content:
         
         prompt = prompts.get(assistance_type, prompts["improve"])
         
-        messages = [
+        return [
             {"role": "system", "content": "You are a professional writing assistant."},
             {"role": "user", "content": prompt}
         ]
-        
-        response = self.chat(messages)
-        
+
+    def assistance_suggestions(self, text: str, assistance_type: str) -> List[str]:
+        """Suggestions returned alongside a writing assistance result"""
         # For analysis, provide specific improvement suggestions
         suggestions = []
         if assistance_type == "analyze":
@@ -152,7 +285,8 @@ Text content:
                 "Add transitional words to make paragraph connections more natural"
             ])
         
-        return {
-            "result": response,
-            "suggestions": suggestions
-        }
+        return suggestions
+
+def get_ai_service(request: Request) -> AIService:
+    """Dependency returning the AI service built on the app's shared provider clients"""
+    return request.app.state.ai_service
@@ -0,0 +1,214 @@
+"""
+Compendium entries mentioned in a document, for the chat system prompt
+
+Entry titles and aliases are compiled per project into an Aho-Corasick
+automaton over word tokens, so a document is scanned once however many
+entries the project has. Matchers are cached and dropped when an entry
+changes.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from database.models import CompendiumEntry, Document, Project
+from services.context_window import count_tokens, truncate_to_tokens
+from services.text_stats import plain_text, word_tokens
+
+# Entries that would get less than this are left out rather than cut to a stub
+MIN_ENTRY_TOKENS = 40
+
+class CompendiumMatcher:
+    """Aho-Corasick automaton whose alphabet is word tokens
+
+    Matching whole tokens means "Ann" does not match inside "Annual", and
+    because each CJK character is a token, CJK names still match inside
+    unbroken text.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[int, str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        self._vocabulary = set()
+
+        for entry_id, pattern in patterns:
+            state = 0
+            for token in word_tokens(pattern or ""):
+                self._vocabulary.add(token)
+                next_state = self._goto[state].get(token)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                    self._goto[state][token] = next_state
+                state = next_state
+            if state and entry_id not in self._output[state]:
+                self._output[state] += (entry_id,)
+
+        # Breadth-first, so every fail target is finished before it is used
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(token, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def _tokens(self, text: str) -> Iterator[str]:
+        """word_tokens(text), with the regex only run on chunks that need it
+
+        Most of a document is plain ASCII words between spaces, which
+        str.split() finds much faster than the tokenizer regex.
+        """
+        vocabulary = self._vocabulary
+        for chunk in text.lower().split():
+            if chunk in vocabulary or (chunk.isascii() and chunk.isalnum()):
+                yield chunk
+            else:
+                yield from word_tokens(chunk)
+
+    def find(self, text: str) -> Dict[int, int]:
+        """Mention count per entry id, in order of first mention"""
+        goto, fail, output = self._goto, self._fail, self._output
+        counts: Dict[int, int] = {}
+        state = 0
+        for token in self._tokens(text):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            for entry_id in output[state]:
+                counts[entry_id] = counts.get(entry_id, 0) + 1
+        return counts
+
+class MatcherCache:
+    """LRU + TTL map from project id to its compiled matcher
+
+    Entry changes made through the ORM drop the project's matcher at once;
+    the TTL bounds how long changes made by another worker go unseen.
+    """
+
+    def __init__(self, max_entries: int = 64, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Tuple[float, CompendiumMatcher]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, project_id: int) -> Optional[CompendiumMatcher]:
+        """Return the cached matcher for a project, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(project_id)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[project_id]
+                return None
+            self._entries.move_to_end(project_id)
+            return entry[1]
+
+    def set(self, project_id: int, matcher: CompendiumMatcher) -> None:
+        with self._lock:
+            self._entries[project_id] = (time.time() + self.ttl_seconds, matcher)
+            self._entries.move_to_end(project_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, project_id: int) -> None:
+        with self._lock:
+            self._entries.pop(project_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+compendium_matchers = MatcherCache(
+    max_entries=settings.compendium_matcher_cache_size,
+    ttl_seconds=settings.compendium_matcher_ttl_seconds
+)
+
+@event.listens_for(CompendiumEntry, "after_insert")
+@event.listens_for(CompendiumEntry, "after_update")
+@event.listens_for(CompendiumEntry, "after_delete")
+def _invalidate_changed_entry(mapper, connection, target: CompendiumEntry) -> None:
+    compendium_matchers.invalidate(target.project_id)
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_after_bulk(orm_execute_state) -> None:
+    """Bulk statements on entries do not say which projects changed, so drop everything"""
+    mapper = orm_execute_state.bind_mapper
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and mapper is not None and mapper.class_ is CompendiumEntry:
+        compendium_matchers.clear()
+
+def get_matcher(db: Session, project_id: int) -> CompendiumMatcher:
+    """The project's matcher, compiled from its entry titles and aliases if not cached"""
+    matcher = compendium_matchers.get(project_id)
+    if matcher is None:
+        rows = db.query(CompendiumEntry.id, CompendiumEntry.title, CompendiumEntry.aliases).filter(
+            CompendiumEntry.project_id == project_id
+        ).all()
+        matcher = CompendiumMatcher(
+            (row.id, name)
+            for row in rows
+            for name in [row.title] + [alias for alias in row.aliases or [] if isinstance(alias, str)]
+        )
+        compendium_matchers.set(project_id, matcher)
+    return matcher
+
+def compendium_context(db: Session, user_id: int, document_id: int, token_budget: int) -> Optional[str]:
+    """Compendium entries the document mentions, most mentioned first, within token_budget
+
+    Returns None if the document is not the user's or mentions no entries.
+    """
+    document = db.query(Document.project_id, Document.content).join(Project).filter(
+        Document.id == document_id,
+        Document.is_active == True,
+        Project.owner_id == user_id,
+        Project.is_active == True
+    ).first()
+    if document is None or not document.content:
+        return None
+
+    counts = get_matcher(db, document.project_id).find(plain_text(document.content))
+    if not counts:
+        return None
+
+    # sorted() is stable, so ties stay in order of first mention
+    ranked = sorted(counts, key=counts.get, reverse=True)
+    entries = {
+        entry.id: entry
+        for entry in db.query(
+            CompendiumEntry.id, CompendiumEntry.title, CompendiumEntry.entry_type, CompendiumEntry.content
+        ).filter(CompendiumEntry.id.in_(ranked)).all()
+    }
+
+    header = "Compendium entries mentioned in the current document:"
+    remaining = token_budget - count_tokens(header)
+    sections = []
+    for entry_id in ranked:
+        entry = entries.get(entry_id)
+        if entry is None:
+            continue
+        heading = f"## {entry.title}" + (f" ({entry.entry_type})" if entry.entry_type else "")
+        section = f"{heading}\n{' '.join(plain_text(entry.content or '').split())}".strip()
+        cost = count_tokens(section)
+        if cost > remaining:
+            if remaining < MIN_ENTRY_TOKENS:
+                break
+            section = truncate_to_tokens(section, remaining)
+            cost = count_tokens(section)
+        sections.append(section)
+        remaining -= cost
+
+    if not sections:
+        return None
+    return "\n\n".join([header] + sections)
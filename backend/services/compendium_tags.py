@@ -0,0 +1,37 @@
+"""
+Tag normalization for compendium entries
+
+An entry keeps its tags as entered in its JSON tags column, and one
+compendium_tags row per tag with the lowercased key that filters match on.
+"""
+from typing import Dict, Iterable, List, Optional
+
+MAX_TAG_LENGTH = 100
+
+def tag_key(tag: str) -> str:
+    """Form of a tag that filters compare"""
+    return " ".join(tag.split()).lower()
+
+def normalize_tags(tags: Optional[Iterable[str]]) -> List[str]:
+    """Trimmed tags without blanks or case-insensitive duplicates, in their original order
+    
+    Raises ValueError if a tag is longer than MAX_TAG_LENGTH.
+    """
+    normalized = []
+    seen = set()
+    for tag in tags or []:
+        tag = " ".join(tag.split())
+        if not tag or tag.lower() in seen:
+            continue
+        if len(tag) > MAX_TAG_LENGTH:
+            raise ValueError(f"Tags can be at most {MAX_TAG_LENGTH} characters")
+        seen.add(tag.lower())
+        normalized.append(tag)
+    return normalized
+
+def tag_rows(entry_id: int, project_id: int, tags: Optional[Iterable[str]]) -> List[Dict]:
+    """compendium_tags rows for an entry's normalized tags"""
+    return [
+        {"entry_id": entry_id, "project_id": project_id, "tag": tag_key(tag)}
+        for tag in tags or []
+    ]
@@ -0,0 +1,114 @@
+"""
+Token-budgeted chat context with a rolling summary of older turns
+"""
+import logging
+import math
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Role and formatting tokens each message costs on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+def count_tokens(text: Optional[str]) -> int:
+    """Estimate tokens: one per CJK character, about four characters per token otherwise"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Cut text down to roughly max_tokens, keeping the start (or the end)"""
+    tokens = count_tokens(text)
+    while tokens > max_tokens and text:
+        length = max(0, int(len(text) * max_tokens / tokens) - 1)
+        text = text[len(text) - length:] if keep_end else text[:length]
+        tokens = count_tokens(text)
+    return text
+
+@dataclass
+class ConversationContext:
+    """Running summary of a conversation plus the turns it does not cover yet"""
+    conversation_id: int
+    summary: Optional[str]
+    summary_seq: int  # Last message seq folded into the summary
+    summary_tokens: int
+    history: List[dict]  # seq, role, content, token_count; ordered by seq
+
+@dataclass
+class ContextWindow:
+    """Prompt for one chat turn and the unsummarized messages that did not fit"""
+    messages: List[Dict[str, str]]
+    overflow: List[dict]
+    overflow_tokens: int
+
+def build_context_window(context: ConversationContext, new_message: str, token_budget: int) -> ContextWindow:
+    """Keep the newest turns that fit the budget next to the summary and the new message"""
+    remaining = token_budget - context.summary_tokens - count_tokens(new_message) - MESSAGE_OVERHEAD_TOKENS
+    
+    start = len(context.history)
+    while start > 0:
+        cost = context.history[start - 1]["token_count"] + MESSAGE_OVERHEAD_TOKENS
+        if cost > remaining:
+            break
+        remaining -= cost
+        start -= 1
+    
+    messages = []
+    if context.summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation: {context.summary}"
+        })
+    messages.extend({"role": m["role"], "content": m["content"]} for m in context.history[start:])
+    messages.append({"role": "user", "content": new_message})
+    
+    overflow = context.history[:start]
+    return ContextWindow(
+        messages=messages,
+        overflow=overflow,
+        overflow_tokens=sum(m["token_count"] + MESSAGE_OVERHEAD_TOKENS for m in overflow)
+    )
+
+def summarize_messages(
+    chat: Callable[[List[Dict[str, str]]], str],
+    summary: Optional[str],
+    messages: List[dict],
+    max_tokens: int,
+    max_input_tokens: int
+) -> str:
+    """Fold messages into the running summary, bounded to max_tokens
+    
+    Falls back to an extractive summary if the provider call fails, so the
+    summary keeps advancing and prompt size stays bounded either way. chat
+    must raise on failure rather than return a stand-in reply, which would
+    replace the summary and lose the folded turns.
+    """
+    transcript = "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
+    # Newest messages matter most if a huge backlog has to be cut
+    transcript = truncate_to_tokens(transcript, max_input_tokens, keep_end=True)
+    
+    prompt = [
+        {
+            "role": "system",
+            "content": "You maintain a running summary of a conversation between a writer and their "
+                       "writing assistant. Keep names, plot decisions and open questions; drop small talk."
+        },
+        {
+            "role": "user",
+            "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}\n\n"
+                       f"Return only the updated summary, in at most {max_tokens * 3 // 4} words."
+        }
+    ]
+    try:
+        new_summary = chat(prompt)
+    except Exception as e:
+        logger.warning("Summarization failed, using extractive summary: %s", e)
+        new_summary = f"{summary or ''}\n{transcript}".strip()
+        return truncate_to_tokens(new_summary, max_tokens, keep_end=True)
+    
+    return truncate_to_tokens(new_summary.strip(), max_tokens)
@@ -0,0 +1,378 @@
+"""
+Compile a project's documents into one Markdown, plain text or EPUB file
+
+Documents are rendered one at a time as their content is loaded in small
+batches, and every renderer yields bytes as it goes, so memory use does
+not grow with the size of the manuscript. Converting and compressing a
+document is CPU-bound, so that part runs in the worker pool.
+"""
+import html
+import io
+import re
+import uuid
+import zipfile
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import AsyncIterator, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import select
+
+from core.concurrency import run_blocking
+from database.database import AsyncSessionLocal
+from database.models import Document
+
+EXPORT_FORMATS = {
+    "markdown": ("text/markdown; charset=utf-8", "md"),
+    "text": ("text/plain; charset=utf-8", "txt"),
+    "epub": ("application/epub+zip", "epub")
+}
+
+# Documents whose content is loaded per query
+EXPORT_BATCH_SIZE = 20
+
+class ExportNode(NamedTuple):
+    id: int
+    depth: int
+    title: str
+    content: Optional[str] = None
+
+def flatten_tree(tree: Sequence[dict]) -> List[ExportNode]:
+    """Nodes of a document tree in reading order (depth first), without content"""
+    nodes = []
+    stack = [(node, 0) for node in reversed(tree)]
+    while stack:
+        node, depth = stack.pop()
+        nodes.append(ExportNode(node["id"], depth, node["title"]))
+        stack.extend((child, depth + 1) for child in reversed(node["children"]))
+    return nodes
+
+async def load_contents(outline: Sequence[ExportNode]) -> AsyncIterator[ExportNode]:
+    """The outline's nodes with their content, loaded EXPORT_BATCH_SIZE at a time
+
+    Uses its own session because it runs while the response streams, after
+    the request's session has been closed.
+    """
+    async with AsyncSessionLocal() as db:
+        for start in range(0, len(outline), EXPORT_BATCH_SIZE):
+            batch = outline[start:start + EXPORT_BATCH_SIZE]
+            result = await db.execute(
+                select(Document.id, Document.content).where(Document.id.in_([node.id for node in batch]))
+            )
+            contents = dict(result.all())
+            for node in batch:
+                yield node._replace(content=contents.get(node.id))
+
+class _HtmlConverter(HTMLParser):
+    """Turns editor HTML into Markdown, plain text or well-formed XHTML"""
+
+    BLOCKS = {"p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "ul", "ol"}
+    # Tags kept in XHTML output, with legacy names mapped to their modern ones
+    XHTML_TAGS = {
+        "p": "p", "div": "div", "h1": "h1", "h2": "h2", "h3": "h3", "h4": "h4", "h5": "h5", "h6": "h6",
+        "li": "li", "ul": "ul", "ol": "ol", "blockquote": "blockquote", "pre": "pre", "code": "code",
+        "strong": "strong", "b": "strong", "em": "em", "i": "em", "u": "u", "s": "s", "strike": "s",
+        "sub": "sub", "sup": "sup"
+    }
+    MARKDOWN_INLINE = {"strong": "**", "b": "**", "em": "*", "i": "*", "s": "~~", "strike": "~~", "code": "`"}
+
+    def __init__(self, mode: str):
+        super().__init__(convert_charrefs=True)
+        self.mode = mode
+        self.parts: List[str] = []
+        self.open_tags: List[str] = []
+        self.lists: List[List] = []  # [tag, next item number] per open list
+        self.quote_depth = 0
+        self.in_item_marker = False  # Just after "- ", where a <p> must not start a new paragraph
+
+    def _break(self) -> None:
+        if not self.in_item_marker:
+            self.parts.append("\n\n" + "> " * self.quote_depth)
+
+    def handle_starttag(self, tag, attrs):
+        if self.mode == "xhtml":
+            if tag in ("br", "hr"):
+                self.parts.append(f"<{tag}/>")
+            elif tag in self.XHTML_TAGS:
+                self.open_tags.append(self.XHTML_TAGS[tag])
+                self.parts.append(f"<{self.XHTML_TAGS[tag]}>")
+            return
+
+        if tag == "br":
+            self.parts.append("\n" + "> " * self.quote_depth)
+        elif tag == "hr":
+            self._break()
+            self.parts.append("* * *")
+            self._break()
+        elif tag in ("ul", "ol"):
+            self.lists.append([tag, 1])
+        elif tag == "blockquote" and self.mode == "markdown":
+            self.quote_depth += 1
+            self._break()
+        elif tag in self.BLOCKS:
+            self._break()
+
+        if tag == "li":
+            self.parts.append("\n" + "> " * self.quote_depth)
+            list_tag, number = self.lists[-1] if self.lists else ("ul", 1)
+            if list_tag == "ol":
+                self.parts.append(f"{number}. ")
+                self.lists[-1][1] += 1
+            else:
+                self.parts.append("- ")
+            self.in_item_marker = True
+            return
+        elif self.mode == "markdown":
+            if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+                self.parts.append("#" * int(tag[1]) + " ")
+            elif tag in self.MARKDOWN_INLINE:
+                self.parts.append(self.MARKDOWN_INLINE[tag])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in ("br", "hr"):
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.mode == "xhtml":
+            name = self.XHTML_TAGS.get(tag)
+            # Close anything left open inside it so the output stays well-formed
+            if name in self.open_tags:
+                while self.open_tags:
+                    closing = self.open_tags.pop()
+                    self.parts.append(f"</{closing}>")
+                    if closing == name:
+                        break
+            return
+
+        if self.mode == "markdown" and tag in self.MARKDOWN_INLINE:
+            self.parts.append(self.MARKDOWN_INLINE[tag])
+        if tag in ("ul", "ol") and self.lists:
+            self.lists.pop()
+        if tag == "blockquote" and self.quote_depth:
+            self.quote_depth -= 1
+        if tag in self.BLOCKS:
+            self._break()
+
+    def handle_data(self, data):
+        data = re.sub(r"\s+", " ", data)
+        if data.strip():
+            self.in_item_marker = False
+        if self.mode == "xhtml":
+            self.parts.append(html.escape(data, quote=False))
+        elif self.mode == "markdown":
+            self.parts.append(escape_markdown(data))
+        else:
+            self.parts.append(data)
+
+    def result(self) -> str:
+        self.close()
+        if self.mode == "xhtml":
+            self.parts.extend(f"</{tag}>" for tag in reversed(self.open_tags))
+            return "".join(self.parts)
+        # Block breaks pile up; keep at most one blank line between paragraphs
+        lines = []
+        for line in "".join(self.parts).split("\n"):
+            line = line.strip()
+            blank = not line.replace(">", "").strip()
+            if blank and (not lines or lines[-1][1]):
+                continue
+            lines.append((line, blank))
+        while lines and lines[-1][1]:
+            lines.pop()
+        return "\n".join(line for line, _ in lines)
+
+def escape_markdown(text: str) -> str:
+    """Backslash-escape the characters Markdown would read as formatting"""
+    return re.sub(r"([\\`*_\[\]#])", r"\\\1", text)
+
+def html_to_markdown(content: str) -> str:
+    converter = _HtmlConverter("markdown")
+    converter.feed(content)
+    return converter.result()
+
+def html_to_text(content: str) -> str:
+    converter = _HtmlConverter("text")
+    converter.feed(content)
+    return converter.result()
+
+def html_to_xhtml(content: str) -> str:
+    converter = _HtmlConverter("xhtml")
+    converter.feed(content)
+    return converter.result()
+
+def _markdown_section(node: ExportNode) -> bytes:
+    heading = "#" * min(node.depth + 2, 6)
+    body = html_to_markdown(node.content or "")
+    section = f"\n{heading} {escape_markdown(node.title)}\n"
+    if body:
+        section += f"\n{body}\n"
+    return section.encode("utf-8")
+
+def _text_section(node: ExportNode) -> bytes:
+    underline = ("=" if node.depth == 0 else "-") * len(node.title)
+    body = html_to_text(node.content or "")
+    section = f"\n\n{node.title}\n{underline}\n"
+    if body:
+        section += f"\n{body}\n"
+    return section.encode("utf-8")
+
+async def render_markdown(title: str, nodes: AsyncIterator[ExportNode]) -> AsyncIterator[bytes]:
+    yield f"# {escape_markdown(title)}\n".encode("utf-8")
+    async for node in nodes:
+        yield await run_blocking(_markdown_section, node)
+
+async def render_text(title: str, nodes: AsyncIterator[ExportNode]) -> AsyncIterator[bytes]:
+    yield f"{title}\n{'=' * len(title)}\n".encode("utf-8")
+    async for node in nodes:
+        yield await run_blocking(_text_section, node)
+
+class _ZipOutput:
+    """Sink for zipfile that hands back what was written since the last drain
+
+    zipfile seeks back to fill in an entry's local header once the entry is
+    written. Entries are written whole between drains, so those seeks only
+    reach bytes still held here, and the archive needs no data descriptors
+    (which EPUB readers reject on the mimetype entry).
+    """
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._drained = 0
+
+    def write(self, data: bytes) -> int:
+        return self._buffer.write(data)
+
+    def tell(self) -> int:
+        return self._drained + self._buffer.tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            if offset < self._drained:
+                raise OSError("Cannot seek into data that was already sent")
+            offset -= self._drained
+        return self._drained + self._buffer.seek(offset, whence)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._drained += len(data)
+        self._buffer = io.BytesIO()
+        return data
+
+def _xhtml_page(title: str, body: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+        f"<head><title>{html.escape(title)}</title></head>\n"
+        f"<body>\n{body}\n</body>\n</html>\n"
+    )
+
+def _nav_list(outline: Sequence[ExportNode]) -> str:
+    """Nested <ol> of the outline; depth grows by at most one between consecutive nodes"""
+    parts = ['<ol><li><a href="title.xhtml">Title page</a></li>']
+    depth = 0
+    for index, node in enumerate(outline):
+        if index and node.depth > depth:
+            parts.append("<ol>")
+            depth += 1
+        elif index:
+            parts.append("</li>")
+            while depth > node.depth:
+                parts.append("</ol></li>")
+                depth -= 1
+        parts.append(f'<li><a href="doc-{node.id}.xhtml">{html.escape(node.title)}</a>')
+    if outline:
+        parts.append("</li>")
+    while depth > 0:
+        parts.append("</ol></li>")
+        depth -= 1
+    parts.append("</ol>")
+    return "".join(parts)
+
+def _package_document(project_id: int, title: str, author: str, language: str, outline: Sequence[ExportNode]) -> str:
+    identifier = uuid.uuid5(uuid.NAMESPACE_URL, f"writingway:project:{project_id}")
+    modified = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    manifest = "".join(
+        f'<item id="doc-{node.id}" href="doc-{node.id}.xhtml" media-type="application/xhtml+xml"/>\n'
+        for node in outline
+    )
+    spine = "".join(f'<itemref idref="doc-{node.id}"/>\n' for node in outline)
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">\n'
+        '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+        f'<dc:identifier id="book-id">urn:uuid:{identifier}</dc:identifier>\n'
+        f"<dc:title>{html.escape(title)}</dc:title>\n"
+        f"<dc:creator>{html.escape(author)}</dc:creator>\n"
+        f"<dc:language>{html.escape(language)}</dc:language>\n"
+        f'<meta property="dcterms:modified">{modified}</meta>\n'
+        "</metadata>\n"
+        "<manifest>\n"
+        '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>\n'
+        '<item id="title" href="title.xhtml" media-type="application/xhtml+xml"/>\n'
+        f"{manifest}"
+        "</manifest>\n"
+        '<spine>\n<itemref idref="title"/>\n'
+        f"{spine}"
+        "</spine>\n"
+        "</package>\n"
+    )
+
+CONTAINER_XML = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+    '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>\n'
+    "</container>\n"
+)
+
+def _write_front_matter(
+    archive: zipfile.ZipFile,
+    project_id: int,
+    title: str,
+    author: str,
+    language: str,
+    outline: Sequence[ExportNode]
+) -> None:
+    # The mimetype entry must come first and be stored uncompressed
+    archive.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+    archive.writestr("META-INF/container.xml", CONTAINER_XML)
+    archive.writestr("OEBPS/content.opf", _package_document(project_id, title, author, language, outline))
+    archive.writestr("OEBPS/nav.xhtml", _xhtml_page(
+        title, f'<nav epub:type="toc" id="toc"><h1>{html.escape(title)}</h1>{_nav_list(outline)}</nav>'
+    ))
+    archive.writestr("OEBPS/title.xhtml", _xhtml_page(
+        title, f"<h1>{html.escape(title)}</h1>\n<p>{html.escape(author)}</p>"
+    ))
+
+def _write_document(archive: zipfile.ZipFile, node: ExportNode) -> None:
+    heading = f"h{min(node.depth + 1, 6)}"
+    body = f"<{heading}>{html.escape(node.title)}</{heading}>\n<div>{html_to_xhtml(node.content or '')}</div>"
+    archive.writestr(f"OEBPS/doc-{node.id}.xhtml", _xhtml_page(node.title, body))
+
+async def render_epub(
+    project_id: int,
+    title: str,
+    author: str,
+    language: str,
+    outline: Sequence[ExportNode],
+    nodes: AsyncIterator[ExportNode]
+) -> AsyncIterator[bytes]:
+    """EPUB 3 with one XHTML file per document, streamed entry by entry
+
+    The package document and navigation only need the outline, so they are
+    written first and each document's file follows as its content arrives.
+    The archive is only ever touched by one worker thread at a time.
+    """
+    output = _ZipOutput()
+    archive = zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED)
+    await run_blocking(_write_front_matter, archive, project_id, title, author, language, outline)
+    yield output.drain()
+
+    async for node in nodes:
+        await run_blocking(_write_document, archive, node)
+        yield output.drain()
+
+    await run_blocking(archive.close)
+    yield output.drain()
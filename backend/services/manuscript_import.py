@@ -0,0 +1,363 @@
+"""
+Import a zip of Markdown and plain text files into a project
+
+Folders become parent documents and files become scenes, ordered by name.
+The archive is read straight from the upload, one member at a time, and
+documents are inserted in batches inside a single transaction, so memory
+use is bounded by the batch size rather than the size of the archive.
+The transaction runs in its own task and never waits on the client
+reading the progress stream.
+"""
+import asyncio
+import html
+import posixpath
+import re
+import zipfile
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import anyio
+
+from core.concurrency import run_blocking
+from database.database import AsyncSessionLocal
+from database.models import Document
+from services.project_stats import record_counts
+from services.search_index import in_session, index_documents
+from services.text_stats import count_chars, count_words
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+TEXT_EXTENSIONS = (".txt", ".text")
+
+# Longest title the documents table takes
+MAX_TITLE_LENGTH = 200
+
+class ImportFolder(NamedTuple):
+    path: str
+    parent: Optional[str]
+    title: str
+    order_index: int
+
+class ImportFile(NamedTuple):
+    name: str  # Member name in the archive
+    parent: Optional[str]
+    title: str
+    order_index: int
+
+class ImportPlan(NamedTuple):
+    folders: List[ImportFolder]  # Parents before their children
+    files: List[ImportFile]
+    skipped: List[str]  # Members that are not Markdown or text
+
+def _natural_key(name: str) -> list:
+    """Sort key that puts "Chapter 2" before "Chapter 10" """
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+def _title(name: str) -> str:
+    stem = posixpath.splitext(name)[0] if name.lower().endswith(MARKDOWN_EXTENSIONS + TEXT_EXTENSIONS) else name
+    return (stem.strip() or name)[:MAX_TITLE_LENGTH]
+
+def plan_import(archive: zipfile.ZipFile, max_files: int, max_file_size: int, max_total_size: int) -> ImportPlan:
+    """Work out the folders and files to create from the archive's directory
+
+    Only member metadata is read. A single folder wrapping everything (as
+    when a folder is zipped) is dropped. Raises ValueError if the archive
+    has nothing to import or exceeds a limit.
+    """
+    paths = []
+    skipped = []
+    total_size = 0
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        parts = [part for part in info.filename.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+        if not parts or parts[0] == "__MACOSX" or any(part.startswith(".") for part in parts):
+            continue
+        if not parts[-1].lower().endswith(MARKDOWN_EXTENSIONS + TEXT_EXTENSIONS):
+            skipped.append(info.filename)
+            continue
+        if info.file_size > max_file_size:
+            raise ValueError(f"{info.filename} is larger than {max_file_size} bytes")
+        total_size += info.file_size
+        paths.append((info.filename, parts))
+
+    if not paths:
+        raise ValueError("The archive has no Markdown or text files")
+    if len(paths) > max_files:
+        raise ValueError(f"The archive has {len(paths)} files; at most {max_files} can be imported")
+    if total_size > max_total_size:
+        raise ValueError(f"The archive holds more than {max_total_size} bytes of text")
+
+    while len({parts[0] for _, parts in paths}) == 1 and all(len(parts) > 1 for _, parts in paths):
+        paths = [(name, parts[1:]) for name, parts in paths]
+
+    # Children of each folder path ("" is the project itself), as (name, member or None)
+    children: Dict[str, Dict[str, Optional[str]]] = {"": {}}
+    for name, parts in paths:
+        parent = ""
+        for part in parts[:-1]:
+            path = posixpath.join(parent, part)
+            children[parent].setdefault(part, None)
+            children.setdefault(path, {})
+            parent = path
+        children[parent][parts[-1]] = name
+
+    folders = []
+    files = []
+    pending = [""]
+    while pending:
+        parent = pending.pop(0)
+        for order_index, part in enumerate(sorted(children[parent], key=_natural_key)):
+            member = children[parent][part]
+            if member is None:
+                path = posixpath.join(parent, part)
+                folders.append(ImportFolder(path, parent or None, _title(part), order_index))
+                pending.append(path)
+            else:
+                files.append(ImportFile(member, parent or None, _title(part), order_index))
+    return ImportPlan(folders, files, skipped)
+
+def decode_text(data: bytes) -> str:
+    """Text of a file that is UTF-8 (with or without BOM) or, failing that, Windows-1252"""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = data.decode("cp1252", errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n").replace("\x00", "")
+
+_ESCAPED_RE = re.compile(r"\\([\\`*_{}\[\]()#+\-.!>|~])")
+_CODE_RE = re.compile(r"`([^`]+)`")
+_LINK_RE = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+_STRONG_RE = re.compile(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1")
+_EM_STAR_RE = re.compile(r"\*(?=\S)(.+?)(?<=\S)\*")
+_EM_UNDERSCORE_RE = re.compile(r"(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)")
+_SAFE_URL_RE = re.compile(r"(?:https?:|mailto:|[^:]*$)", re.IGNORECASE)
+_HEADING_RE = re.compile(r"(#{1,6})\s+(.*?)\s*#*\s*$")
+_RULE_RE = re.compile(r"(?:[-*_]\s*){3,}$")
+_BULLET_RE = re.compile(r"[-*+]\s+(.*)")
+_NUMBERED_RE = re.compile(r"\d{1,9}[.)]\s+(.*)")
+
+def _link(match: "re.Match") -> str:
+    label, url = match.groups()
+    # Links that would run script (javascript: and the like) keep only their text
+    if not _SAFE_URL_RE.match(html.unescape(url)):
+        return label
+    return f'<a href="{url}">{label}</a>'
+
+def _inline(text: str) -> str:
+    """Markdown emphasis, code spans and links of one block as HTML"""
+    escaped: List[str] = []
+
+    def hold(match: "re.Match") -> str:
+        escaped.append(match.group(1))
+        return f"\x00{len(escaped) - 1}\x00"
+
+    text = html.escape(_ESCAPED_RE.sub(hold, text))
+    text = _CODE_RE.sub(r"<code>\1</code>", text)
+    text = _LINK_RE.sub(_link, text)
+    text = _STRONG_RE.sub(r"<strong>\2</strong>", text)
+    text = _EM_STAR_RE.sub(r"<em>\1</em>", text)
+    text = _EM_UNDERSCORE_RE.sub(r"<em>\1</em>", text)
+    return re.sub("\x00(\\d+)\x00", lambda match: html.escape(escaped[int(match.group(1))]), text)
+
+def markdown_to_html(text: str, title: Optional[str] = None) -> str:
+    """Editor HTML for the Markdown this app and most editors write
+
+    Covers headings, paragraphs, lists, block quotes, rules and inline
+    emphasis, code and links. A leading heading equal to title is dropped,
+    since the title is stored on the document.
+    """
+    blocks: List[str] = []
+    paragraph: List[str] = []
+    items: List[str] = []
+    list_tag = None
+    quote: List[str] = []
+
+    def close_paragraph() -> None:
+        if paragraph:
+            blocks.append(f"<p>{_inline(' '.join(paragraph))}</p>")
+            paragraph.clear()
+
+    def close_list() -> None:
+        nonlocal list_tag
+        if items:
+            blocks.append(f"<{list_tag}>" + "".join(f"<li>{item}</li>" for item in items) + f"</{list_tag}>")
+            items.clear()
+        list_tag = None
+
+    def close_quote() -> None:
+        if quote:
+            blocks.append(f"<blockquote>{markdown_to_html(chr(10).join(quote))}</blockquote>")
+            quote.clear()
+
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if stripped.startswith(">"):
+            close_paragraph()
+            close_list()
+            quote.append(stripped[2:] if stripped.startswith("> ") else stripped[1:])
+            continue
+        close_quote()
+
+        bullet = _BULLET_RE.match(stripped)
+        numbered = _NUMBERED_RE.match(stripped)
+        heading = _HEADING_RE.match(stripped)
+        if not stripped:
+            close_paragraph()
+            close_list()
+        elif _RULE_RE.match(stripped) and not paragraph:
+            close_list()
+            blocks.append("<hr>")
+        elif heading:
+            close_paragraph()
+            close_list()
+            content = heading.group(2)
+            if not blocks and title is not None and content.strip().lower() == title.strip().lower():
+                continue
+            level = len(heading.group(1))
+            blocks.append(f"<h{level}>{_inline(content)}</h{level}>")
+        elif bullet or numbered:
+            close_paragraph()
+            tag = "ul" if bullet else "ol"
+            if list_tag != tag:
+                close_list()
+                list_tag = tag
+            items.append(_inline((bullet or numbered).group(1)))
+        elif items and line[:1].isspace():
+            items[-1] += " " + _inline(stripped)
+        else:
+            close_list()
+            paragraph.append(stripped)
+    close_paragraph()
+    close_list()
+    close_quote()
+    return "".join(blocks)
+
+def text_to_html(text: str) -> str:
+    """Editor HTML for plain text
+
+    Blank lines separate paragraphs; a file without any blank lines is
+    taken to have one paragraph per line.
+    """
+    if re.search(r"\n\s*\n", text.strip()):
+        paragraphs = [" ".join(block.split()) for block in re.split(r"\n\s*\n", text)]
+    else:
+        paragraphs = [line.strip() for line in text.split("\n")]
+    return "".join(f"<p>{html.escape(paragraph)}</p>" for paragraph in paragraphs if paragraph)
+
+def _read_files(archive: zipfile.ZipFile, files: Sequence[ImportFile]) -> List[Tuple[ImportFile, str, int, int]]:
+    """Decompress, convert and count one batch of files"""
+    converted = []
+    for file in files:
+        text = decode_text(archive.read(file.name))
+        if file.name.lower().endswith(MARKDOWN_EXTENSIONS):
+            content = markdown_to_html(text, file.title)
+        else:
+            content = text_to_html(text)
+        converted.append((file, content, count_words(content), count_chars(content)))
+    return converted
+
+async def run_import(
+    project_id: int,
+    archive: zipfile.ZipFile,
+    plan: ImportPlan,
+    first_order_index: int,
+    batch_size: int
+) -> AsyncIterator[dict]:
+    """Create the planned documents, yielding progress after each batch
+
+    Everything is written in one transaction on its own session: either the
+    whole archive is imported or, on an error or a connection dropped
+    before the commit, nothing is. The writing runs as a separate task that
+    queues its progress, so a slow reader never holds the transaction open.
+    Top-level documents are placed after first_order_index.
+    """
+    progress: "asyncio.Queue[dict]" = asyncio.Queue()
+    writer = asyncio.create_task(
+        _write_import(project_id, archive, plan, first_order_index, batch_size, progress.put_nowait)
+    )
+    try:
+        while True:
+            line = await progress.get()
+            yield line
+            if "done" in line or "error" in line:
+                return
+    finally:
+        # Stops an import the client walked away from; a finished one is already committed
+        writer.cancel()
+        with anyio.CancelScope(shield=True):
+            await asyncio.gather(writer, return_exceptions=True)
+
+async def _write_import(
+    project_id: int,
+    archive: zipfile.ZipFile,
+    plan: ImportPlan,
+    first_order_index: int,
+    batch_size: int,
+    report: Callable[[dict], None]
+) -> None:
+    total = len(plan.files)
+    async with AsyncSessionLocal() as db:
+        try:
+            report({"imported": 0, "total": total, "folders": len(plan.folders)})
+
+            # Folders are few and their ids are needed for their children, so
+            # they go in one depth at a time
+            folder_ids: Dict[str, int] = {}
+            levels: Dict[int, List[ImportFolder]] = {}
+            for folder in plan.folders:
+                levels.setdefault(folder.path.count("/"), []).append(folder)
+            for depth in sorted(levels):
+                documents = [
+                    Document(
+                        title=folder.title,
+                        document_type="chapter",
+                        order_index=folder.order_index if folder.parent else first_order_index + folder.order_index,
+                        project_id=project_id,
+                        parent_id=folder_ids.get(folder.parent),
+                        word_count=0
+                    )
+                    for folder in levels[depth]
+                ]
+                db.add_all(documents)
+                await db.flush()
+                await in_session(db, index_documents, [
+                    (document.id, project_id, document.title, None) for document in documents
+                ])
+                folder_ids.update((folder.path, document.id) for folder, document in zip(levels[depth], documents))
+            db.expunge_all()
+
+            # The flush inserts a batch with batched statements where the
+            # database can return the new ids, and the search index is fed
+            # from exactly those rows
+            imported = words = chars = 0
+            for start in range(0, total, batch_size):
+                converted = await run_blocking(_read_files, archive, plan.files[start:start + batch_size])
+                documents = [
+                    Document(
+                        title=file.title,
+                        content=content,
+                        document_type="scene",
+                        order_index=file.order_index if file.parent else first_order_index + file.order_index,
+                        project_id=project_id,
+                        parent_id=folder_ids.get(file.parent),
+                        word_count=word_count,
+                        char_count=char_count
+                    )
+                    for file, content, word_count, char_count in converted
+                ]
+                db.add_all(documents)
+                await db.flush()
+                await in_session(db, index_documents, [
+                    (document.id, project_id, document.title, document.content) for document in documents
+                ])
+                db.expunge_all()
+                imported += len(converted)
+                words += sum(item[2] for item in converted)
+                chars += sum(item[3] for item in converted)
+                report({"imported": imported, "total": total})
+
+            await record_counts(db, project_id, words, chars, len(plan.folders) + imported, writing=False)
+            await db.commit()
+            report({"done": True, "imported": imported, "folders": len(plan.folders), "skipped": plan.skipped})
+        except Exception as e:
+            await db.rollback()
+            report({"error": f"Import failed: {str(e)}"})
@@ -1,61 +1,17 @@
 """
 Mock AI Service for testing when API quotas are exhausted
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 import random
 import time
 import re
 
+from .text_analysis import text_issues
+
 class MockAIService:
     def __init__(self):
         self._init_responses()
 
-    def _analyze_text_issues(self, text: str) -> List[str]:
-        """Analyze specific issues in the text"""
-        issues = []
-
-        # Check text length
-        if len(text) < 50:
-            issues.append("Text is too short, content is insufficient")
-        elif len(text) > 1000:
-            issues.append("Text is too long, suggest paragraphing or simplification")
-
-        # Check sentence length
-        sentences = re.split(r'[。！？.!?]', text)
-        sentences = [s.strip() for s in sentences if s.strip()]
-
-        if sentences:
-            avg_length = sum(len(s) for s in sentences) / len(sentences)
-            if avg_length > 50:
-                issues.append("Average sentence length is too long, affecting reading fluency")
-            elif avg_length < 10:
-                issues.append("Sentences are too short, expression may be incomplete")
-
-        # Check repeated vocabulary (for both English and Chinese)
-        words = re.findall(r'[\w\u4e00-\u9fff]+', text)  # Extract words and Chinese characters
-        if len(words) > 10:
-            word_freq = {}
-            for word in words:
-                if len(word) > 1:  # Only consider words longer than 1 character
-                    word_freq[word.lower()] = word_freq.get(word.lower(), 0) + 1
-
-            repeated_words = [word for word, freq in word_freq.items() if freq > 3]
-            if repeated_words:
-                issues.append(f"Excessive word repetition: {', '.join(repeated_words[:3])}")
-
-        # Check paragraph structure
-        paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
-        if len(paragraphs) == 1 and len(text) > 200:
-            issues.append("Lack of paragraph separation, suggest paragraphing to improve readability")
-
-        # Check punctuation usage
-        comma_count = text.count(',') + text.count('，')
-        period_count = text.count('.') + text.count('。')
-        if comma_count > period_count * 2:
-            issues.append("Excessive comma usage, suggest appropriate use of periods")
-
-        return issues
-
     def _init_responses(self):
         """初始化模拟回复"""
         self.mock_responses = {
@@ -89,6 +45,18 @@ class MockAIService:
         # Simulate API call delay
         time.sleep(0.5)
         
+        return self._choose_chat_response(messages)
+
+    def chat_stream(self, messages: List[Dict[str, str]], context: Optional[str] = None) -> Iterator[str]:
+        """Mock streaming chat, yielding the reply a word at a time"""
+        # Simulate time to first token, then a steady token rate
+        time.sleep(0.1)
+        for chunk in re.findall(r'\S+\s*', self._choose_chat_response(messages)):
+            time.sleep(0.03)
+            yield chunk
+
+    def _choose_chat_response(self, messages: List[Dict[str, str]]) -> str:
+        """Pick a canned reply for the last user message"""
         # 获取最后一条用户消息
         user_message = ""
         for msg in reversed(messages):
@@ -122,8 +90,8 @@ class MockAIService:
         time.sleep(0.8)
 
         if assistance_type == "analyze":
-            # Use intelligent analysis function
-            issues = self._analyze_text_issues(text)
+            # Local analysis of the text itself
+            issues = text_issues(text)
             if issues:
                 result = f"**Issues Found:**\n" + "\n".join(f"• {issue}" for issue in issues)
                 result += "\n\n**Overall Assessment:** The text has some areas for improvement. Please make targeted modifications based on the issues above."
@@ -0,0 +1,88 @@
+"""
+Running word and character totals per project, and daily writing progress
+
+Every change in a document's counts is added to the project's
+project_stats row, and writing also to today's project_daily_stats row, in
+the transaction that makes the change. Reading a project's statistics is
+then a few small rows rather than a pass over its documents.
+"""
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.dml import Insert
+
+from database.models import ProjectDailyStats, ProjectStats
+
+def _upsert(dialect_name: str, model, keys: Dict, increments: Dict[str, int]) -> Insert:
+    """INSERT of a row that adds the increments to the existing row instead, if there is one"""
+    table = model.__table__
+    if dialect_name == "mysql":
+        statement = mysql.insert(table).values(**keys, **increments)
+        return statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in increments}
+        )
+    statement = sqlite.insert(table).values(**keys, **increments)
+    return statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: table.c[name] + statement.excluded[name] for name in increments}
+    )
+
+async def record_counts(
+    db: AsyncSession,
+    project_id: int,
+    words: int,
+    chars: int,
+    documents: int = 0,
+    writing: bool = True
+) -> None:
+    """Add a change in a project's counts to its totals; the caller commits
+
+    With writing, the word change also counts towards today's progress.
+    Deleting and importing documents pass writing=False: they change the
+    totals, but are not words written that day.
+    """
+    dialect_name = db.get_bind().dialect.name
+    if words or chars or documents:
+        await db.execute(_upsert(
+            dialect_name,
+            ProjectStats,
+            {"project_id": project_id},
+            {"word_count": words, "char_count": chars, "document_count": documents}
+        ))
+    if writing and words:
+        await db.execute(_upsert(
+            dialect_name,
+            ProjectDailyStats,
+            {"project_id": project_id, "day": datetime.utcnow().date()},
+            {"words_added": max(words, 0), "words_removed": max(-words, 0)}
+        ))
+
+def chapter_stats(tree: Sequence[dict]) -> List[dict]:
+    """Chapters of a document tree in reading order, each with the counts of its whole subtree"""
+    order = []
+    stack = [(node, None) for node in reversed(tree)]
+    while stack:
+        node, parent = stack.pop()
+        order.append((node, parent))
+        stack.extend((child, node) for child in reversed(node["children"]))
+
+    totals = {node["id"]: [node["word_count"], node["char_count"], 1] for node, _ in order}
+    # Children come after their parent, so going backwards finishes each subtree first
+    for node, parent in reversed(order):
+        if parent is not None:
+            for index, value in enumerate(totals[node["id"]]):
+                totals[parent["id"]][index] += value
+
+    return [
+        {
+            "id": node["id"],
+            "title": node["title"],
+            "word_count": totals[node["id"]][0],
+            "char_count": totals[node["id"]][1],
+            "document_count": totals[node["id"]][2]
+        }
+        for node, _ in order
+        if node["document_type"] == "chapter"
+    ]
@@ -0,0 +1,246 @@
+"""
+Latency-aware routing across AI providers with circuit breakers and hedged requests
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class AllProvidersFailed(Exception):
+    """Every provider failed or has an open circuit"""
+
+@dataclass
+class Provider:
+    name: str
+    call: Callable[[List[Dict[str, str]]], str]
+    stream: Optional[Callable[[List[Dict[str, str]]], Iterator[str]]] = None
+
+class ProviderHealth:
+    """Rolling latency/error window and circuit breaker state for one provider"""
+
+    def __init__(
+        self,
+        window: int,
+        failure_threshold: int,
+        reset_seconds: float,
+        min_samples: int,
+        clock: Callable[[], float]
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.min_samples = min_samples
+        self.clock = clock
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)  # True for success
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Optional[bool]:
+        """None if no call may go out now, otherwise whether the call is the half-open trial
+        
+        An expired open circuit lets one trial through. A trial whose call never
+        produces an outcome must be given back with release_trial().
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if self.clock() - self.opened_at >= self.reset_seconds and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return None
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; an expired open circuit lets one trial through"""
+        return self.acquire() is not None
+
+    def release_trial(self) -> None:
+        """Give back a trial slot whose call was cancelled or abandoned before any outcome"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            # A failed half-open trial re-opens the circuit straight away
+            if self.trial_in_flight or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial_in_flight = False
+
+    def p95(self) -> Optional[float]:
+        """95th percentile latency, once there are enough samples to trust it"""
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(len(ordered) * 0.95) - 1)]
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.trial_in_flight or self.clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        with self._lock:
+            calls = len(self.outcomes)
+            failures = calls - sum(self.outcomes)
+            latencies = list(self.latencies)
+        return {
+            "state": self.state,
+            "calls": calls,
+            "error_rate": failures / calls if calls else 0.0,
+            "avg_latency": sum(latencies) / len(latencies) if latencies else None,
+            "p95_latency": p95,
+            "consecutive_failures": self.consecutive_failures
+        }
+
+class ProviderRouter:
+    """Calls providers in priority order, skipping open circuits and optionally hedging
+    
+    With hedging on, if the current provider has not answered within its p95
+    latency the next provider is started too; the first successful answer wins
+    and the other call is cancelled (or, if already running, left to finish
+    within its own timeout and only recorded in the stats).
+    """
+
+    def __init__(
+        self,
+        providers: List[Provider],
+        hedge: bool = False,
+        window: int = 50,
+        failure_threshold: int = 3,
+        reset_seconds: float = 30.0,
+        min_samples: int = 10,
+        max_workers: int = 16,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.providers = providers
+        self.hedge = hedge
+        self.clock = clock
+        self.health = {
+            provider.name: ProviderHealth(window, failure_threshold, reset_seconds, min_samples, clock)
+            for provider in providers
+        }
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-router")
+
+    def call(self, messages: List[Dict[str, str]]) -> Tuple[str, str]:
+        """Return (reply, provider name) from the first provider that answers"""
+        candidates = self._available()
+        pending: Dict[Future, Provider] = {}
+        trials = set()
+        errors = []
+        can_hedge = self.hedge
+        
+        def start_next() -> Optional[Provider]:
+            provider, trial = next(candidates, (None, False))
+            if provider is not None:
+                future = self._submit(provider, messages)
+                pending[future] = provider
+                if trial:
+                    trials.add(future)
+            return provider
+        
+        current = start_next()
+        while pending:
+            delay = self._hedge_delay(current) if can_hedge else None
+            done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            
+            if not done:
+                # Current provider is slower than its p95: hedge with the next one
+                hedge = start_next()
+                if hedge is None:
+                    can_hedge = False
+                else:
+                    logger.info("Hedging AI request to %s after %.2fs", hedge.name, delay)
+                    current = hedge
+                continue
+            
+            for future in done:
+                finished = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning("%s failed: %s", finished.name, e)
+                    errors.append(f"{finished.name}: {e}")
+                    continue
+                for other, provider in pending.items():
+                    # A call cancelled before it started never reports back
+                    if other.cancel() and other in trials:
+                        self.health[provider.name].release_trial()
+                return result, finished.name
+            
+            # Everything in flight failed, move on to the next provider
+            if not pending:
+                current = start_next()
+        
+        raise AllProvidersFailed("; ".join(errors) or "All provider circuits are open")
+
+    def ordered(self) -> Iterator[Tuple[Provider, bool]]:
+        """(provider, is half-open trial) pairs a streaming call may try, in order
+        
+        Callers must record() the outcome of each call they make, or release()
+        one abandoned before it had an outcome.
+        """
+        return self._available()
+
+    def record(self, provider: Provider, latency: Optional[float], error: Optional[BaseException] = None) -> None:
+        """Record the outcome of a call made outside call(), e.g. a stream"""
+        if error is not None:
+            self.health[provider.name].record_failure()
+        else:
+            self.health[provider.name].record_success(latency or 0.0)
+
+    def release(self, provider: Provider, trial: bool) -> None:
+        """Forget a call made outside call() that was abandoned without an outcome"""
+        if trial:
+            self.health[provider.name].release_trial()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: health.snapshot() for name, health in self.health.items()}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _available(self) -> Iterator[Tuple[Provider, bool]]:
+        # Lazy so a half-open trial slot is only taken by a provider that is actually called
+        for provider in self.providers:
+            trial = self.health[provider.name].acquire()
+            if trial is not None:
+                yield provider, trial
+
+    def _hedge_delay(self, provider: Provider) -> Optional[float]:
+        return self.health[provider.name].p95()
+
+    def _submit(self, provider: Provider, messages: List[Dict[str, str]]) -> Future:
+        return self._executor.submit(self._timed_call, provider, messages)
+
+    def _timed_call(self, provider: Provider, messages: List[Dict[str, str]]) -> str:
+        health = self.health[provider.name]
+        start = self.clock()
+        try:
+            result = provider.call(messages)
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(self.clock() - start)
+        return result
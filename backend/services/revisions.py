@@ -0,0 +1,132 @@
+"""
+Document revision history: periodic compressed snapshots with reverse deltas between them
+
+Revision v holds the content a document had at version v. Most revisions
+are stored as a reverse delta that turns the content of version v + 1 back
+into version v; every snapshot_interval revisions a full compressed copy is
+stored instead. Rebuilding any revision therefore starts from the nearest
+newer snapshot (or the live document) and applies fewer than
+snapshot_interval deltas.
+"""
+import json
+import zlib
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from database.models import Document, DocumentRevision
+from services.text_stats import common_prefix_length, common_suffix_length, count_chars, count_words
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+def make_reverse_delta(new: str, old: str) -> bytes:
+    """Compressed splice that turns new back into old"""
+    shortest = min(len(new), len(old))
+    start = common_prefix_length(new, old, shortest)
+    suffix = common_suffix_length(new, old, shortest - start)
+    delta = [start, len(new) - suffix, old[start:len(old) - suffix]]
+    return zlib.compress(json.dumps(delta, ensure_ascii=False).encode("utf-8"))
+
+def apply_reverse_delta(new: str, delta: bytes) -> str:
+    """Undo one revision step"""
+    start, end, text = json.loads(zlib.decompress(delta).decode("utf-8"))
+    return new[:start] + text + new[end:]
+
+def compress_snapshot(content: str) -> bytes:
+    return zlib.compress(content.encode("utf-8"))
+
+def decompress_snapshot(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+async def record_revision(
+    db: AsyncSession,
+    document_id: int,
+    version: int,
+    old_content: Optional[str],
+    new_content: Optional[str],
+    old_word_count: Optional[int] = None,
+    old_char_count: Optional[int] = None
+) -> DocumentRevision:
+    """Add the revision for the content a document had before a change; the caller commits
+
+    Pass old_word_count and old_char_count when they are known to spare
+    counting the old content.
+    """
+    old_content = old_content or ""
+    last_snapshot = await db.scalar(
+        select(func.max(DocumentRevision.version)).where(
+            DocumentRevision.document_id == document_id,
+            DocumentRevision.kind == SNAPSHOT
+        )
+    )
+    if version - (last_snapshot or 0) >= settings.document_snapshot_interval:
+        kind, data = SNAPSHOT, compress_snapshot(old_content)
+    else:
+        kind, data = DELTA, make_reverse_delta(new_content or "", old_content)
+
+    revision = DocumentRevision(
+        document_id=document_id,
+        version=version,
+        kind=kind,
+        data=data,
+        char_count=count_chars(old_content) if old_char_count is None else old_char_count,
+        word_count=count_words(old_content) if old_word_count is None else old_word_count
+    )
+    db.add(revision)
+    return revision
+
+async def reconstruct_revision(db: AsyncSession, document: Document, version: int) -> Optional[str]:
+    """Content of a document at an earlier version, or None if there is no such revision"""
+    if version == document.version:
+        return document.content or ""
+
+    # Nearest snapshot at or above the wanted version; the live document if none
+    snapshot = (await db.execute(
+        select(DocumentRevision.version, DocumentRevision.data).where(
+            DocumentRevision.document_id == document.id,
+            DocumentRevision.kind == SNAPSHOT,
+            DocumentRevision.version >= version
+        ).order_by(DocumentRevision.version).limit(1)
+    )).first()
+    if snapshot is not None:
+        top, content = snapshot.version, decompress_snapshot(snapshot.data)
+    else:
+        top, content = document.version, document.content or ""
+
+    rows = (await db.execute(
+        select(DocumentRevision.version, DocumentRevision.data).where(
+            DocumentRevision.document_id == document.id,
+            DocumentRevision.version >= version,
+            DocumentRevision.version < top
+        ).order_by(DocumentRevision.version.desc())
+    )).all()
+    if not rows or rows[-1].version != version:
+        return None if top != version else content
+
+    expected = top - 1
+    for row in rows:
+        if row.version != expected:
+            # A gap means the chain back to this version is broken
+            return None
+        content = apply_reverse_delta(content, row.data)
+        expected -= 1
+    return content
+
+async def list_revisions(db: AsyncSession, document_id: int) -> List[Tuple]:
+    """Version, kind, sizes and time of each stored revision, newest first"""
+    result = await db.execute(
+        select(
+            DocumentRevision.version,
+            DocumentRevision.kind,
+            DocumentRevision.char_count,
+            DocumentRevision.word_count,
+            func.length(DocumentRevision.data).label("stored_bytes"),
+            DocumentRevision.created_at
+        ).where(
+            DocumentRevision.document_id == document_id
+        ).order_by(DocumentRevision.version.desc())
+    )
+    return result.all()
@@ -0,0 +1,264 @@
+"""
+Full-text search over a project's documents and compendium entries
+
+SQLite uses an FTS5 virtual table and MySQL a table with an ngram FULLTEXT
+index. Either way the index lives in a search_index table outside the ORM
+models and is updated in the same transaction as the row it mirrors.
+"""
+import html
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import CompendiumEntry, Document
+from services.text_stats import CJK_CHARS, plain_text
+
+DOCUMENT = "document"
+COMPENDIUM = "compendium"
+_KIND_CODES = {DOCUMENT: 0, COMPENDIUM: 1}
+
+REBUILD_BATCH_SIZE = 200
+MAX_QUERY_TERMS = 10
+
+# Highlight markers; private-use characters cannot clash with escaped text
+_MARK_START = "\ue000"
+_MARK_END = "\ue001"
+
+_CJK_RE = re.compile(rf"([{CJK_CHARS}])")
+# A CJK character with the spaces _split_cjk put around it, and any marker in between
+_SPLIT_CJK_RE = re.compile(rf" ?({_MARK_START}?[{CJK_CHARS}]{_MARK_END}?) ?")
+
+def _supported(connection: Connection) -> bool:
+    return connection.dialect.name in ("sqlite", "mysql")
+
+def _rowid(kind: str, item_id: int) -> int:
+    """FTS5 rows are keyed by rowid, which is the only fast way to find one"""
+    return item_id * len(_KIND_CODES) + _KIND_CODES[kind]
+
+def _split_cjk(value: str) -> str:
+    """FTS5's unicode61 tokenizer keeps CJK runs as one token; make each character its own"""
+    return _CJK_RE.sub(r" \1 ", value)
+
+def _join_cjk(value: str) -> str:
+    """Undo _split_cjk on text read back from the index"""
+    return _SPLIT_CJK_RE.sub(r"\1", value)
+
+def _body_text(content: Optional[str]) -> str:
+    """Indexed text of editor HTML, with the whitespace left by tags collapsed"""
+    return " ".join(plain_text(content or "").split())
+
+async def in_session(db: AsyncSession, func: Callable[..., Any], *args: Any) -> Any:
+    """Run one of the functions below inside an AsyncSession's transaction"""
+    return await db.run_sync(lambda session: func(session.connection(), *args))
+
+def create_search_index(connection: Connection) -> bool:
+    """Create the search_index table if it is missing; returns True if it was created"""
+    if not _supported(connection) or inspect(connection).has_table("search_index"):
+        return False
+    
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE search_index USING fts5("
+            "title, body, tags, kind UNINDEXED, item_id UNINDEXED, project_id UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    else:
+        connection.exec_driver_sql(
+            "CREATE TABLE search_index ("
+            "kind VARCHAR(20) NOT NULL, item_id INT NOT NULL, project_id INT NOT NULL, "
+            "title TEXT, body LONGTEXT, tags TEXT, "
+            "PRIMARY KEY (kind, item_id), INDEX idx_search_index_project (project_id), "
+            "FULLTEXT INDEX ft_search_index (title, body, tags) WITH PARSER ngram"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"
+        )
+    return True
+
+def _put(connection: Connection, kind: str,
+         items: Iterable[Tuple[int, int, Optional[str], Optional[str], Optional[str]]]) -> None:
+    """Insert or replace indexed items given as (item_id, project_id, title, body, tags)"""
+    rows = [
+        {
+            "kind": kind,
+            "item_id": item_id,
+            "project_id": project_id,
+            "title": title or "",
+            "body": body or "",
+            "tags": tags or ""
+        }
+        for item_id, project_id, title, body, tags in items
+    ]
+    if not rows:
+        return
+    if connection.dialect.name == "sqlite":
+        for row in rows:
+            row.update(
+                rowid=_rowid(kind, row["item_id"]),
+                title=_split_cjk(row["title"]),
+                body=_split_cjk(row["body"]),
+                tags=_split_cjk(row["tags"])
+            )
+        connection.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), rows)
+        connection.execute(text(
+            "INSERT INTO search_index (rowid, title, body, tags, kind, item_id, project_id) "
+            "VALUES (:rowid, :title, :body, :tags, :kind, :item_id, :project_id)"
+        ), rows)
+    else:
+        connection.execute(text(
+            "INSERT INTO search_index (kind, item_id, project_id, title, body, tags) "
+            "VALUES (:kind, :item_id, :project_id, :title, :body, :tags) "
+            "ON DUPLICATE KEY UPDATE project_id = VALUES(project_id), title = VALUES(title), "
+            "body = VALUES(body), tags = VALUES(tags)"
+        ), rows)
+
+def _remove(connection: Connection, kind: str, item_id: int) -> None:
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), {"rowid": _rowid(kind, item_id)})
+    else:
+        connection.execute(
+            text("DELETE FROM search_index WHERE kind = :kind AND item_id = :item_id"),
+            {"kind": kind, "item_id": item_id}
+        )
+
+def index_document(connection: Connection, document_id: int, project_id: int,
+                   title: Optional[str], content: Optional[str]) -> None:
+    """Add or refresh a document in the index"""
+    index_documents(connection, [(document_id, project_id, title, content)])
+
+def index_documents(connection: Connection,
+                    documents: Iterable[Tuple[int, int, Optional[str], Optional[str]]]) -> None:
+    """Add or refresh (id, project_id, title, content) documents with one statement per step"""
+    if _supported(connection):
+        _put(connection, DOCUMENT, (
+            (document_id, project_id, title, _body_text(content), None)
+            for document_id, project_id, title, content in documents
+        ))
+
+def remove_document(connection: Connection, document_id: int) -> None:
+    """Drop a deleted document from the index"""
+    if _supported(connection):
+        _remove(connection, DOCUMENT, document_id)
+
+def index_compendium_entry(connection: Connection, entry_id: int, project_id: int,
+                           title: Optional[str], content: Optional[str], tags: Optional[List[str]]) -> None:
+    """Add or refresh a compendium entry in the index"""
+    if _supported(connection):
+        _put(connection, COMPENDIUM, [(entry_id, project_id, title, _body_text(content), " ".join(tags or []))])
+
+def remove_compendium_entry(connection: Connection, entry_id: int) -> None:
+    """Drop a deleted compendium entry from the index"""
+    if _supported(connection):
+        _remove(connection, COMPENDIUM, entry_id)
+
+def rebuild_search_index(connection: Connection) -> int:
+    """Re-index every active document and every compendium entry; returns the item count"""
+    if not _supported(connection):
+        return 0
+    create_search_index(connection)
+    connection.exec_driver_sql("DELETE FROM search_index")
+    
+    count = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(Document.id, Document.project_id, Document.title, Document.content)
+            .where(Document.id > last_id, Document.is_active == True)
+            .order_by(Document.id)
+            .limit(REBUILD_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        index_documents(connection, rows)
+        count += len(rows)
+        last_id = rows[-1].id
+    
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(CompendiumEntry.id, CompendiumEntry.project_id, CompendiumEntry.title,
+                   CompendiumEntry.content, CompendiumEntry.tags)
+            .where(CompendiumEntry.id > last_id)
+            .order_by(CompendiumEntry.id)
+            .limit(REBUILD_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            index_compendium_entry(connection, row.id, row.project_id, row.title, row.content, row.tags)
+        count += len(rows)
+        last_id = rows[-1].id
+    
+    return count
+
+def search_project(connection: Connection, project_id: int, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Best matches for the query within a project, each with a highlighted snippet
+    
+    Every whitespace-separated term must match; the last one also matches as
+    a prefix so results appear while typing. Snippets are HTML-escaped with
+    matches wrapped in <mark>.
+    """
+    terms = [term for term in re.split(r"[\s\"]+", query) if term][:MAX_QUERY_TERMS]
+    if not terms or not _supported(connection):
+        return []
+    
+    if connection.dialect.name == "sqlite":
+        phrases = ['"' + _split_cjk(term).strip() + '"' for term in terms]
+        phrases[-1] += "*"
+        rows = connection.execute(text(
+            "SELECT kind, item_id, title, "
+            "snippet(search_index, 1, :start, :end, '\u2026', 24) AS snippet, "
+            "bm25(search_index, 5.0, 1.0, 3.0) AS rank "
+            "FROM search_index WHERE search_index MATCH :match AND project_id = :project_id "
+            "ORDER BY rank LIMIT :limit"
+        ), {
+            "match": " ".join(phrases),
+            "project_id": project_id,
+            "limit": limit,
+            "start": _MARK_START,
+            "end": _MARK_END
+        }).all()
+        return [
+            {
+                "kind": row.kind,
+                "id": row.item_id,
+                "title": _join_cjk(row.title),
+                "snippet": _marked_html(_join_cjk(row.snippet)),
+                "score": -row.rank
+            }
+            for row in rows
+        ]
+    
+    # The ngram parser matches any substring of two or more characters, prefixes included
+    match = " ".join('+"' + term + '"' for term in terms)
+    rows = connection.execute(text(
+        "SELECT kind, item_id, title, body, "
+        "MATCH (title, body, tags) AGAINST (:match IN BOOLEAN MODE) AS score "
+        "FROM search_index WHERE project_id = :project_id "
+        "AND MATCH (title, body, tags) AGAINST (:match IN BOOLEAN MODE) "
+        "ORDER BY score DESC LIMIT :limit"
+    ), {"match": match, "project_id": project_id, "limit": limit}).all()
+    return [
+        {
+            "kind": row.kind,
+            "id": row.item_id,
+            "title": row.title,
+            "snippet": _marked_html(_snippet(row.body, terms)),
+            "score": float(row.score)
+        }
+        for row in rows
+    ]
+
+def _snippet(body: str, terms: List[str], width: int = 80) -> str:
+    """Text around the first matching term with every match marked"""
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    first = pattern.search(body)
+    center = first.start() if first else 0
+    start = max(0, center - width // 2)
+    excerpt = body[start:start + width]
+    excerpt = pattern.sub(lambda m: _MARK_START + m.group(0) + _MARK_END, excerpt)
+    return ("\u2026" if start > 0 else "") + excerpt + ("\u2026" if start + width < len(body) else "")
+
+def _marked_html(value: str) -> str:
+    return html.escape(value).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
@@ -0,0 +1,274 @@
+"""
+Local text analysis: readability, sentence lengths, repetition, dialogue and passive voice
+
+Text is tokenized in one pass with a single precompiled pattern; everything
+else is worked out from the tokens that pass yields. Counts of several
+texts add up, so a project is analysed by merging its documents' counts
+rather than by joining their text.
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple
+
+from services.text_stats import CJK_CHARS
+
+# Words, CJK runs, sentence ends, commas and line breaks; everything else is skipped
+_TOKEN_RE = re.compile(
+    rf"[{CJK_CHARS}]+"
+    rf"|[^\W{CJK_CHARS}]+(?:['’-][^\W_{CJK_CHARS}]+)*"
+    r"|[.!?。！？…]+"
+    r"|[,，、]"
+    r"|\n\s*"
+)
+_CJK_RE = re.compile(rf"[{CJK_CHARS}]")
+_CJK_PAIR_RE = re.compile(rf"(?=([{CJK_CHARS}]{{2}}))")
+_SENTENCE_ENDS = ".!?。！？…"
+_COMMAS = ",，、"
+
+# Quoted speech runs to its closing mark, or to the end of the paragraph
+# when it carries on into the next one
+_DIALOGUE_RE = re.compile(r'"[^"\n]*"?|“[^”\n]*”?|「[^」\n]*」?|『[^』\n]*』?')
+
+# Each token becomes letters of a "shape" string, one per word: b (form of
+# "to be"), l (-ly adverb), p (past participle), w (other word), c (CJK
+# character), x (被, which marks the passive in Chinese); "." ends a
+# sentence and "/" a paragraph. Sentences are then runs of letters.
+_SENTENCE_RE = re.compile(r"[a-z]+")
+_PASSIVE_RE = re.compile(r"bl?p|x")
+# A sentence with a passive, once marked P; the lookbehind keeps the scan linear
+_PASSIVE_SENTENCE_RE = re.compile(r"(?<![a-zP])[a-z]*P[a-zP]*")
+
+_VOWELS_RE = re.compile(r"[aeiouyàáâäæèéêëìíîïòóôöøœùúûüý]+")
+
+# Passive voice: a form of "to be", optionally an -ly adverb, then a past participle
+_BE_VERBS = frozenset(["am", "is", "are", "was", "were", "be", "been", "being", "isn't", "aren't", "wasn't", "weren't"])
+_IRREGULAR_PARTICIPLES = frozenset([
+    "begun", "bitten", "blown", "born", "borne", "bought", "brought", "built", "caught", "chosen",
+    "done", "drawn", "driven", "eaten", "fallen", "felt", "found", "forgotten", "forgiven", "frozen",
+    "given", "gone", "grown", "heard", "held", "hidden", "hit", "hung", "hurt", "kept", "known",
+    "laid", "led", "left", "lent", "lost", "made", "meant", "met", "paid", "put", "read", "run",
+    "said", "seen", "sent", "set", "shaken", "shot", "shown", "shut", "sold", "spent", "spoken",
+    "stolen", "struck", "sung", "taken", "taught", "thrown", "told", "torn", "understood", "won",
+    "woken", "worn", "written"
+])
+_CJK_PASSIVE = "被"
+
+# Function words are expected to repeat; they never count as repetition
+_STOPWORDS = frozenset("""
+a about after all also an and any are as at be because been but by can could did do does for from
+had has have he her him his how i if in into is it its just like me more my no not now of on one
+only or our out over she so some than that the their them then there these they this to too up us
+very was we were what when where which who will with would you your
+""".split()) | frozenset(["我们", "你们", "他们", "她们", "一个", "没有", "什么", "自己", "这个", "那个", "不是", "就是", "可以", "已经", "知道", "时候"])
+
+# Upper bounds of the sentence length histogram's buckets, in words
+SENTENCE_LENGTH_BUCKETS = (5, 10, 20, 30, 40)
+
+class TextCounts(NamedTuple):
+    characters: int
+    words: int
+    latin_words: int
+    cjk_characters: int
+    syllables: int  # Of the Latin-script words
+    paragraphs: int
+    commas: int
+    dialogue_characters: int  # Inside quotation marks, the marks included
+    passive_sentences: int
+    sentence_lengths: Counter  # Words in a sentence -> number of such sentences
+    word_frequencies: Counter  # Latin words and adjacent CJK character pairs, without function words
+
+def _syllables(word: str) -> int:
+    """Rough English syllable count: vowel groups, less a silent final e"""
+    count = len(_VOWELS_RE.findall(word))
+    if count > 1 and word.endswith("e") and not word.endswith(("le", "ee")):
+        count -= 1
+    return max(count, 1)
+
+def _word_shape(word: str) -> str:
+    if word in _BE_VERBS:
+        return "b"
+    if word in _IRREGULAR_PARTICIPLES or (len(word) > 3 and word.endswith("ed")):
+        return "p"
+    if word.endswith("ly"):
+        return "l"
+    return "w"
+
+def count_text(text: str) -> TextCounts:
+    """Counts of plain text, from a single tokenizing pass
+
+    Per-token work happens in C (Counter, str.join); Python only looks at
+    each distinct token once, however often it occurs.
+    """
+    tokens = _TOKEN_RE.findall(text)
+    token_counts = Counter(tokens)
+
+    shapes = {}
+    frequencies = Counter()
+    latin_words = cjk_characters = syllables = commas = 0
+    for token, count in token_counts.items():
+        first = token[0]
+        if first in _SENTENCE_ENDS:
+            shapes[token] = "."
+        elif first in _COMMAS:
+            shapes[token] = ""
+            commas += count
+        elif first == "\n":
+            shapes[token] = "/"
+        elif _CJK_RE.match(first):
+            shape = "c" * len(token)
+            if _CJK_PASSIVE in token:
+                shape = "".join("x" if char == _CJK_PASSIVE else "c" for char in token)
+            shapes[token] = shape
+            cjk_characters += len(token) * count
+        else:
+            word = token.lower()
+            shapes[token] = _word_shape(word)
+            frequencies[word] += count
+            latin_words += count
+            syllables += _syllables(word) * count
+
+    shape = "".join(map(shapes.__getitem__, tokens))
+    sentences = _SENTENCE_RE.findall(shape)
+    passive_sentences = len(_PASSIVE_SENTENCE_RE.findall(_PASSIVE_RE.sub("P", shape)))
+    paragraphs = sum(1 for paragraph in shape.split("/") if paragraph.strip("."))
+
+    if cjk_characters:
+        frequencies.update(_CJK_PAIR_RE.findall(text))
+    for word in _STOPWORDS.intersection(frequencies):
+        del frequencies[word]
+    return TextCounts(
+        characters=len(text),
+        words=latin_words + cjk_characters,
+        latin_words=latin_words,
+        cjk_characters=cjk_characters,
+        syllables=syllables,
+        paragraphs=paragraphs,
+        commas=commas,
+        dialogue_characters=sum(map(len, _DIALOGUE_RE.findall(text))),
+        passive_sentences=passive_sentences,
+        sentence_lengths=Counter(map(len, sentences)),
+        word_frequencies=frequencies
+    )
+
+def merge_counts(counts: Iterable[TextCounts]) -> TextCounts:
+    """Counts of several texts taken together, e.g. every document of a project"""
+    summed = len(TextCounts._fields) - 2  # Every field but the two counters
+    totals = [0] * summed
+    sentence_lengths = Counter()
+    frequencies = Counter()
+    for item in counts:
+        for index in range(summed):
+            totals[index] += item[index]
+        sentence_lengths.update(item.sentence_lengths)
+        frequencies.update(item.word_frequencies)
+    return TextCounts(*totals, sentence_lengths, frequencies)
+
+def _percentile(lengths: Counter, sentences: int, fraction: float) -> int:
+    """Sentence length below which the given fraction of sentences fall"""
+    rank = max(math.ceil(sentences * fraction), 1)
+    seen = 0
+    for length in sorted(lengths):
+        seen += lengths[length]
+        if seen >= rank:
+            return length
+    return 0
+
+def _histogram(lengths: Counter) -> List[Dict]:
+    buckets = []
+    lower = 1
+    for upper in SENTENCE_LENGTH_BUCKETS:
+        buckets.append({
+            "words": f"{lower}-{upper}",
+            "sentences": sum(count for length, count in lengths.items() if lower <= length <= upper)
+        })
+        lower = upper + 1
+    buckets.append({
+        "words": f"{lower}+",
+        "sentences": sum(count for length, count in lengths.items() if length >= lower)
+    })
+    return buckets
+
+def _repetition_threshold(words: int) -> int:
+    """Uses of one word beyond which it counts as repeated: 3, or 1% of a longer text"""
+    return max(3, math.ceil(words * 0.01))
+
+def describe(counts: TextCounts, top_words: int = 5) -> Dict:
+    """Readability and style metrics from a text's counts"""
+    lengths = counts.sentence_lengths
+    sentences = sum(lengths.values())
+    mean = sum(length * count for length, count in lengths.items()) / sentences if sentences else 0.0
+
+    # Flesch reading ease only means something for Latin-script (mostly English) text
+    reading_ease = None
+    if sentences and counts.latin_words and counts.latin_words >= counts.cjk_characters:
+        reading_ease = round(
+            206.835 - 1.015 * (counts.words / sentences) - 84.6 * (counts.syllables / counts.latin_words),
+            1
+        )
+
+    threshold = _repetition_threshold(counts.words)
+    repeated = [
+        {"word": word, "count": count}
+        for word, count in counts.word_frequencies.most_common(top_words)
+        if count > threshold
+    ]
+    return {
+        "characters": counts.characters,
+        "words": counts.words,
+        "sentences": sentences,
+        "paragraphs": counts.paragraphs,
+        "reading_ease": reading_ease,
+        "sentence_length": {
+            "mean": round(mean, 1),
+            "median": _percentile(lengths, sentences, 0.5),
+            "p90": _percentile(lengths, sentences, 0.9),
+            "longest": max(lengths, default=0),
+            "histogram": _histogram(lengths)
+        },
+        "dialogue_ratio": round(counts.dialogue_characters / counts.characters, 3) if counts.characters else 0.0,
+        "passive_ratio": round(counts.passive_sentences / sentences, 3) if sentences else 0.0,
+        "repeated_words": repeated
+    }
+
+def text_issues(text: str) -> List[str]:
+    """Problems worth pointing out in a passage, from its metrics"""
+    counts = count_text(text)
+    metrics = describe(counts, top_words=3)
+    issues = []
+
+    if len(text) < 50:
+        issues.append("Text is too short, content is insufficient")
+    elif len(text) > 1000:
+        issues.append("Text is too long, suggest paragraphing or simplification")
+
+    # A CJK character is a word, so CJK sentences run to more words
+    mostly_cjk = counts.cjk_characters > counts.latin_words
+    long_sentence, short_sentence = (50, 10) if mostly_cjk else (25, 4)
+    sentence_length = metrics["sentence_length"]
+    if metrics["sentences"]:
+        if sentence_length["mean"] > long_sentence:
+            issues.append("Average sentence length is too long, affecting reading fluency")
+        elif sentence_length["mean"] < short_sentence:
+            issues.append("Sentences are too short, expression may be incomplete")
+        if metrics["sentences"] > 1 and sentence_length["longest"] > long_sentence * 2:
+            issues.append(f"Some sentences run to {sentence_length['longest']} words, consider splitting them")
+
+    if metrics["reading_ease"] is not None and metrics["sentences"] >= 3 and metrics["reading_ease"] < 30:
+        issues.append(f"Text is hard to read (Flesch reading ease {metrics['reading_ease']}), prefer shorter words and sentences")
+
+    if counts.words > 10 and metrics["repeated_words"]:
+        issues.append(f"Excessive word repetition: {', '.join(item['word'] for item in metrics['repeated_words'])}")
+
+    if metrics["sentences"] >= 4 and metrics["passive_ratio"] > 0.25:
+        issues.append(
+            f"Frequent passive voice ({counts.passive_sentences} of {metrics['sentences']} sentences), prefer active verbs"
+        )
+
+    if counts.paragraphs <= 1 and len(text) > 200:
+        issues.append("Lack of paragraph separation, suggest paragraphing to improve readability")
+
+    if counts.commas > metrics["sentences"] * 2:
+        issues.append("Excessive comma usage, suggest appropriate use of periods")
+
+    return issues
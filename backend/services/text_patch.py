@@ -0,0 +1,33 @@
+"""
+Apply editor text edits to document content
+"""
+from typing import Iterable, Tuple
+
+# (start, end, replacement) with offsets in UTF-16 code units
+Edit = Tuple[int, int, str]
+
+def apply_edits(content: str, edits: Iterable[Edit]) -> str:
+    """Splice non-overlapping edits, all made against the same base text, into content
+
+    Offsets count UTF-16 code units because that is how the browser measures
+    strings; characters outside the BMP take two units there but one in Python.
+    Raises ValueError if an edit is out of range or overlaps another.
+    """
+    units = content.encode("utf-16-le")
+    length = len(units) // 2
+    parts = []
+    position = length
+
+    # Apply from the end so earlier offsets stay valid
+    for start, end, text in sorted(edits, key=lambda edit: (edit[0], edit[1]), reverse=True):
+        if not 0 <= start <= end <= position:
+            raise ValueError(f"Edit {start}-{end} is out of range or overlaps another edit")
+        parts.append(units[2 * end:2 * position])
+        parts.append(text.encode("utf-16-le"))
+        position = start
+    parts.append(units[:2 * position])
+
+    try:
+        return b"".join(reversed(parts)).decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise ValueError("Edit splits a surrogate pair")
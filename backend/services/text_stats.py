@@ -0,0 +1,105 @@
+"""
+Word and character counts for document content
+"""
+import html
+import re
+from typing import List, Tuple
+
+# Editor content is HTML; tags never count as words
+_TAG_RE = re.compile(r"<[^>]+>")
+
+# Each CJK character (and kana/hangul syllable) counts as one word, as in
+# common CJK word processors; other scripts count runs of letters/digits
+CJK_CHARS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_WORD_RE = re.compile(rf"[{CJK_CHARS}]|[^\W{CJK_CHARS}]+(?:['\u2019-][^\W_{CJK_CHARS}]+)*")
+_CJK_RE = re.compile(rf"[{CJK_CHARS}]")
+
+def plain_text(content: str) -> str:
+    """Strip markup and entities from editor HTML"""
+    return html.unescape(_TAG_RE.sub(" ", content))
+
+def count_words(content: str) -> int:
+    """Number of words in a document's content"""
+    if not content:
+        return 0
+    return sum(1 for _ in _WORD_RE.finditer(plain_text(content)))
+
+def word_tokens(text: str) -> List[str]:
+    """Lowercased words of plain text, each CJK character on its own"""
+    return _WORD_RE.findall(text.lower())
+
+def count_chars(content: str) -> int:
+    """Number of characters in a document's content, not counting whitespace"""
+    if not content:
+        return 0
+    return sum(len(chunk) for chunk in plain_text(content).split())
+
+def common_prefix_length(a: str, b: str, limit: int) -> int:
+    """Length of the common prefix, found by comparing halves so the work stays in C"""
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def common_suffix_length(a: str, b: str, limit: int) -> int:
+    """Length of the common suffix, at most limit"""
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def _is_break(char: str) -> bool:
+    """Whether no word runs across this character: whitespace, a tag edge or a CJK character"""
+    return char.isspace() or char in "<>" or _CJK_RE.match(char) is not None
+
+def _region_start(content: str, position: int) -> int:
+    """Move position back to where the plain text is split between words"""
+    # Inside a tag, which starts at the first "<" after the last ">"
+    tag_start = content.find("<", content.rfind(">", 0, position) + 1, position)
+    if tag_start != -1:
+        return tag_start
+    while position > 0 and not _is_break(content[position - 1]):
+        position -= 1
+    return position
+
+def _region_end(content: str, position: int) -> int:
+    """Move position forward to where the plain text is split between words"""
+    tag_end = content.find(">", position)
+    next_tag = content.find("<", position)
+    if tag_end != -1 and (next_tag == -1 or tag_end < next_tag):
+        return tag_end + 1
+    while position < len(content) and not _is_break(content[position]):
+        position += 1
+    return position
+
+def updated_counts(old: str, new: str, old_words: int, old_chars: int) -> Tuple[int, int]:
+    """Word and character counts of new content from those of the old, counting only what changed
+
+    The changed span is widened to word and tag boundaries, which it shares
+    with the unchanged text around it, so counts of the unchanged parts
+    carry over and only the widened span is counted in old and new.
+    """
+    old = old or ""
+    new = new or ""
+    shortest = min(len(old), len(new))
+    prefix = common_prefix_length(old, new, shortest)
+    suffix = common_suffix_length(old, new, shortest - prefix)
+    start = _region_start(old, prefix)
+    tail = len(old) - _region_end(old, len(old) - suffix)
+    old_part = old[start:len(old) - tail]
+    new_part = new[start:len(new) - tail]
+    # An edit that leaves a tag unclosed changes how the text after it parses
+    if old_part.rfind("<") > old_part.rfind(">") or new_part.rfind("<") > new_part.rfind(">"):
+        return count_words(new), count_chars(new)
+    return (
+        old_words - count_words(old_part) + count_words(new_part),
+        old_chars - count_chars(old_part) + count_chars(new_part)
+    )
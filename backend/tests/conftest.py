@@ -0,0 +1,111 @@
+"""
+Shared fixtures: a fresh SQLite database per test, the app driven in-process
+through httpx, and fake AI providers in place of the real ones
+"""
+import os
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+# Settings are read at import time, so the environment is set up first
+_TEMP_DIR = tempfile.mkdtemp(prefix="writingway-tests-")
+DATABASE_PATH = os.path.join(_TEMP_DIR, "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_PATH}"
+os.environ["UPLOAD_DIR"] = os.path.join(_TEMP_DIR, "uploads")
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["AI_CACHE_ENABLED"] = "false"
+os.environ["OPENAI_API_KEY"] = ""
+os.environ["GEMINI_API_KEY"] = ""
+
+import httpx
+import pytest
+
+import main
+from services.provider_router import Provider, ProviderRouter
+
+class FakeProvider:
+    """Provider stand-in: a blocking call that sleeps, then answers or raises"""
+
+    def __init__(self, name: str, reply: str = "A fake reply.", delay: float = 0.0, fail: bool = False):
+        self.name = name
+        self.reply = reply
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def call(self, messages: List[Dict[str, str]]) -> str:
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+        return self.reply
+
+    def stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+        for word in self.reply.split(" "):
+            yield word + " "
+
+    def provider(self) -> Provider:
+        return Provider(self.name, self.call, self.stream)
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def app():
+    """The application with its lifespan running on an empty database"""
+    if os.path.exists(DATABASE_PATH):
+        os.remove(DATABASE_PATH)
+    async with main.app.router.lifespan_context(main.app):
+        yield main.app
+
+@pytest.fixture
+async def client(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+        yield client
+
+async def register(client: httpx.AsyncClient, username: str) -> Dict[str, str]:
+    """Create a user and return the Authorization header of a fresh login"""
+    await client.post("/api/auth/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "correct horse"
+    })
+    response = await client.post("/api/auth/login", json={"username": username, "password": "correct horse"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture
+async def auth_headers(client) -> Dict[str, str]:
+    return await register(client, "writer")
+
+def use_fake_providers(app, *fakes: FakeProvider, router: Optional[ProviderRouter] = None) -> ProviderRouter:
+    """Route the app's AI calls to fake providers instead of OpenAI/Gemini"""
+    ai_service = app.state.ai_service
+    ai_service.router.close()
+    ai_service.openai_client = ai_service.openai_client or object()  # Passes the "configured" check
+    ai_service.router = router or ProviderRouter([fake.provider() for fake in fakes])
+    return ai_service.router
+
+def asgi_scope(method: str, path: str, headers: Dict[str, str], query_string: str = "", spec_version: str = "2.3") -> Dict[str, Any]:
+    """HTTP scope for calling the app directly, where a test needs its own receive/send"""
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"test"), (b"content-type", b"application/json")]
+                   + [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "client": ("127.0.0.1", 1234),
+        "server": ("test", 80),
+        "state": {}
+    }
@@ -0,0 +1,100 @@
+"""
+Admission control: weighted requests take a global slot per call they run
+and count once against their user's cap
+"""
+import asyncio
+import json
+import threading
+from typing import Dict, List
+
+import pytest
+
+from core.admission import AdmissionController
+from tests.conftest import FakeProvider, use_fake_providers
+
+pytestmark = pytest.mark.anyio
+
+async def test_weighted_request_takes_slots_but_counts_once_per_user():
+    admission = AdmissionController(max_concurrent=8, max_per_user=2, max_queue=8, queue_timeout=1)
+
+    admitted_at = await admission.acquire(1, weight=4)
+    assert admission.metrics()["in_flight"] == 4
+    # The user's second request still fits under a cap of 2
+    async with admission.admit(1):
+        assert admission.metrics()["in_flight"] == 5
+
+    admission.release(1, admitted_at, weight=4)
+    assert admission.metrics()["in_flight"] == 0
+
+async def test_weighted_requests_wait_for_each_other_without_deadlock():
+    admission = AdmissionController(max_concurrent=4, max_per_user=4, max_queue=8, queue_timeout=5)
+    running = []
+
+    async def batch(user_id: int):
+        async with admission.admit(user_id, weight=3):
+            running.append(admission.metrics()["in_flight"])
+            await asyncio.sleep(0.05)
+
+    await asyncio.wait_for(asyncio.gather(batch(1), batch(2), batch(3)), timeout=2)
+    assert running == [3, 3, 3]
+    assert admission.metrics()["in_flight"] == 0
+
+async def test_weight_is_capped_at_the_global_limit():
+    admission = AdmissionController(max_concurrent=2, max_per_user=2, max_queue=2, queue_timeout=0.5)
+    async with admission.admit(1, weight=10):
+        assert admission.metrics()["in_flight"] == 2
+    assert admission.metrics()["in_flight"] == 0
+
+async def test_abandoned_weighted_wait_gives_its_slots_back():
+    admission = AdmissionController(max_concurrent=4, max_per_user=4, max_queue=8, queue_timeout=0.1)
+    admitted_at = await admission.acquire(1, weight=2)
+
+    with pytest.raises(Exception) as rejected:
+        await admission.acquire(2, weight=4)
+    assert rejected.value.status_code == 503
+
+    admission.release(1, admitted_at, weight=2)
+    async with admission.admit(2, weight=4):
+        assert admission.metrics()["in_flight"] == 4
+
+class CountingProvider(FakeProvider):
+    """Fake provider that records how many calls overlap and what admission held meanwhile"""
+
+    def __init__(self, admission: AdmissionController, **kwargs):
+        # Named after a real provider: writing assistance looks up its model by name
+        super().__init__("openai", **kwargs)
+        self.admission = admission
+        self.lock = threading.Lock()
+        self.active = 0
+        self.overlap: List[int] = []
+        self.in_flight: List[int] = []
+
+    def call(self, messages: List[Dict[str, str]]) -> str:
+        with self.lock:
+            self.active += 1
+            self.overlap.append(self.active)
+            self.in_flight.append(self.admission.metrics()["in_flight"])
+        try:
+            return super().call(messages)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+async def test_batch_holds_a_slot_per_item_in_flight(app, client, auth_headers):
+    admission = AdmissionController(max_concurrent=16, max_per_user=3, max_queue=16, queue_timeout=10)
+    app.state.admission = admission
+    fake = CountingProvider(admission, delay=0.05)
+    use_fake_providers(app, fake)
+
+    response = await client.post("/api/ai/writing-assistance/batch", json={
+        "texts": [f"Passage {i}." for i in range(10)],
+        "assistance_type": "improve"
+    }, headers=auth_headers)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert sorted(line["index"] for line in lines) == list(range(10))
+    assert all("error" not in line for line in lines)
+    # Never more calls at once than the batch holds slots for
+    assert max(fake.overlap) <= min(fake.in_flight)
+    assert min(fake.in_flight) == 4
+    assert admission.metrics()["in_flight"] == 0
@@ -0,0 +1,114 @@
+"""
+Provider clients are built once and keep their connections: against a local
+OpenAI-compatible endpoint, a shared registry skips the per-request client
+setup and reuses one keep-alive connection
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List
+
+import pytest
+
+from core.config import settings
+from services.ai_providers import AIProviderRegistry
+from services.ai_service import AIService
+
+CALLS = 50
+MESSAGES = [{"role": "user", "content": "Suggest a title."}]
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers every chat completion with the same reply, keeping the connection open"""
+
+    protocol_version = "HTTP/1.1"
+    # Send headers and body as one write, as real servers do; separate small
+    # writes on a kept-alive connection would wait on delayed ACKs
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    connections: List[int] = []
+
+    def setup(self):
+        super().setup()
+        self.connections.append(1)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "gpt-3.5-turbo",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "The Quiet Town"},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 3, "total_tokens": 8}
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def fake_openai(monkeypatch) -> Iterator[List[int]]:
+    """Point the OpenAI client at a local server; yields its list of accepted connections"""
+    FakeOpenAIHandler.connections = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(settings, "openai_api_key", "sk-test")
+    monkeypatch.setattr(settings, "openai_base_url", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(settings, "gemini_api_key", None)
+    try:
+        yield FakeOpenAIHandler.connections
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def call_per_request() -> str:
+    """What every request did before: build the clients, call once, throw them away"""
+    registry = AIProviderRegistry()
+    service = AIService(registry)
+    try:
+        return service.chat_without_fallback(MESSAGES)
+    finally:
+        service.close()
+        registry.close()
+
+@pytest.mark.benchmark
+def test_shared_registry_saves_per_request_overhead(fake_openai):
+    call_per_request()  # Imports and first-use setup stay out of the timings
+    del fake_openai[:]
+
+    started = time.perf_counter()
+    replies = [call_per_request() for _ in range(CALLS)]
+    per_request = time.perf_counter() - started
+    per_request_connections = len(fake_openai)
+    del fake_openai[:]
+
+    registry = AIProviderRegistry()
+    service = AIService(registry)
+    try:
+        started = time.perf_counter()
+        replies += [service.chat_without_fallback(MESSAGES) for _ in range(CALLS)]
+        shared = time.perf_counter() - started
+    finally:
+        service.close()
+        registry.close()
+    shared_connections = len(fake_openai)
+
+    print(f"\n{CALLS} chat calls to a local OpenAI-compatible server: "
+          f"clients per request {per_request * 1000 / CALLS:.2f} ms/call over {per_request_connections} connections, "
+          f"shared registry {shared * 1000 / CALLS:.2f} ms/call over {shared_connections} connection(s)")
+
+    assert replies == ["The Quiet Town"] * (2 * CALLS)
+    assert per_request_connections == CALLS
+    assert shared_connections == 1
+    assert shared < per_request / 2
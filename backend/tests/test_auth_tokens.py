@@ -0,0 +1,90 @@
+"""
+Refresh tokens rotate on every use; replaying an old one revokes its whole
+login, except right after rotation, when another tab may have raced the refresh
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from core.config import settings
+from database.database import SessionLocal
+from database.models import RefreshToken
+
+pytestmark = pytest.mark.anyio
+
+async def login(client) -> dict:
+    await client.post("/api/auth/register", json={
+        "username": "writer", "email": "writer@example.com", "password": "correct horse"
+    })
+    response = await client.post("/api/auth/login", json={"username": "writer", "password": "correct horse"})
+    assert response.status_code == 200
+    return response.json()
+
+async def refresh(client, token: str):
+    return await client.post("/api/auth/refresh", json={"refresh_token": token})
+
+def age_tokens(**values) -> None:
+    """Move token timestamps, e.g. used_at, into the past"""
+    with SessionLocal() as db:
+        db.execute(update(RefreshToken).values(**values))
+        db.commit()
+
+async def test_refresh_rotates_the_token(client):
+    tokens = await login(client)
+
+    response = await refresh(client, tokens["refresh_token"])
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    me = await client.get("/api/auth/me", headers={"Authorization": f"Bearer {rotated['access_token']}"})
+    assert me.json()["username"] == "writer"
+
+    # The new token rotates in turn
+    assert (await refresh(client, rotated["refresh_token"])).status_code == 200
+
+async def test_reuse_after_the_grace_window_revokes_the_family(client):
+    tokens = await login(client)
+    rotated = (await refresh(client, tokens["refresh_token"])).json()
+    age_tokens(used_at=datetime.utcnow() - timedelta(seconds=settings.refresh_token_reuse_grace_seconds + 1))
+
+    assert (await refresh(client, tokens["refresh_token"])).status_code == 401
+    # The legitimate holder of the newest token is logged out as well
+    assert (await refresh(client, rotated["refresh_token"])).status_code == 401
+
+async def test_reuse_within_the_grace_window_gets_a_token(client):
+    tokens = await login(client)
+    first = await refresh(client, tokens["refresh_token"])
+    # A second tab still holding the old token refreshes a moment later
+    second = await refresh(client, tokens["refresh_token"])
+    assert second.status_code == 200
+
+    assert (await refresh(client, first.json()["refresh_token"])).status_code == 200
+    assert (await refresh(client, second.json()["refresh_token"])).status_code == 200
+
+async def test_expired_token_is_rejected(client):
+    tokens = await login(client)
+    age_tokens(expires_at=datetime.utcnow() - timedelta(seconds=1))
+
+    assert (await refresh(client, tokens["refresh_token"])).status_code == 401
+    assert (await refresh(client, "not-a-token")).status_code == 401
+
+async def test_logout_revokes_the_family(client):
+    tokens = await login(client)
+    rotated = (await refresh(client, tokens["refresh_token"])).json()
+
+    response = await client.post("/api/auth/logout", json={"refresh_token": rotated["refresh_token"]})
+    assert response.status_code == 200
+    assert (await refresh(client, rotated["refresh_token"])).status_code == 401
+    # Logging out without a token still succeeds
+    assert (await client.post("/api/auth/logout")).status_code == 200
+
+async def test_login_prunes_expired_tokens(client):
+    await login(client)
+    await login(client)
+    age_tokens(expires_at=datetime.utcnow() - timedelta(seconds=1))
+
+    tokens = await login(client)
+    with SessionLocal() as db:
+        assert db.execute(select(func.count()).select_from(RefreshToken)).scalar() == 1
+    assert (await refresh(client, tokens["refresh_token"])).status_code == 200
@@ -0,0 +1,141 @@
+"""
+Bulk document operations: refs resolve within the batch, results come back
+one per operation, and any failure leaves the project as it was
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def create_project(client, headers, name: str = "Novel") -> int:
+    return (await client.post("/api/projects/", json={"name": name}, headers=headers)).json()["id"]
+
+async def create_document(client, headers, project_id: int, title: str, content: str = "") -> dict:
+    response = await client.post("/api/documents/", json={
+        "title": title, "project_id": project_id, "content": content
+    }, headers=headers)
+    return response.json()
+
+async def bulk(client, headers, project_id: int, *operations: dict):
+    return await client.post(f"/api/documents/project/{project_id}/bulk",
+                             json={"operations": list(operations)}, headers=headers)
+
+async def outline(client, headers, project_id: int) -> list:
+    """(title, [child titles]) of the top-level documents in order"""
+    tree = (await client.get(f"/api/projects/{project_id}/tree", headers=headers)).json()
+    return [(node["title"], [child["title"] for child in node["children"]]) for node in tree]
+
+async def test_refs_resolve_within_the_batch(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    loose = await create_document(client, auth_headers, project_id, "Loose scene")
+
+    response = await bulk(
+        client, auth_headers, project_id,
+        # A child can come before the chapter it names
+        {"op": "create", "parent_ref": "one", "title": "Scene 1.1", "order_index": 0},
+        {"op": "create", "ref": "one", "title": "Chapter 1", "document_type": "chapter", "order_index": 0},
+        {"op": "create", "ref": "two", "title": "Chapter 2", "document_type": "chapter", "order_index": 1},
+        {"op": "create", "ref": "nested", "parent_ref": "two", "title": "Scene 2.1", "order_index": 0},
+        {"op": "create", "parent_ref": "nested", "title": "Beat 2.1.1"},
+        {"op": "reorder", "id": loose["id"], "parent_ref": "one", "order_index": 1}
+    )
+    assert response.status_code == 200
+
+    assert await outline(client, auth_headers, project_id) == [
+        ("Chapter 1", ["Scene 1.1", "Loose scene"]), ("Chapter 2", ["Scene 2.1"])
+    ]
+    tree = (await client.get(f"/api/projects/{project_id}/tree", headers=auth_headers)).json()
+    assert [child["title"] for child in tree[1]["children"][0]["children"]] == ["Beat 2.1.1"]
+
+INVALID_BATCHES = [
+    ([{"op": "create", "title": "A", "parent_ref": "missing"}], 400),
+    ([{"op": "create", "title": "A", "ref": "x"}, {"op": "create", "title": "B", "ref": "x"}], 400),
+    ([{"op": "create"}], 400),
+    ([{"op": "update", "title": "No id"}], 400),
+    ([{"op": "rename", "id": 1}], 400),
+    ([{"op": "create", "title": "Valid"}, {"op": "delete", "id": 999}], 404)
+]
+
+async def test_invalid_batches_are_rejected_before_writing(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    await create_document(client, auth_headers, project_id, "Existing")
+
+    for operations, status_code in INVALID_BATCHES:
+        response = await bulk(client, auth_headers, project_id, *operations)
+        assert response.status_code == status_code, operations
+    assert await outline(client, auth_headers, project_id) == [("Existing", [])]
+
+async def test_each_operation_gets_its_result(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    first = await create_document(client, auth_headers, project_id, "First", "<p>Old words</p>")
+    second = await create_document(client, auth_headers, project_id, "Second")
+    third = await create_document(client, auth_headers, project_id, "Third")
+
+    response = await bulk(
+        client, auth_headers, project_id,
+        {"op": "update", "id": first["id"], "version": first["version"], "content": "<p>New words here</p>"},
+        {"op": "create", "ref": "new", "title": "Fourth"},
+        {"op": "reorder", "id": second["id"], "order_index": 5},
+        {"op": "delete", "id": third["id"]},
+        {"op": "update", "id": second["id"], "title": "Renamed"}
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(result["op"], result["ref"]) for result in results] == [
+        ("update", None), ("create", "new"), ("reorder", None), ("delete", None), ("update", None)
+    ]
+    assert [result["id"] for result in results[2:]] == [second["id"], third["id"], second["id"]]
+    # The content update made a new version; field changes do not
+    assert results[0] == {"op": "update", "id": first["id"], "ref": None, "version": first["version"] + 1}
+    assert results[2]["version"] == second["version"]
+
+    created = (await client.get(f"/api/documents/{results[1]['id']}", headers=auth_headers)).json()
+    assert created["title"] == "Fourth"
+    assert results[1]["version"] == created["version"]
+    assert (await client.get(f"/api/documents/{third['id']}", headers=auth_headers)).status_code == 404
+
+    stats = (await client.get(f"/api/projects/{project_id}/stats", headers=auth_headers)).json()
+    assert (stats["word_count"], stats["document_count"]) == (3, 3)
+
+async def test_version_conflict_rolls_back_the_whole_batch(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    first = await create_document(client, auth_headers, project_id, "First", "<p>Draft one</p>")
+    second = await create_document(client, auth_headers, project_id, "Second", "<p>Draft two</p>")
+    third = await create_document(client, auth_headers, project_id, "Third", "<p>Draft three</p>")
+    # Someone else saves the second document first
+    await client.put(f"/api/documents/{second['id']}", json={"content": "<p>Their edit</p>"}, headers=auth_headers)
+    stats_before = (await client.get(f"/api/projects/{project_id}/stats", headers=auth_headers)).json()
+
+    response = await bulk(
+        client, auth_headers, project_id,
+        {"op": "create", "ref": "chapter", "title": "Chapter", "document_type": "chapter"},
+        {"op": "reorder", "id": first["id"], "parent_ref": "chapter"},
+        {"op": "update", "id": first["id"], "version": first["version"], "content": "<p>My first edit</p>"},
+        {"op": "update", "id": second["id"], "version": second["version"], "content": "<p>My stale edit</p>"},
+        {"op": "update", "id": third["id"], "title": "Renamed"},
+        {"op": "delete", "id": third["id"]}
+    )
+    assert response.status_code == 409
+
+    assert await outline(client, auth_headers, project_id) == [("First", []), ("Second", []), ("Third", [])]
+    saved = {
+        document["title"]: document
+        for document in (await client.get(f"/api/documents/project/{project_id}", headers=auth_headers)).json()
+    }
+    assert saved["First"]["content"] == "<p>Draft one</p>"
+    assert saved["First"]["version"] == first["version"]
+    assert saved["Second"]["content"] == "<p>Their edit</p>"
+    assert (await client.get(f"/api/projects/{project_id}/stats", headers=auth_headers)).json() == stats_before
+    search = await client.get(f"/api/projects/{project_id}/search", params={"q": "chapter"}, headers=auth_headers)
+    assert search.json() == []
+
+async def test_documents_of_other_projects_are_not_found(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    other_project = await create_project(client, auth_headers, "Other")
+    elsewhere = await create_document(client, auth_headers, other_project, "Elsewhere")
+
+    response = await bulk(client, auth_headers, project_id,
+                          {"op": "create", "title": "Here", "parent_id": elsewhere["id"]})
+    assert response.status_code == 404
+    response = await bulk(client, auth_headers, project_id, {"op": "delete", "id": elsewhere["id"]})
+    assert response.status_code == 404
+    assert await outline(client, auth_headers, other_project) == [("Elsewhere", [])]
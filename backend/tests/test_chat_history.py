@@ -0,0 +1,60 @@
+"""
+Chat turns are stored with distinct, gapless positions however they interleave,
+and legacy message blobs are moved in front of them
+"""
+import asyncio
+
+import pytest
+
+from core.admission import AdmissionController
+from database.database import SessionLocal, engine
+from database.models import AIConversation, AIMessage
+from database.schema_upgrade import upgrade_schema
+from tests.conftest import FakeProvider, use_fake_providers
+
+pytestmark = pytest.mark.anyio
+
+async def test_parallel_stream_turns_get_distinct_positions(app, client, auth_headers):
+    use_fake_providers(app, FakeProvider("fake", delay=0.05))
+    app.state.admission = AdmissionController(max_concurrent=10, max_per_user=10, max_queue=10, queue_timeout=30)
+    project = (await client.post("/api/projects/", json={"name": "Novel"}, headers=auth_headers)).json()
+    await client.post("/api/ai/chat", json={"message": "Hello", "project_id": project["id"]}, headers=auth_headers)
+    
+    responses = await asyncio.gather(*(
+        client.post("/api/ai/chat/stream", json={"message": f"Q{i}", "project_id": project["id"]}, headers=auth_headers)
+        for i in range(5)
+    ))
+    assert all("event: done" in response.text for response in responses)
+    history = await client.get(f"/api/ai/conversations/{project['id']}", headers=auth_headers)
+    assert len(history.json()["messages"]) == 12
+
+async def test_legacy_blob_goes_before_turns_added_since(app, client, auth_headers):
+    use_fake_providers(app, FakeProvider("fake", reply="New answer."))
+    project = (await client.post("/api/projects/", json={"name": "Novel"}, headers=auth_headers)).json()
+    for message in ("New question 1", "New question 2"):
+        await client.post("/api/ai/chat", json={"message": message, "project_id": project["id"]}, headers=auth_headers)
+    
+    # The deploy moved chat to ai_messages before the old blob was migrated
+    legacy = [
+        {"role": "user", "content": "Old question"},
+        {"role": "assistant", "content": "Old answer."}
+    ]
+    with SessionLocal() as db:
+        conversation = db.query(AIConversation).one()
+        conversation.messages = legacy
+        conversation.summary_seq = 2
+        db.commit()
+    
+    with engine.begin() as connection:
+        assert "ai_messages" in upgrade_schema(connection)
+        assert "ai_messages" not in upgrade_schema(connection)
+    
+    history = await client.get(f"/api/ai/conversations/{project['id']}", headers=auth_headers)
+    contents = [message["content"] for message in history.json()["messages"]]
+    assert contents == ["Old question", "Old answer.", "New question 1", "New answer.", "New question 2", "New answer."]
+    with SessionLocal() as db:
+        assert [seq for seq, in db.query(AIMessage.seq).order_by(AIMessage.seq)] == [1, 2, 3, 4, 5, 6]
+        conversation = db.query(AIConversation).one()
+        assert conversation.messages is None
+        # The summary still covers the same turns, and the older ones before them
+        assert conversation.summary_seq == 4
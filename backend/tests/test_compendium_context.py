@@ -0,0 +1,119 @@
+"""
+Compendium mentions: the token matcher finds whole names however they
+overlap, cached matchers are dropped when entries change, and a long
+chapter is scanned in milliseconds
+"""
+import random
+import time
+
+import pytest
+from sqlalchemy import update
+
+from database.database import SessionLocal
+from database.models import CompendiumEntry
+from services.compendium_context import CompendiumMatcher, compendium_context, compendium_matchers
+
+pytestmark = pytest.mark.anyio
+
+def test_overlapping_names_all_match():
+    matcher = CompendiumMatcher([(1, "Ann"), (2, "Ann Lee"), (3, "Lee"), (4, "Lee Harbour Watch")])
+
+    assert matcher.find("Ann Lee met Lee at the Lee Harbour Watch.") == {1: 1, 2: 1, 3: 3, 4: 1}
+    # A longer name that breaks off still leaves the shorter ones found
+    assert matcher.find("Lee Harbour was quiet.") == {3: 1}
+
+def test_matching_ignores_case_and_needs_whole_words():
+    matcher = CompendiumMatcher([(1, "Ann"), (2, "the Grey Tower")])
+
+    assert matcher.find("ANN climbed THE GREY  TOWER.") == {1: 1, 2: 1}
+    assert matcher.find("Annual reports from Joann and the Greyhound tower.") == {}
+    # Punctuation and line breaks between words do not get in the way
+    assert matcher.find("the grey,\ntower; (Ann)") == {2: 1, 1: 1}
+
+def test_counts_are_per_entry_in_order_of_first_mention():
+    matcher = CompendiumMatcher([(1, "Mara"), (1, "the Captain"), (2, "Ivo"), (3, "Unused")])
+
+    counts = matcher.find("Ivo saw the captain. Mara nodded; Ivo left.")
+    assert counts == {2: 2, 1: 2}
+    assert list(counts) == [2, 1]
+
+def test_cjk_names_match_inside_unbroken_text():
+    matcher = CompendiumMatcher([(1, "小明"), (2, "王小明"), (3, "东京")])
+
+    assert matcher.find("昨天我见到王小明了，小明很高兴。") == {2: 1, 1: 2}
+    assert matcher.find("他住在京都。") == {}
+
+async def create_entry(client, headers, project_id: int, title: str, content: str, **fields) -> dict:
+    response = await client.post("/api/compendium/", json={
+        "project_id": project_id, "title": title, "content": content, **fields
+    }, headers=headers)
+    return response.json()
+
+def context_for(user_id: int, document_id: int) -> str:
+    with SessionLocal() as db:
+        return compendium_context(db, user_id, document_id, 1000) or ""
+
+async def test_cached_matcher_is_dropped_when_entries_change(client, auth_headers):
+    user_id = (await client.get("/api/auth/me", headers=auth_headers)).json()["id"]
+    project_id = (await client.post("/api/projects/", json={"name": "Novel"}, headers=auth_headers)).json()["id"]
+    document = (await client.post("/api/documents/", json={
+        "title": "Scene", "project_id": project_id,
+        "content": "<p>Mara met the Captain by the Lighthouse.</p>"
+    }, headers=auth_headers)).json()
+    mara = await create_entry(client, auth_headers, project_id, "Mara", "A smuggler.")
+
+    assert "## Mara" in context_for(user_id, document["id"])
+    assert compendium_matchers.get(project_id) is not None
+
+    # A new entry
+    lighthouse = await create_entry(client, auth_headers, project_id, "Lighthouse", "Dark for years.")
+    assert compendium_matchers.get(project_id) is None
+    assert "## Lighthouse" in context_for(user_id, document["id"])
+
+    # A rename, and a new alias
+    await client.put(f"/api/compendium/{mara['id']}", json={"title": "Marta", "aliases": ["the Captain"]},
+                     headers=auth_headers)
+    context = context_for(user_id, document["id"])
+    assert "## Marta" in context and "## Mara" not in context
+
+    # A deletion
+    await client.delete(f"/api/compendium/{lighthouse['id']}", headers=auth_headers)
+    assert "## Lighthouse" not in context_for(user_id, document["id"])
+
+    # A bulk statement, which does not say what it changed
+    assert compendium_matchers.get(project_id) is not None
+    with SessionLocal() as db:
+        db.execute(update(CompendiumEntry).values(aliases=[]))
+        db.commit()
+    assert compendium_matchers.get(project_id) is None
+    assert context_for(user_id, document["id"]) == ""
+
+@pytest.mark.benchmark
+def test_matcher_benchmark_with_two_thousand_entries():
+    rng = random.Random(7)
+    syllables = ["ka", "ri", "to", "mel", "an", "dor", "is", "vel", "su", "ne", "ra", "th"]
+    names = {" ".join("".join(rng.choice(syllables) for _ in range(3)).title()
+                      for _ in range(rng.randint(1, 3))) for _ in range(2500)}
+    names = sorted(names)[:2000]
+    words = "the rain fell over the harbour while she waited by the door and listened".split()
+    chapter = " ".join(rng.choice(names) if rng.random() < 0.01 else rng.choice(words) for _ in range(50_000))
+    chinese = "".join(rng.choice(["王小明", "李华", "他们在雨中慢慢地走着没有说话", "。"]) for _ in range(4_000))
+
+    started = time.perf_counter()
+    matcher = CompendiumMatcher(enumerate(names + ["王小明", "李华"]))
+    build = time.perf_counter() - started
+
+    scans = {}
+    for label, text in (("50k-word chapter", chapter), (f"{len(chinese)}-character Chinese text", chinese)):
+        best = float("inf")
+        for _ in range(3):
+            started = time.perf_counter()
+            found = matcher.find(text)
+            best = min(best, time.perf_counter() - started)
+        scans[label] = best
+        assert found
+
+    print(f"\n{len(names) + 2} entries: build {build * 1000:.1f} ms, " +
+          ", ".join(f"{label} {seconds * 1000:.1f} ms" for label, seconds in scans.items()))
+    assert build < 0.1
+    assert all(seconds < 0.1 for seconds in scans.values())
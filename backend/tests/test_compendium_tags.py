@@ -0,0 +1,112 @@
+"""
+Compendium tag filters: every given tag must match, and the compendium_tags
+table follows each entry's tags through renames and removals
+"""
+from typing import Set, Tuple
+
+import pytest
+from sqlalchemy import select
+
+from database.database import SessionLocal
+from database.models import CompendiumEntry, CompendiumTag
+from services.compendium_tags import tag_key
+
+pytestmark = pytest.mark.anyio
+
+async def create_project(client, headers) -> int:
+    return (await client.post("/api/projects/", json={"name": "Novel"}, headers=headers)).json()["id"]
+
+async def create_entry(client, headers, project_id: int, title: str, tags: list) -> dict:
+    response = await client.post("/api/compendium/", json={
+        "project_id": project_id, "title": title, "tags": tags
+    }, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+async def filtered(client, headers, project_id: int, *tags: str, **params) -> list:
+    response = await client.get(f"/api/compendium/project/{project_id}",
+                                params={"tag": list(tags), **params}, headers=headers)
+    assert response.status_code == 200
+    return [entry["title"] for entry in response.json()["items"]]
+
+async def tag_counts(client, headers, project_id: int) -> dict:
+    response = await client.get(f"/api/compendium/project/{project_id}/tags", headers=headers)
+    return {row["tag"]: row["count"] for row in response.json()}
+
+def stored_and_expected_tag_rows() -> Tuple[Set, Set]:
+    """compendium_tags rows, and the rows the entries' own tags call for"""
+    with SessionLocal() as db:
+        rows = set(db.execute(select(CompendiumTag.entry_id, CompendiumTag.project_id, CompendiumTag.tag)).all())
+        expected = {
+            (entry.id, entry.project_id, tag_key(tag))
+            for entry in db.scalars(select(CompendiumEntry))
+            for tag in entry.tags or []
+        }
+    return rows, expected
+
+async def test_filters_need_every_tag(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    await create_entry(client, auth_headers, project_id, "Mara", ["Villain", "Smuggler"])
+    await create_entry(client, auth_headers, project_id, "Ivo", ["villain"])
+    await create_entry(client, auth_headers, project_id, "Lena", ["Smuggler", "Pilot"])
+
+    assert await filtered(client, auth_headers, project_id, "villain") == ["Mara", "Ivo"]
+    assert await filtered(client, auth_headers, project_id, "villain", "smuggler") == ["Mara"]
+    # Case, spacing and repeats do not matter
+    assert await filtered(client, auth_headers, project_id, "  SMUGGLER ", "smuggler", "Villain") == ["Mara"]
+    assert await filtered(client, auth_headers, project_id, "villain", "pilot") == []
+    assert await filtered(client, auth_headers, project_id) == ["Mara", "Ivo", "Lena"]
+    # Pages of a filtered list continue after the cursor
+    assert await filtered(client, auth_headers, project_id, "smuggler", limit=1) == ["Mara"]
+    response = await client.get(f"/api/compendium/project/{project_id}",
+                                params={"tag": "smuggler", "limit": 1}, headers=auth_headers)
+    cursor = response.json()["next_cursor"]
+    assert await filtered(client, auth_headers, project_id, "smuggler", cursor=cursor) == ["Lena"]
+
+async def test_unknown_tags_match_nothing(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    await create_entry(client, auth_headers, project_id, "Mara", ["villain"])
+
+    assert await filtered(client, auth_headers, project_id, "hero") == []
+    assert await filtered(client, auth_headers, project_id, "villain", "hero") == []
+    response = await client.get(f"/api/compendium/project/{project_id}",
+                                params={"tag": [f"tag{i}" for i in range(11)]}, headers=auth_headers)
+    assert response.status_code == 400
+
+async def test_tags_are_normalized_on_save(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    entry = await create_entry(client, auth_headers, project_id, "Mara", ["  Villain ", "villain", " ", "Sea  Wolf"])
+    assert entry["tags"] == ["Villain", "Sea Wolf"]
+    assert await tag_counts(client, auth_headers, project_id) == {"sea wolf": 1, "villain": 1}
+
+    response = await client.post("/api/compendium/", json={
+        "project_id": project_id, "title": "Long", "tags": ["x" * 101]
+    }, headers=auth_headers)
+    assert response.status_code == 400
+
+async def test_renaming_and_removing_tags_keeps_the_table_in_step(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    mara = await create_entry(client, auth_headers, project_id, "Mara", ["Villain", "Smuggler"])
+    ivo = await create_entry(client, auth_headers, project_id, "Ivo", ["Villain"])
+
+    # Rename one tag of one entry
+    await client.put(f"/api/compendium/{mara['id']}", json={"tags": ["Antagonist", "Smuggler"]}, headers=auth_headers)
+    assert await filtered(client, auth_headers, project_id, "villain") == ["Ivo"]
+    assert await filtered(client, auth_headers, project_id, "antagonist", "smuggler") == ["Mara"]
+    assert await tag_counts(client, auth_headers, project_id) == {"antagonist": 1, "smuggler": 1, "villain": 1}
+
+    # Saving other fields leaves the tags alone; an empty list removes them all
+    await client.put(f"/api/compendium/{mara['id']}", json={"content": "Changed sides."}, headers=auth_headers)
+    assert await filtered(client, auth_headers, project_id, "antagonist") == ["Mara"]
+    await client.put(f"/api/compendium/{mara['id']}", json={"tags": []}, headers=auth_headers)
+    assert await filtered(client, auth_headers, project_id, "antagonist") == []
+    assert await tag_counts(client, auth_headers, project_id) == {"villain": 1}
+
+    rows, expected = stored_and_expected_tag_rows()
+    assert rows == expected
+
+    # Deleting an entry takes its rows with it
+    await client.delete(f"/api/compendium/{ivo['id']}", headers=auth_headers)
+    assert await tag_counts(client, auth_headers, project_id) == {}
+    rows, expected = stored_and_expected_tag_rows()
+    assert rows == expected == set()
@@ -0,0 +1,67 @@
+"""
+Blocking AI provider calls run off the event loop: parallel chats overlap
+and the loop keeps serving other work meanwhile
+"""
+import asyncio
+import gc
+import time
+
+import pytest
+
+from core.admission import AdmissionController
+from tests.conftest import FakeProvider, use_fake_providers
+
+pytestmark = pytest.mark.anyio
+
+CALLS = 50
+PROVIDER_DELAY = 0.2
+
+async def test_parallel_chats_keep_event_loop_responsive(app, client, auth_headers):
+    use_fake_providers(app, FakeProvider("fake", delay=PROVIDER_DELAY))
+    app.state.admission = AdmissionController(
+        max_concurrent=CALLS, max_per_user=CALLS, max_queue=CALLS, queue_timeout=30
+    )
+    project = (await client.post("/api/projects/", json={"name": "Novel"}, headers=auth_headers)).json()
+    # One turn first so every parallel turn appends to the same conversation
+    first = await client.post("/api/ai/chat", json={"message": "Hello", "project_id": project["id"]}, headers=auth_headers)
+    assert first.status_code == 200
+    
+    loop = asyncio.get_running_loop()
+    lags = []
+    finished = asyncio.Event()
+    
+    async def probe():
+        while not finished.is_set():
+            started = loop.time()
+            await asyncio.sleep(0.01)
+            lags.append(loop.time() - started - 0.01)
+    
+    # A full collection over everything earlier tests left on the heap would
+    # show up as loop lag that has nothing to do with the app
+    gc.collect()
+    gc.freeze()
+    try:
+        probing = asyncio.create_task(probe())
+        started = time.monotonic()
+        responses = await asyncio.gather(*(
+            client.post("/api/ai/chat", json={"message": f"Question {i}", "project_id": project["id"]}, headers=auth_headers)
+            for i in range(CALLS)
+        ))
+        elapsed = time.monotonic() - started
+        
+        health_started = time.monotonic()
+        assert (await client.get("/health")).status_code == 200
+        health_latency = time.monotonic() - health_started
+        finished.set()
+        await probing
+    finally:
+        gc.unfreeze()
+    
+    assert [response.status_code for response in responses] == [200] * CALLS
+    # Run one after another the calls would take CALLS * PROVIDER_DELAY = 10 s
+    assert elapsed < CALLS * PROVIDER_DELAY / 3
+    assert max(lags) < 0.1
+    assert health_latency < 0.1
+    
+    history = await client.get(f"/api/ai/conversations/{project['id']}", headers=auth_headers)
+    assert len(history.json()["messages"]) == 2 * (CALLS + 1)
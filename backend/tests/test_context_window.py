@@ -0,0 +1,99 @@
+"""
+Chat prompts stay within the token budget however long the conversation
+grows, with or without a working summarizer
+"""
+import pytest
+
+import services.mock_ai_service as mock_module
+from core.config import settings
+from database.database import SessionLocal
+from database.models import AIConversation
+from services.context_window import MESSAGE_OVERHEAD_TOKENS, count_tokens, summarize_messages
+from tests.conftest import FakeProvider, use_fake_providers
+
+pytestmark = pytest.mark.anyio
+
+BUDGET = 300
+TURNS = 30
+
+class RecordingProvider(FakeProvider):
+    """Answers every call and keeps the prompts of chat turns (not of summaries)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prompts = []
+        self.summaries = 0
+
+    def call(self, messages):
+        if messages[0]["content"].startswith("You maintain a running summary"):
+            self.summaries += 1
+            return "Summary: the writer asked about chapter pacing."
+        self.prompts.append(messages)
+        return super().call(messages)
+
+def prompt_tokens(messages) -> int:
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    monkeypatch.setattr(settings, "chat_context_token_budget", BUDGET)
+    monkeypatch.setattr(settings, "chat_summary_token_budget", 60)
+    monkeypatch.setattr(settings, "chat_summary_batch_tokens", 100)
+
+def conversation() -> AIConversation:
+    with SessionLocal() as db:
+        return db.query(AIConversation).one()
+
+async def chat_turns(client, headers, project_id: int):
+    for turn in range(TURNS):
+        message = f"Turn {turn}: " + "how should this chapter be paced " * 5
+        response = await client.post(
+            "/api/ai/chat", json={"message": message, "project_id": project_id}, headers=headers
+        )
+        assert response.status_code == 200
+
+async def test_prompt_stays_within_budget_as_conversation_grows(app, client, auth_headers, small_budget):
+    provider = RecordingProvider("fake", reply="Keep scenes short and end on a question. " * 3)
+    use_fake_providers(app, provider)
+    project = (await client.post("/api/projects/", json={"name": "Novel"}, headers=auth_headers)).json()
+    
+    await chat_turns(client, auth_headers, project["id"])
+    
+    assert len(provider.prompts) == TURNS
+    # The whole conversation is far past the budget...
+    assert TURNS * prompt_tokens(provider.prompts[0]) > 3 * BUDGET
+    # ...but no single prompt is
+    assert max(prompt_tokens(prompt) for prompt in provider.prompts) <= BUDGET
+    assert provider.summaries > 0
+    stored = conversation()
+    assert stored.summary.startswith("Summary:")
+    assert stored.summary_seq > 0
+
+async def test_failed_summarizer_falls_back_to_extractive_summary(app, client, auth_headers, small_budget, monkeypatch):
+    # Every provider is down: chat answers from the mock service, which must
+    # never become the summary
+    monkeypatch.setattr(mock_module.time, "sleep", lambda seconds: None)
+    use_fake_providers(app, FakeProvider("fake", fail=True))
+    project = (await client.post("/api/projects/", json={"name": "Novel"}, headers=auth_headers)).json()
+    
+    await chat_turns(client, auth_headers, project["id"])
+    
+    stored = conversation()
+    assert stored.summary_seq > 0
+    assert "how should this chapter be paced" in stored.summary
+    # The transcript may quote the mock chat replies, but a mock answer to the
+    # summary prompt is never taken as the summary itself
+    mock_replies = {reply for replies in mock_module.mock_ai_service.mock_responses.values() for reply in replies}
+    assert stored.summary.strip() not in mock_replies
+    assert not stored.summary.startswith(tuple(mock_replies))
+    assert stored.summary_token_count <= settings.chat_summary_token_budget
+
+def test_summarize_messages_bounds_extractive_fallback():
+    def failing_chat(messages):
+        raise RuntimeError("provider down")
+    
+    messages = [{"role": "user", "content": "word " * 400}, {"role": "assistant", "content": "reply " * 400}]
+    summary = summarize_messages(failing_chat, "Earlier summary.", messages, max_tokens=50, max_input_tokens=300)
+    assert count_tokens(summary) <= 50
+    # The newest text is what survives the cut
+    assert summary.endswith("reply")
@@ -0,0 +1,97 @@
+"""
+Text edits use UTF-16 offsets, as the browser counts them, and apply only
+to the version they were made against
+"""
+import pytest
+
+from services.text_patch import apply_edits
+
+pytestmark = pytest.mark.anyio
+
+EMOJI = "\U0001F600"  # Outside the BMP: one Python character, two UTF-16 units
+
+def test_offsets_count_utf16_units():
+    content = f"a{EMOJI}b"
+    # "b" is at UTF-16 offset 3, not Python index 2
+    assert apply_edits(content, [(3, 4, "c")]) == f"a{EMOJI}c"
+    assert apply_edits(content, [(1, 3, "")]) == "ab"
+    assert apply_edits(content, [(4, 4, EMOJI)]) == f"a{EMOJI}b{EMOJI}"
+
+def test_edits_apply_against_the_same_base():
+    content = "The cat sat on the mat."
+    edits = [(4, 7, "dog"), (19, 22, "rug"), (0, 0, "> ")]
+    assert apply_edits(content, edits) == "> The dog sat on the rug."
+
+@pytest.mark.parametrize("edits", [
+    [(2, 3, "x")],  # Starts inside the emoji
+    [(1, 2, "")],  # Deletes half of it
+    [(0, 2, "x")]  # Ends inside it
+])
+def test_edit_splitting_a_surrogate_pair_is_rejected(edits):
+    with pytest.raises(ValueError):
+        apply_edits(f"a{EMOJI}b", edits)
+
+@pytest.mark.parametrize("edits", [
+    [(0, 6, "x")],  # Past the end
+    [(3, 2, "x")],  # End before start
+    [(-1, 1, "x")],
+    [(0, 3, "x"), (2, 4, "y")],  # Overlapping
+    [(1, 3, "x"), (1, 3, "y")]  # The same range twice
+])
+def test_out_of_range_or_overlapping_edits_are_rejected(edits):
+    with pytest.raises(ValueError):
+        apply_edits("hello", edits)
+
+async def create_document(client, headers, content: str) -> dict:
+    project = (await client.post("/api/projects/", json={"name": "Novel"}, headers=headers)).json()
+    response = await client.post("/api/documents/", json={
+        "title": "Chapter", "project_id": project["id"], "content": content
+    }, headers=headers)
+    return response.json()
+
+async def test_patch_applies_edits_and_bumps_the_version(client, auth_headers):
+    document = await create_document(client, auth_headers, f"<p>Smile {EMOJI} please</p>")
+
+    response = await client.patch(f"/api/documents/{document['id']}", json={
+        "version": document["version"],
+        "edits": [{"start": 12, "end": 18, "text": "now"}]
+    }, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["version"] == document["version"] + 1
+    assert response.headers["ETag"] == f'"{document["id"]}-{document["version"] + 1}"'
+
+    saved = (await client.get(f"/api/documents/{document['id']}", headers=auth_headers)).json()
+    assert saved["content"] == f"<p>Smile {EMOJI} now</p>"
+
+async def test_stale_patch_gets_409_with_the_current_version(client, auth_headers):
+    document = await create_document(client, auth_headers, "<p>Draft</p>")
+    url = f"/api/documents/{document['id']}"
+    first = await client.patch(url, json={
+        "version": document["version"], "edits": [{"start": 3, "end": 8, "text": "First"}]
+    }, headers=auth_headers)
+    assert first.status_code == 200
+
+    stale = await client.patch(url, json={
+        "version": document["version"], "edits": [{"start": 3, "end": 8, "text": "Second"}]
+    }, headers=auth_headers)
+    assert stale.status_code == 409
+    current = first.json()["version"]
+    assert stale.json()["detail"]["version"] == current
+    assert stale.headers["ETag"] == f'"{document["id"]}-{current}"'
+
+    saved = (await client.get(url, headers=auth_headers)).json()
+    assert saved["content"] == "<p>First</p>"
+    assert saved["version"] == current
+
+async def test_invalid_edit_is_a_400_and_changes_nothing(client, auth_headers):
+    document = await create_document(client, auth_headers, f"<p>{EMOJI}</p>")
+    url = f"/api/documents/{document['id']}"
+
+    response = await client.patch(url, json={
+        "version": document["version"], "edits": [{"start": 4, "end": 5, "text": ""}]
+    }, headers=auth_headers)
+    assert response.status_code == 400
+
+    saved = (await client.get(url, headers=auth_headers)).json()
+    assert saved["content"] == f"<p>{EMOJI}</p>"
+    assert saved["version"] == document["version"]
@@ -0,0 +1,134 @@
+"""
+Manuscript export: reading order, and memory that stays flat however long
+the manuscript is
+"""
+import asyncio
+import resource
+import threading
+import time
+import tracemalloc
+from typing import Dict
+
+import pytest
+
+from services import manuscript_export
+from tests.conftest import asgi_scope
+
+pytestmark = pytest.mark.anyio
+
+PARAGRAPH = "<p>" + " ".join(["The rain kept falling on the quiet town."] * 10) + "</p>"  # 80 words
+SCENE = PARAGRAPH * 63  # 5040 words; 200 of them make a million-word manuscript
+
+async def create_manuscript(client, headers, chapters: int, scenes: int, content: str = PARAGRAPH) -> int:
+    """A project of chapters with the same scenes under each; returns its id"""
+    project = (await client.post("/api/projects/", json={"name": "Manuscript"}, headers=headers)).json()
+    for chapter in range(chapters):
+        operations = [{"op": "create", "ref": "chapter", "title": f"Chapter {chapter + 1}",
+                       "document_type": "chapter", "order_index": chapter}]
+        operations.extend(
+            {"op": "create", "parent_ref": "chapter", "title": f"Scene {chapter + 1}.{scene + 1}",
+             "content": content, "order_index": scene}
+            for scene in range(scenes)
+        )
+        response = await client.post(f"/api/documents/project/{project['id']}/bulk",
+                                     json={"operations": operations}, headers=headers)
+        assert response.status_code == 200
+    return project["id"]
+
+async def export_size(app, project_id: int, headers: Dict[str, str], format: str) -> int:
+    """Stream an export straight from the app, keeping only its length
+
+    httpx's in-process transport collects the whole body before returning
+    it, which would hide whether the app itself streams.
+    """
+    scope = asgi_scope("GET", f"/api/projects/{project_id}/export", headers, query_string=f"format={format}")
+    received = [{"type": "http.request", "body": b"", "more_body": False}]
+    status = []
+    size = 0
+
+    async def receive():
+        if received:
+            return received.pop()
+        await asyncio.Event().wait()  # The client stays connected
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        else:
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    assert status == [200]
+    return size
+
+async def test_markdown_export_follows_the_tree(client, auth_headers):
+    project_id = await create_manuscript(client, auth_headers, chapters=2, scenes=2)
+
+    response = await client.get(f"/api/projects/{project_id}/export", params={"format": "markdown"},
+                                headers=auth_headers)
+    assert response.status_code == 200
+    assert "attachment" in response.headers["content-disposition"]
+
+    headings = [line for line in response.text.splitlines() if line.startswith("#")]
+    assert headings == ["# Manuscript", "## Chapter 1", "### Scene 1.1", "### Scene 1.2",
+                        "## Chapter 2", "### Scene 2.1", "### Scene 2.2"]
+
+async def test_markdown_headings_escape_titles(client, auth_headers):
+    project = (await client.post("/api/projects/", json={"name": "*Bold* claims"}, headers=auth_headers)).json()
+    await client.post("/api/documents/", json={
+        "title": "# Not a [link]", "project_id": project["id"], "content": "<p>Text</p>"
+    }, headers=auth_headers)
+
+    response = await client.get(f"/api/projects/{project['id']}/export", params={"format": "markdown"},
+                                headers=auth_headers)
+    headings = [line for line in response.text.splitlines() if line.startswith("#")]
+    assert headings == [r"# \*Bold\* claims", r"## \# Not a \[link\]"]
+
+@pytest.mark.parametrize("format, converter", [
+    ("markdown", "html_to_markdown"), ("text", "html_to_text"), ("epub", "html_to_xhtml")
+])
+async def test_documents_convert_off_the_event_loop(app, client, auth_headers, monkeypatch, format, converter):
+    project_id = await create_manuscript(client, auth_headers, chapters=1, scenes=2)
+    convert = getattr(manuscript_export, converter)
+    threads = []
+
+    def recording(content):
+        threads.append(threading.current_thread())
+        return convert(content)
+
+    monkeypatch.setattr(manuscript_export, converter, recording)
+    await export_size(app, project_id, auth_headers, format)
+
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
+
+@pytest.mark.benchmark
+async def test_export_memory_benchmark_on_million_word_manuscript(app, client, auth_headers):
+    small_id = await create_manuscript(client, auth_headers, chapters=2, scenes=5, content=SCENE)
+    large_id = await create_manuscript(client, auth_headers, chapters=20, scenes=10, content=SCENE)
+    stats = (await client.get(f"/api/projects/{large_id}/stats", headers=auth_headers)).json()
+    assert stats["word_count"] >= 1_000_000
+    manuscript_bytes = 200 * len(SCENE)
+
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for format in ("markdown", "epub"):
+            for name, project_id in (("small", small_id), ("large", large_id)):
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                started = time.perf_counter()
+                size = await export_size(app, project_id, auth_headers, format)
+                elapsed = time.perf_counter() - started
+                peaks[format, name] = tracemalloc.get_traced_memory()[1] - baseline
+                print(f"\n{format} export of the {name} project: {size / 2**20:.1f} MB in {elapsed:.2f} s, "
+                      f"peak Python heap {peaks[format, name] / 2**20:.1f} MB", end="")
+    finally:
+        tracemalloc.stop()
+    print(f"\nPeak RSS of the test process: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    for format in ("markdown", "epub"):
+        # Twenty times the manuscript, not twenty times the memory
+        assert peaks[format, "large"] < 2 * peaks[format, "small"] + 2**20
+        assert peaks[format, "large"] < manuscript_bytes / 4
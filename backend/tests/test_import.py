@@ -0,0 +1,99 @@
+"""
+Archive import: folders become chapters, files become searchable scenes,
+and the write transaction commits whether or not the client reads along
+"""
+import asyncio
+import io
+import json
+import zipfile
+from typing import Dict
+
+import httpx
+import pytest
+
+from core.config import settings
+from tests.conftest import asgi_scope
+
+pytestmark = pytest.mark.anyio
+
+def make_archive(files: Dict[str, str]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, text in files.items():
+            archive.writestr(name, text)
+    return buffer.getvalue()
+
+BOOK = {
+    "Book/Part 2/Chapter 10.md": "# Chapter 10\n\nThe *lighthouse* went dark.",
+    "Book/Part 2/Chapter 2.md": "> The sea keeps\n>what it takes",
+    "Book/Part 1/Opening.txt": "It began with a storm.",
+    "Book/cover.png": "not text"
+}
+
+async def create_project(client, headers) -> int:
+    return (await client.post("/api/projects/", json={"name": "Imported"}, headers=headers)).json()["id"]
+
+async def test_import_builds_the_tree_and_indexes_the_files(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "import_batch_size", 2)
+    project_id = await create_project(client, auth_headers)
+
+    response = await client.post(f"/api/projects/{project_id}/import", headers=auth_headers,
+                                 files={"file": ("book.zip", make_archive(BOOK), "application/zip")})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {"imported": 0, "total": 3, "folders": 2}
+    assert [line["imported"] for line in lines[1:-1]] == [2, 3]
+    assert lines[-1] == {"done": True, "imported": 3, "folders": 2, "skipped": ["Book/cover.png"]}
+
+    tree = (await client.get(f"/api/projects/{project_id}/tree", headers=auth_headers)).json()
+    assert [(node["title"], [child["title"] for child in node["children"]]) for node in tree] == [
+        ("Part 1", ["Opening"]), ("Part 2", ["Chapter 2", "Chapter 10"])
+    ]
+
+    documents = {document["title"]: document for document in (
+        await client.get(f"/api/documents/project/{project_id}", headers=auth_headers)
+    ).json()}
+    assert documents["Chapter 10"]["content"] == "<p>The <em>lighthouse</em> went dark.</p>"
+    assert documents["Chapter 2"]["content"] == "<blockquote><p>The sea keeps what it takes</p></blockquote>"
+
+    # Every batch reached the search index, and nothing outside it
+    for word, title in (("lighthouse", "Chapter 10"), ("storm", "Opening"), ("sea", "Chapter 2")):
+        results = (await client.get(f"/api/projects/{project_id}/search", params={"q": word},
+                                    headers=auth_headers)).json()
+        assert [(result["kind"], result["title"]) for result in results] == [("document", title)]
+
+async def test_import_commits_while_the_client_is_not_reading(app, client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    request = httpx.Request("POST", "http://test/", files={"file": ("book.zip", make_archive(BOOK), "application/zip")})
+    body = request.read()
+    scope = asgi_scope("POST", f"/api/projects/{project_id}/import", auth_headers)
+    scope["headers"] = [header for header in scope["headers"] if header[0] != b"content-type"]
+    scope["headers"].append((b"content-type", request.headers["content-type"].encode()))
+
+    received = [{"type": "http.request", "body": body, "more_body": False}]
+    reading = asyncio.Event()
+    chunks = []
+
+    async def receive():
+        if received:
+            return received.pop()
+        await asyncio.Event().wait()  # The client stays connected
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            chunks.append(message["body"])
+            await reading.wait()  # The client stops reading after the first line
+
+    call = asyncio.create_task(app(scope, receive, send))
+    try:
+        for _ in range(200):
+            tree = (await client.get(f"/api/projects/{project_id}/tree", headers=auth_headers)).json()
+            if len(tree) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert len(chunks) == 1
+        assert [len(node["children"]) for node in tree] == [1, 2]
+    finally:
+        reading.set()
+        await call
+
+    assert json.loads(b"".join(chunks).splitlines()[-1])["done"] is True
@@ -0,0 +1,82 @@
+"""
+Password hashing runs in its own process pool: a burst of logins neither
+stalls the event loop nor slows unrelated endpoints
+"""
+import asyncio
+import gc
+import time
+
+import pytest
+from passlib.hash import bcrypt
+from sqlalchemy import update
+
+from database.database import SessionLocal
+from database.models import User
+
+pytestmark = pytest.mark.anyio
+
+USERS = 20
+PASSWORD = "correct horse"
+COST = 12  # The production default; the rest of the suite hashes at cost 4
+
+@pytest.mark.benchmark
+async def test_login_storm_keeps_other_endpoints_responsive(client):
+    for i in range(USERS):
+        await client.post("/api/auth/register", json={
+            "username": f"reader{i}", "email": f"reader{i}@example.com", "password": PASSWORD
+        })
+    slow_hash = bcrypt.using(rounds=COST).hash(PASSWORD)
+    with SessionLocal() as db:
+        db.execute(update(User).values(hashed_password=slow_hash))
+        db.commit()
+
+    started = time.perf_counter()
+    bcrypt.verify(PASSWORD, slow_hash)
+    verify_seconds = time.perf_counter() - started
+
+    loop = asyncio.get_running_loop()
+    lags = []
+    health = []
+    finished = asyncio.Event()
+
+    async def probe():
+        while not finished.is_set():
+            started = loop.time()
+            await asyncio.sleep(0.01)
+            lags.append(loop.time() - started - 0.01)
+
+    async def check_health():
+        while not finished.is_set():
+            started = time.perf_counter()
+            assert (await client.get("/health")).status_code == 200
+            health.append(time.perf_counter() - started)
+            await asyncio.sleep(0.02)
+
+    gc.collect()
+    gc.freeze()
+    try:
+        probes = [asyncio.create_task(probe()), asyncio.create_task(check_health())]
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post("/api/auth/login", json={"username": f"reader{i}", "password": PASSWORD})
+            for i in range(USERS)
+        ))
+        elapsed = time.perf_counter() - started
+        finished.set()
+        await asyncio.gather(*probes)
+    finally:
+        gc.unfreeze()
+    print(f"\n{USERS} logins at bcrypt cost {COST} ({verify_seconds * 1000:.0f} ms each): {elapsed:.2f} s, "
+          f"max loop lag {max(lags) * 1000:.0f} ms, slowest /health {max(health) * 1000:.0f} ms")
+
+    assert [response.status_code for response in responses] == [200] * USERS
+    # The hashes took a while, and the loop kept turning all the time
+    assert elapsed > verify_seconds
+    assert len(health) > 1
+    # A single hash on the loop would stall it for a whole verify
+    assert max(lags) < verify_seconds
+    assert max(health) < verify_seconds
+
+    # Logins moved the hashes to the configured cost
+    with SessionLocal() as db:
+        assert all(user.hashed_password.startswith("$2b$04$") for user in db.query(User))
@@ -0,0 +1,129 @@
+"""
+Verified tokens skip the users query, but never outlive a change to the
+user or the token's own expiry
+"""
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event, update
+
+from core.principals import Principal, PrincipalCache, principal_cache
+from core.security import create_access_token
+from database.database import SessionLocal, async_engine
+from database.models import User
+
+pytestmark = pytest.mark.anyio
+
+REQUESTS = 300
+
+class QueryCounter:
+    """Counts the users queries the app runs while in use"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            self.count += 1
+
+    def __enter__(self):
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(async_engine.sync_engine, "before_cursor_execute", self)
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    principal_cache.clear()
+    yield
+    principal_cache.clear()
+
+async def me(client, headers):
+    return await client.get("/api/auth/me", headers=headers)
+
+async def test_repeat_requests_skip_the_users_query(client, auth_headers):
+    with QueryCounter() as queries:
+        for _ in range(3):
+            assert (await me(client, auth_headers)).status_code == 200
+    assert queries.count == 1
+
+async def test_orm_update_invalidates_the_user(client, auth_headers):
+    assert (await me(client, auth_headers)).json()["full_name"] is None
+    with SessionLocal() as db:
+        db.query(User).filter_by(username="writer").one().full_name = "Ada Writer"
+        db.commit()
+
+    assert (await me(client, auth_headers)).json()["full_name"] == "Ada Writer"
+
+async def test_deactivation_takes_effect_immediately(client, auth_headers):
+    assert (await me(client, auth_headers)).status_code == 200
+    with SessionLocal() as db:
+        db.query(User).filter_by(username="writer").one().is_active = False
+        db.commit()
+
+    response = await me(client, auth_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Inactive user"
+
+async def test_bulk_update_clears_the_cache(client, auth_headers):
+    assert (await me(client, auth_headers)).status_code == 200
+    with SessionLocal() as db:
+        db.execute(update(User).values(is_active=False))
+        db.commit()
+
+    assert (await me(client, auth_headers)).status_code == 400
+
+async def test_entry_expires_with_its_token(client, auth_headers):
+    await me(client, auth_headers)  # Registers the user
+    token = create_access_token({"sub": "writer"}, expires_delta=timedelta(seconds=2))
+    headers = {"Authorization": f"Bearer {token}"}
+    assert (await me(client, headers)).status_code == 200
+    assert principal_cache.get(token) is not None
+
+    # The cache TTL is far longer, but the token's exp wins
+    expires_at = principal_cache._entries[token][0]
+    await asyncio.sleep(max(0.0, expires_at - time.time()) + 0.1)
+    assert principal_cache.get(token) is None
+    # The JWT check counts whole seconds, so it rejects the token a moment later
+    await asyncio.sleep(1)
+    assert (await me(client, headers)).status_code == 401
+
+def test_least_recently_used_entries_go_first():
+    cache = PrincipalCache(max_entries=2, ttl_seconds=60)
+    principals = [Principal(i, f"user{i}", f"user{i}@example.com", None, True, None) for i in range(3)]
+    cache.set("a", principals[0])
+    cache.set("b", principals[1])
+    cache.get("a")
+    cache.set("c", principals[2])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == principals[0]
+    assert cache.get("c") == principals[2]
+
+async def requests_per_second(client, headers) -> float:
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        assert (await me(client, headers)).status_code == 200
+    return REQUESTS / (time.perf_counter() - started)
+
+@pytest.mark.benchmark
+async def test_authenticated_throughput_benchmark(client, auth_headers, monkeypatch):
+    await me(client, auth_headers)  # Warm up
+
+    with monkeypatch.context() as uncached:
+        # A zero TTL makes every entry expire on arrival: the behaviour before the cache
+        uncached.setattr(principal_cache, "ttl_seconds", 0)
+        principal_cache.clear()
+        with QueryCounter() as before_queries:
+            before = await requests_per_second(client, auth_headers)
+    with QueryCounter() as after_queries:
+        after = await requests_per_second(client, auth_headers)
+
+    print(f"\n{REQUESTS} authenticated requests: {before:.0f} req/s querying users each time, "
+          f"{after:.0f} req/s with the principal cache ({after / before:.2f}x)")
+    assert before_queries.count == REQUESTS
+    assert after_queries.count <= 1
+    assert after > before
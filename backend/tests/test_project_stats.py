@@ -0,0 +1,113 @@
+"""
+Counts kept up to date incrementally match a full recount, and the project
+statistics endpoint reports totals, daily progress and chapters from them
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from database.database import SessionLocal
+from database.models import ProjectDailyStats
+from services.text_stats import count_chars, count_words, updated_counts
+from tests.conftest import register
+
+pytestmark = pytest.mark.anyio
+
+# Pieces of editor HTML, chosen to put edits on and next to word, tag and entity edges
+PIECES = ["<p>", "</p>", "<em>", "</em>", "<br>", "<h2>", "</h2>", " ", "  ", "\n", "the", "rain", "don't",
+          "well-known", "&amp;", "&nbsp;", "café", "雨", "天気", "あめ", "42", "x", ".", ",",
+          "<", ">", "<a href='x'>", "</a>"]
+
+def random_content(rng: random.Random, pieces: int) -> str:
+    return "".join(rng.choice(PIECES) for _ in range(pieces))
+
+def random_edit(rng: random.Random, content: str) -> str:
+    start = rng.randint(0, len(content))
+    end = rng.randint(start, min(len(content), start + rng.choice([0, 1, 3, 10, 40])))
+    if rng.random() < 0.2:
+        # Some edits replace with raw characters, splitting words and tags anywhere
+        inserted = "".join(rng.choice("ab <>/雨'-") for _ in range(rng.randint(0, 4)))
+    else:
+        inserted = random_content(rng, rng.randint(0, 4))
+    return content[:start] + inserted + content[end:]
+
+def test_updated_counts_match_a_full_recount():
+    rng = random.Random(20240611)
+    for _ in range(200):
+        content = random_content(rng, rng.randint(0, 60))
+        words, chars = count_words(content), count_chars(content)
+        for _ in range(20):
+            edited = random_edit(rng, content)
+            words, chars = updated_counts(content, edited, words, chars)
+            assert (words, chars) == (count_words(edited), count_chars(edited)), (content, edited)
+            content = edited
+
+async def create_document(client, headers, project_id: int, content: str, **fields) -> dict:
+    response = await client.post("/api/documents/", json={
+        "title": "Scene", "project_id": project_id, "content": content, **fields
+    }, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+async def stats(client, headers, project_id: int, **params) -> dict:
+    response = await client.get(f"/api/projects/{project_id}/stats", params=params, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+async def test_stats_follow_creates_edits_and_deletes(client, auth_headers):
+    project_id = (await client.post("/api/projects/", json={"name": "Novel"}, headers=auth_headers)).json()["id"]
+    chapter = await create_document(client, auth_headers, project_id, "", title="Chapter 1", document_type="chapter")
+    first = await create_document(client, auth_headers, project_id, "<p>One two three</p>", parent_id=chapter["id"])
+    second = await create_document(client, auth_headers, project_id, "<p>Four five</p>", parent_id=chapter["id"])
+    loose = await create_document(client, auth_headers, project_id, "<p>Six</p>")
+
+    # Two words replace three, then the first scene gains two
+    await client.put(f"/api/documents/{first['id']}", json={"content": "<p>One more</p>"}, headers=auth_headers)
+    await client.put(f"/api/documents/{first['id']}", json={"content": "<p>One more and more</p>"},
+                     headers=auth_headers)
+    await client.delete(f"/api/documents/{loose['id']}", headers=auth_headers)
+
+    result = await stats(client, auth_headers, project_id)
+    assert (result["word_count"], result["char_count"], result["document_count"]) == (6, 22, 3)
+    assert result["chapters"] == [
+        {"id": chapter["id"], "title": "Chapter 1", "word_count": 6, "char_count": 22, "document_count": 3}
+    ]
+    # Every save today went into one row; the delete is not counted as writing
+    today = datetime.utcnow().date().isoformat()
+    assert result["daily"] == [{"day": today, "words_added": 3 + 2 + 1 + 2, "words_removed": 1}]
+
+    # Creating a document adds to that same row
+    await create_document(client, auth_headers, project_id, "<p>Seven eight</p>", parent_id=second["id"])
+    result = await stats(client, auth_headers, project_id)
+    assert result["daily"] == [{"day": today, "words_added": 10, "words_removed": 1}]
+    assert result["chapters"][0]["word_count"] == 8
+
+async def test_daily_progress_covers_the_requested_days(client, auth_headers):
+    project_id = (await client.post("/api/projects/", json={"name": "Novel"}, headers=auth_headers)).json()["id"]
+    await create_document(client, auth_headers, project_id, "<p>Today I wrote</p>")
+    today = datetime.utcnow().date()
+    with SessionLocal() as db:
+        db.execute(insert(ProjectDailyStats), [
+            {"project_id": project_id, "day": today - timedelta(days=1), "words_added": 50, "words_removed": 5},
+            {"project_id": project_id, "day": today - timedelta(days=40), "words_added": 900, "words_removed": 0}
+        ])
+        db.commit()
+
+    days = [entry["day"] for entry in (await stats(client, auth_headers, project_id))["daily"]]
+    assert days == [(today - timedelta(days=1)).isoformat(), today.isoformat()]
+    days = [entry["day"] for entry in (await stats(client, auth_headers, project_id, days=1))["daily"]]
+    assert days == [today.isoformat()]
+    days = [entry["day"] for entry in (await stats(client, auth_headers, project_id, days=366))["daily"]]
+    assert len(days) == 3
+
+    response = await client.get(f"/api/projects/{project_id}/stats", params={"days": 0}, headers=auth_headers)
+    assert response.status_code == 422
+
+async def test_stats_of_another_users_project_are_hidden(client, auth_headers):
+    project_id = (await client.post("/api/projects/", json={"name": "Novel"}, headers=auth_headers)).json()["id"]
+    other = await register(client, "reader")
+
+    response = await client.get(f"/api/projects/{project_id}/stats", headers=other)
+    assert response.status_code == 404
@@ -0,0 +1,85 @@
+"""
+The project tree costs the same number of queries at any size, and is
+revalidated by ETag
+"""
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import pytest
+from sqlalchemy import event
+
+from database.database import async_engine
+
+pytestmark = pytest.mark.anyio
+
+@contextmanager
+def count_queries() -> Iterator[List[str]]:
+    """Collect the SQL statements the async engine runs inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+async def create_tree(client, headers, chapters: int, scenes: int) -> int:
+    """A project of chapters with scenes under each; returns its id"""
+    project = (await client.post("/api/projects/", json={"name": f"{chapters}x{scenes}"}, headers=headers)).json()
+    operations = []
+    for chapter in range(chapters):
+        operations.append({"op": "create", "ref": f"c{chapter}", "title": f"Chapter {chapter}",
+                           "document_type": "chapter", "order_index": chapter})
+        operations.extend(
+            {"op": "create", "parent_ref": f"c{chapter}", "title": f"Scene {chapter}.{scene}",
+             "content": f"<p>Scene {scene} of chapter {chapter}.</p>", "order_index": scene}
+            for scene in range(scenes)
+        )
+    response = await client.post(f"/api/documents/project/{project['id']}/bulk",
+                                 json={"operations": operations}, headers=headers)
+    assert response.status_code == 200
+    return project["id"]
+
+def count_nodes(nodes: list) -> int:
+    return sum(1 + count_nodes(node["children"]) for node in nodes)
+
+async def test_tree_query_count_does_not_grow_with_the_tree(client, auth_headers):
+    queries = {}
+    for chapters, scenes in [(1, 1), (5, 4), (30, 10)]:
+        project_id = await create_tree(client, auth_headers, chapters, scenes)
+        # Warm the auth cache so every measured request does the same work
+        await client.get(f"/api/projects/{project_id}/tree", headers=auth_headers)
+
+        with count_queries() as statements:
+            response = await client.get(f"/api/projects/{project_id}/tree", headers=auth_headers)
+        assert response.status_code == 200
+        tree = response.json()
+        assert len(tree) == chapters
+        assert count_nodes(tree) == chapters * (scenes + 1)
+        queries[chapters * (scenes + 1)] = len(statements)
+
+    assert len(set(queries.values())) == 1, queries
+
+async def test_unchanged_tree_is_not_modified(client, auth_headers):
+    project_id = await create_tree(client, auth_headers, 2, 2)
+    url = f"/api/projects/{project_id}/tree"
+
+    first = await client.get(url, headers=auth_headers)
+    etag = first.headers["ETag"]
+
+    cached = await client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.content == b""
+
+    chapter_id = first.json()[0]["id"]
+    renamed = await client.put(f"/api/documents/{chapter_id}", json={"title": "Renamed"}, headers=auth_headers)
+    assert renamed.status_code == 200
+
+    changed = await client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()[0]["title"] == "Renamed"
@@ -0,0 +1,168 @@
+"""
+Provider routing with fake providers: circuit breaker states, hedging and
+cancelled hedges, and the outcomes streams record
+"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services.ai_service import AIService
+from services.provider_router import AllProvidersFailed, Provider, ProviderRouter
+from tests.conftest import FakeProvider
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def warm_up(router: ProviderRouter, name: str, latency: float) -> None:
+    """Give a provider enough latency samples for a p95, so hedging can start"""
+    for _ in range(router.health[name].min_samples):
+        router.health[name].record_success(latency)
+
+def test_breaker_opens_then_half_opens_then_closes():
+    clock = FakeClock()
+    fake = FakeProvider("a", fail=True)
+    router = ProviderRouter([fake.provider()], failure_threshold=2, reset_seconds=30, clock=clock)
+    health = router.health["a"]
+    
+    for _ in range(2):
+        with pytest.raises(AllProvidersFailed):
+            router.call(MESSAGES)
+    assert health.state == "open"
+    
+    # An open circuit is skipped without calling the provider
+    with pytest.raises(AllProvidersFailed):
+        router.call(MESSAGES)
+    assert fake.calls == 2
+    
+    clock.now += 30
+    assert health.state == "half_open"
+    fake.fail = False
+    assert router.call(MESSAGES) == ("A fake reply.", "a")
+    assert health.state == "closed"
+    router.close()
+
+def test_failed_trial_reopens_the_circuit():
+    clock = FakeClock()
+    fake = FakeProvider("a", fail=True)
+    router = ProviderRouter([fake.provider()], failure_threshold=1, reset_seconds=30, clock=clock)
+    with pytest.raises(AllProvidersFailed):
+        router.call(MESSAGES)
+    
+    clock.now += 30
+    with pytest.raises(AllProvidersFailed):
+        router.call(MESSAGES)
+    assert fake.calls == 2
+    assert router.health["a"].state == "open"
+    assert not router.health["a"].allow()
+    router.close()
+
+def test_only_one_trial_goes_out_while_half_open():
+    clock = FakeClock()
+    router = ProviderRouter([FakeProvider("a").provider()], failure_threshold=1, reset_seconds=30, clock=clock)
+    health = router.health["a"]
+    health.record_failure()
+    clock.now += 30
+    assert health.acquire() is True
+    assert health.acquire() is None
+    health.release_trial()
+    assert health.acquire() is True
+    router.close()
+
+def test_failover_to_the_next_provider():
+    broken, healthy = FakeProvider("a", fail=True), FakeProvider("b", reply="From b.")
+    router = ProviderRouter([broken.provider(), healthy.provider()])
+    assert router.call(MESSAGES) == ("From b.", "b")
+    assert router.stats()["a"]["consecutive_failures"] == 1
+    router.close()
+
+def test_hedge_starts_next_provider_after_p95():
+    slow, fast = FakeProvider("a", reply="From a.", delay=1.0), FakeProvider("b", reply="From b.")
+    router = ProviderRouter([slow.provider(), fast.provider()], hedge=True)
+    warm_up(router, "a", 0.05)
+    
+    started = time.monotonic()
+    assert router.call(MESSAGES) == ("From b.", "b")
+    assert time.monotonic() - started < 0.5
+    assert slow.calls == fast.calls == 1
+    router.close()
+
+def test_no_hedge_without_latency_samples():
+    slow, fast = FakeProvider("a", reply="From a.", delay=0.2), FakeProvider("b")
+    router = ProviderRouter([slow.provider(), fast.provider()], hedge=True)
+    assert router.call(MESSAGES) == ("From a.", "a")
+    assert fast.calls == 0
+    router.close()
+
+def test_cancelled_hedge_gives_back_its_trial_slot():
+    clock = FakeClock()
+    recovering = FakeProvider("b")
+    
+    def primary(messages):
+        # Queue work ahead of the hedge, so the one worker is still busy when
+        # this call returns and the hedge is cancelled before it starts
+        router._executor.submit(time.sleep, 0.3)
+        time.sleep(0.3)
+        return "From a."
+    
+    router = ProviderRouter(
+        [Provider("a", primary), recovering.provider()],
+        hedge=True, failure_threshold=1, reset_seconds=30, max_workers=1, clock=clock
+    )
+    warm_up(router, "a", 0.05)
+    router.health["b"].record_failure()
+    clock.now += 30
+    
+    assert router.call(MESSAGES) == ("From a.", "a")
+    assert recovering.calls == 0
+    health = router.health["b"]
+    assert not health.trial_in_flight
+    assert health.state == "half_open"
+    assert health.allow()
+    router.close()
+
+def _streaming_service(*fakes: FakeProvider, **router_options) -> AIService:
+    service = AIService(SimpleNamespace(openai_client=None, gemini_client=None))
+    service.router.close()
+    service.router = ProviderRouter([fake.provider() for fake in fakes], **router_options)
+    return service
+
+def test_stream_error_after_first_token_counts_as_failure():
+    class Broken(FakeProvider):
+        def stream(self, messages):
+            yield "Partial "
+            raise RuntimeError("connection reset")
+    
+    service = _streaming_service(Broken("a"), failure_threshold=1)
+    stream = service._chat_stream(MESSAGES, None)
+    assert next(stream) == "Partial "
+    with pytest.raises(RuntimeError):
+        next(stream)
+    assert service.router.health["a"].state == "open"
+    service.close()
+
+def test_closed_stream_leaves_no_trial_in_flight():
+    clock = FakeClock()
+    service = _streaming_service(FakeProvider("a", reply="one two three"), failure_threshold=1, clock=clock)
+    health = service.router.health["a"]
+    health.record_failure()
+    clock.now += 30
+    
+    stream = service._chat_stream(MESSAGES, None)
+    assert next(stream) == "one "
+    stream.close()
+    assert health.state == "closed"
+    assert not health.trial_in_flight
+    service.close()
+
+def test_stream_falls_back_to_next_provider_before_first_token():
+    service = _streaming_service(FakeProvider("a", fail=True), FakeProvider("b", reply="From b."))
+    assert "".join(service._chat_stream(MESSAGES, None)) == "From b. "
+    assert service.router.health["a"].consecutive_failures == 1
+    service.close()
@@ -0,0 +1,117 @@
+"""
+Project search: the index follows every change to documents and compendium
+entries, user input never reaches the match syntax, and results stay
+inside the project
+"""
+import pytest
+
+from tests.conftest import register
+
+pytestmark = pytest.mark.anyio
+
+async def create_project(client, headers, name: str = "Novel") -> int:
+    return (await client.post("/api/projects/", json={"name": name}, headers=headers)).json()["id"]
+
+async def create_document(client, headers, project_id: int, title: str, content: str) -> dict:
+    response = await client.post("/api/documents/", json={
+        "title": title, "project_id": project_id, "content": content
+    }, headers=headers)
+    return response.json()
+
+async def search(client, headers, project_id: int, query: str) -> list:
+    response = await client.get(f"/api/projects/{project_id}/search", params={"q": query}, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+async def titles(client, headers, project_id: int, query: str) -> list:
+    return [result["title"] for result in await search(client, headers, project_id, query)]
+
+async def test_documents_are_indexed_on_create_update_and_delete(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    document = await create_document(client, auth_headers, project_id, "Harbour", "<p>The lighthouse keeper slept.</p>")
+    assert await titles(client, auth_headers, project_id, "lighthouse") == ["Harbour"]
+
+    await client.put(f"/api/documents/{document['id']}", json={
+        "title": "Quay", "content": "<p>The fisherman woke.</p>"
+    }, headers=auth_headers)
+    assert await titles(client, auth_headers, project_id, "lighthouse") == []
+    assert await titles(client, auth_headers, project_id, "harbour") == []
+    assert await titles(client, auth_headers, project_id, "fisherman") == ["Quay"]
+
+    current = (await client.get(f"/api/documents/{document['id']}", headers=auth_headers)).json()
+    await client.patch(f"/api/documents/{document['id']}", json={
+        "version": current["version"], "edits": [{"start": 7, "end": 16, "text": "sailor"}]
+    }, headers=auth_headers)
+    assert await titles(client, auth_headers, project_id, "fisherman") == []
+    assert await titles(client, auth_headers, project_id, "sailor") == ["Quay"]
+
+    await client.delete(f"/api/documents/{document['id']}", headers=auth_headers)
+    assert await titles(client, auth_headers, project_id, "sailor") == []
+
+async def test_compendium_entries_are_indexed_with_their_tags(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    entry = (await client.post("/api/compendium/", json={
+        "project_id": project_id, "title": "Mara", "content": "A smuggler from the coast.", "tags": ["villain"]
+    }, headers=auth_headers)).json()
+    results = await search(client, auth_headers, project_id, "villain")
+    assert [(result["kind"], result["id"]) for result in results] == [("compendium", entry["id"])]
+
+    await client.put(f"/api/compendium/{entry['id']}", json={"tags": ["ally"], "content": "A pilot."},
+                     headers=auth_headers)
+    assert await titles(client, auth_headers, project_id, "villain") == []
+    assert await titles(client, auth_headers, project_id, "smuggler") == []
+    assert await titles(client, auth_headers, project_id, "ally pilot") == ["Mara"]
+
+    await client.delete(f"/api/compendium/{entry['id']}", headers=auth_headers)
+    assert await titles(client, auth_headers, project_id, "Mara") == []
+
+async def test_every_term_must_match_and_the_last_is_a_prefix(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    await create_document(client, auth_headers, project_id, "Storm", "<p>Rain over the harbour wall.</p>")
+    await create_document(client, auth_headers, project_id, "Calm", "<p>Rain on a still sea.</p>")
+    await create_document(client, auth_headers, project_id, "雨", "<p>港の雨は冷たい。</p>")
+
+    assert sorted(await titles(client, auth_headers, project_id, "rain")) == ["Calm", "Storm"]
+    assert await titles(client, auth_headers, project_id, "rain harb") == ["Storm"]
+    assert await titles(client, auth_headers, project_id, "harb rain") == []
+    assert await titles(client, auth_headers, project_id, "冷た") == ["雨"]
+
+QUERIES = [
+    'rain"', '"rain', "rain*", "title:rain", "rain OR", "NOT rain", "rain AND", "(rain)",
+    "NEAR(rain sea)", "-rain", "+rain", "^rain", "rain'", "{rain}", "rain; DROP TABLE documents"
+]
+
+async def test_match_syntax_in_queries_is_taken_literally(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    await create_document(client, auth_headers, project_id, "Storm", "<p>Rain over the harbour wall.</p>")
+
+    # Whatever the characters, the query is words to look for, never an error
+    for query in QUERIES:
+        await search(client, auth_headers, project_id, query)
+    assert await titles(client, auth_headers, project_id, "harbour") == ["Storm"]
+
+async def test_snippets_are_escaped_and_marked(client, auth_headers):
+    project_id = await create_project(client, auth_headers)
+    await create_document(client, auth_headers, project_id, "Code",
+                          "<p>Type &lt;script&gt; then rain &amp; thunder.</p>")
+
+    [result] = await search(client, auth_headers, project_id, "thunder")
+    assert "&lt;script&gt;" in result["snippet"]
+    assert "<script>" not in result["snippet"]
+    assert "<mark>thunder</mark>" in result["snippet"]
+
+async def test_results_stay_inside_the_project(client, auth_headers):
+    first = await create_project(client, auth_headers, "First")
+    second = await create_project(client, auth_headers, "Second")
+    await create_document(client, auth_headers, first, "Here", "<p>The lighthouse.</p>")
+    await create_document(client, auth_headers, second, "There", "<p>The lighthouse.</p>")
+    await client.post("/api/compendium/", json={
+        "project_id": second, "title": "Lighthouse", "content": "Tall."
+    }, headers=auth_headers)
+
+    assert await titles(client, auth_headers, first, "lighthouse") == ["Here"]
+    assert sorted(await titles(client, auth_headers, second, "lighthouse")) == ["Lighthouse", "There"]
+
+    other = await register(client, "reader")
+    response = await client.get(f"/api/projects/{first}/search", params={"q": "lighthouse"}, headers=other)
+    assert response.status_code == 404
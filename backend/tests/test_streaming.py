@@ -0,0 +1,47 @@
+"""
+Streaming AI responses give their admission slots back however the client
+leaves, including before the body is ever iterated
+"""
+import json
+
+import pytest
+
+from tests.conftest import FakeProvider, asgi_scope, use_fake_providers
+
+pytestmark = pytest.mark.anyio
+
+async def call_and_disconnect(app, path: str, body: dict, headers: dict) -> None:
+    """Send a request straight to the app from a client that is gone before the response starts"""
+    payload = json.dumps(body).encode()
+    # ASGI 2.4 lets a server report a gone client by raising from send()
+    scope = asgi_scope("POST", path, headers, spec_version="2.4")
+    messages = [{"type": "http.request", "body": payload, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client disconnected")
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        pass
+
+@pytest.mark.parametrize("path, body", [
+    ("/api/ai/chat/stream", {"message": "Hello"}),
+    ("/api/ai/writing-assistance/stream", {"text": "Some text.", "assistance_type": "improve"}),
+    ("/api/ai/writing-assistance/batch", {"texts": ["One.", "Two."], "assistance_type": "improve"})
+])
+async def test_disconnect_before_streaming_releases_admission(app, client, auth_headers, path, body):
+    use_fake_providers(app, FakeProvider("openai"))
+    admission = app.state.admission
+
+    for _ in range(admission.max_per_user + 1):
+        await call_and_disconnect(app, path, body, auth_headers)
+
+    assert admission.metrics()["in_flight"] == 0
+    assert admission.metrics()["admitted"] == admission.max_per_user + 1
+    # The user is not locked out by slots nobody holds
+    response = await client.post(path, json=body, headers=auth_headers)
+    assert response.status_code == 200
@@ -0,0 +1,95 @@
+"""
+Local text analysis: what it counts, that per-document counts add up to the
+whole, and how long it takes from 1 KB to 1 MB
+"""
+import time
+
+import pytest
+
+from services.text_analysis import count_text, describe, merge_counts, text_issues
+
+ENGLISH = (
+    "The letter was written by her brother, and it was quickly sent. "
+    "\"Where are you?\" she asked. He walked slowly to the door.\n\n"
+)
+CJK = "他被老师叫到办公室。“你在哪里？”她问。我们慢慢地走到门口，没有说话。\n\n"
+SIZES = (1024, 10 * 1024, 100 * 1024, 1024 * 1024)
+
+def text_of_size(unit: str, size: int) -> str:
+    """Repeat unit up to about size bytes of UTF-8"""
+    return unit * max(1, size // len(unit.encode("utf-8")))
+
+def test_counts_of_english_passage():
+    counts = count_text(ENGLISH)
+    metrics = describe(counts)
+
+    # The question inside the quote ends a sentence of its own
+    assert metrics["sentences"] == 4
+    assert metrics["paragraphs"] == 1
+    assert counts.latin_words == 23
+    assert counts.commas == 1
+    # "was written" is passive, "was quickly sent" too, in the same sentence
+    assert counts.passive_sentences == 1
+    assert counts.dialogue_characters == len('"Where are you?"')
+    assert metrics["reading_ease"] is not None
+
+def test_counts_of_cjk_passage():
+    counts = count_text(CJK)
+    metrics = describe(counts)
+
+    assert metrics["sentences"] == 4
+    assert counts.latin_words == 0
+    assert counts.cjk_characters == 28
+    assert counts.passive_sentences == 1
+    assert counts.dialogue_characters == len("“你在哪里？”")
+    assert metrics["reading_ease"] is None
+
+def test_merged_counts_equal_counts_of_joined_text():
+    texts = [ENGLISH * 3, CJK * 2, "Short one.\n\n", ENGLISH + CJK]
+    merged = merge_counts(count_text(text) for text in texts)
+    joined = count_text("".join(texts))
+
+    assert merged == joined
+    assert describe(merged) == describe(joined)
+
+def test_repetition_is_reported():
+    issues = text_issues("The lantern swung. " * 3 + "The lantern glowed and the lantern dimmed. " * 3)
+    assert any("lantern" in issue for issue in issues)
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("language, unit", [("English", ENGLISH), ("CJK", CJK)])
+def test_analysis_benchmark_from_1kb_to_1mb(language, unit):
+    count_text(unit)  # Compile the patterns outside the timings
+
+    timings = {}
+    for size in SIZES:
+        text = text_of_size(unit, size)
+        best = float("inf")
+        for _ in range(3):
+            started = time.perf_counter()
+            describe(count_text(text))
+            text_issues(text)
+            best = min(best, time.perf_counter() - started)
+        timings[size] = best
+    print(f"\n{language} analysis: " +
+          ", ".join(f"{size // 1024} KB {seconds * 1000:.1f} ms" for size, seconds in timings.items()))
+
+    # Linear in the input: well over 1 MB/s at every size
+    for size, seconds in timings.items():
+        assert seconds < 0.05 + size / 1_000_000
+
+@pytest.mark.benchmark
+def test_project_analysis_benchmark_over_many_documents():
+    """Merging is the only part a vectorised batch API could speed up; it costs little next to tokenizing"""
+    documents = [text_of_size(ENGLISH if index % 2 else CJK, 10 * 1024) for index in range(500)]
+
+    started = time.perf_counter()
+    counts = [count_text(document) for document in documents]
+    tokenizing = time.perf_counter() - started
+    started = time.perf_counter()
+    describe(merge_counts(counts))
+    merging = time.perf_counter() - started
+    print(f"\n500 documents of 10 KB: counting {tokenizing * 1000:.0f} ms, merging and describing {merging * 1000:.1f} ms")
+
+    assert tokenizing < 0.05 + len(documents) * 10 * 1024 / 1_000_000
+    assert merging < tokenizing / 10
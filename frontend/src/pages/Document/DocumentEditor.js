@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   Box,
   Paper,
@@ -26,6 +26,21 @@ import projectService from '../../services/projectService';
 import aiService from '../../services/aiService';
 import AIAssistant from '../../components/AI/AIAssistant';
 
+// Single edit turning oldText into newText: the span between their common prefix and suffix
+const diffText = (oldText, newText) => {
+  if (oldText === newText) return null;
+  let start = 0;
+  const maxStart = Math.min(oldText.length, newText.length);
+  while (start < maxStart && oldText[start] === newText[start]) start++;
+  let oldEnd = oldText.length;
+  let newEnd = newText.length;
+  while (oldEnd > start && newEnd > start && oldText[oldEnd - 1] === newText[newEnd - 1]) {
+    oldEnd--;
+    newEnd--;
+  }
+  return { start, end: oldEnd, text: newText.slice(start, newEnd) };
+};
+
 const DocumentEditor = () => {
   const { projectId, documentId } = useParams();
   const navigate = useNavigate();
@@ -37,6 +52,8 @@ const DocumentEditor = () => {
   const [selectedText, setSelectedText] = useState('');
   const [aiResult, setAiResult] = useState('');
   const [aiResultType, setAiResultType] = useState('');
+  // Last state the server has, so autosave only sends what changed since
+  const savedRef = useRef({ title: '', content: '', version: null, sending: null });
 
   // Fetch document
   const { data: document, isLoading } = useQuery(
@@ -46,6 +63,7 @@ const DocumentEditor = () => {
       onSuccess: (data) => {
         setTitle(data.title);
         setContent(data.content || '');
+        savedRef.current = { title: data.title, content: data.content || '', version: data.version, sending: null };
       },
       onError: () => {
         toast.error('Failed to load document');
@@ -54,20 +72,83 @@ const DocumentEditor = () => {
     }
   );
 
+  // Send the title if it changed and the content as a diff against the saved version
+  const saveDocument = async ({ title, content }) => {
+    const saved = savedRef.current;
+    if (title !== saved.title) {
+      await projectService.updateDocument(documentId, { title });
+      saved.title = title;
+    }
+    await saveContent(content, true);
+  };
+
+  const saveContent = async (content, mayRebase) => {
+    const saved = savedRef.current;
+    const edit = diffText(saved.content, content);
+    if (!edit) {
+      return;
+    }
+    saved.sending = content;
+    try {
+      const result = await projectService.patchDocument(documentId, saved.version, [edit]);
+      saved.content = content;
+      saved.version = result.version;
+    } catch (error) {
+      if (error.response?.status !== 409 || !mayRebase) {
+        throw error;
+      }
+      // A save of ours may have landed without its reply reaching us; if the
+      // server has our text, carry on from its version instead of reporting a conflict
+      const current = await projectService.getDocument(documentId);
+      if ((current.content || '') !== saved.sending && (current.content || '') !== saved.content) {
+        throw error;
+      }
+      saved.content = current.content || '';
+      saved.version = current.version;
+      await saveContent(content, false);
+    }
+  };
+
+  // Saves run one at a time, each diffing against the version the last one
+  // produced; what arrives meanwhile waits, and only the newest is sent
+  const saveQueueRef = useRef({ running: null, latest: null });
+  const saveInOrder = (values) => {
+    const queue = saveQueueRef.current;
+    queue.latest = values;
+    if (!queue.running) {
+      queue.running = (async () => {
+        try {
+          while (queue.latest) {
+            const next = queue.latest;
+            queue.latest = null;
+            await saveDocument(next);
+          }
+        } finally {
+          queue.running = null;
+        }
+      })();
+    }
+    return queue.running;
+  };
+
   // Save document mutation
-  const saveDocumentMutation = useMutation(
-    (data) => projectService.updateDocument(documentId, data),
-    {
-      onSuccess: () => {
-        queryClient.invalidateQueries(['document', documentId]);
-        setHasUnsavedChanges(false);
-        toast.success('Document saved!');
-      },
-      onError: () => {
+  const saveDocumentMutation = useMutation(saveInOrder, {
+    onSuccess: () => {
+      // Keep the cached copy current without downloading the document again
+      queryClient.setQueryData(['document', documentId], (cached) =>
+        cached && { ...cached, ...savedRef.current }
+      );
+      setHasUnsavedChanges(false);
+      toast.success('Document saved!');
+    },
+    onError: (error) => {
+      if (error.response?.status === 409) {
+        toast.error('This document was changed elsewhere. Reload to get the latest version.');
+      } else {
         toast.error('Failed to save document');
-      },
-    }
-  );
+      }
+    },
+  });
 
   // AI assistance mutation
   const aiAssistanceMutation = useMutation(
@@ -85,15 +166,20 @@ const DocumentEditor = () => {
     }
   );
 
-  // Auto-save functionality
-  const debouncedSave = useCallback(
-    debounce((title, content) => {
-      if (hasUnsavedChanges) {
-        saveDocumentMutation.mutate({ title, content });
-      }
-    }, 2000),
-    [hasUnsavedChanges, saveDocumentMutation]
-  );
+  // Auto-save functionality: one debounce for the editor's lifetime, calling
+  // the current mutate so it never sees stale state
+  const mutateRef = useRef(saveDocumentMutation.mutate);
+  mutateRef.current = saveDocumentMutation.mutate;
+  const debouncedSaveRef = useRef(null);
+  if (!debouncedSaveRef.current) {
+    debouncedSaveRef.current = debounce((title, content) => {
+      mutateRef.current({ title, content });
+    }, 2000);
+  }
+  const debouncedSave = debouncedSaveRef.current;
+
+  // A pending save belongs to the document it was typed into
+  useEffect(() => () => debouncedSave.cancel(), [debouncedSave, documentId]);
 
   useEffect(() => {
     if (hasUnsavedChanges && title && content) {
@@ -112,6 +198,7 @@ const DocumentEditor = () => {
   };
 
   const handleManualSave = () => {
+    debouncedSave.cancel();
     saveDocumentMutation.mutate({ title, content });
   };
 
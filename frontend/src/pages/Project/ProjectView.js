@@ -63,7 +63,7 @@ const ProjectView = () => {
   // Fetch project documents
   const { data: documents, isLoading: documentsLoading } = useQuery(
     ['documents', projectId],
-    () => projectService.getProjectDocuments(projectId),
+    () => projectService.getProjectOutline(projectId),
     {
       enabled: !!projectId,
       onError: () => {
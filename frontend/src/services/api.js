@@ -21,12 +21,43 @@ api.interceptors.request.use(
   }
 );
 
+// Set by the auth store; exchanges the refresh token for a new access token
+let refreshAccessToken = null;
+let refreshing = null;
+
+export const setTokenRefresher = (refresher) => {
+  refreshAccessToken = refresher;
+};
+
 // Response interceptor
 api.interceptors.response.use(
   (response) => {
     return response;
   },
-  (error) => {
+  async (error) => {
+    const original = error.config;
+    
+    // Expired access token - refresh once and retry, sharing one refresh between requests
+    if (
+      error.response?.status === 401 &&
+      refreshAccessToken &&
+      original &&
+      !original._retried &&
+      !original.url?.startsWith('/auth/')
+    ) {
+      original._retried = true;
+      try {
+        refreshing = refreshing || refreshAccessToken().finally(() => {
+          refreshing = null;
+        });
+        const token = await refreshing;
+        original.headers['Authorization'] = `Bearer ${token}`;
+        return api(original);
+      } catch (refreshError) {
+        // Fall through to the login redirect
+      }
+    }
+    
     // Handle common errors
     if (error.response?.status === 401) {
       // Unauthorized - redirect to login
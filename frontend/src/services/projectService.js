@@ -37,6 +37,82 @@ export const projectService = {
     return response.data;
   },
 
+  // Get the outline of a project's documents (no content), following all pages
+  getProjectOutline: async (projectId) => {
+    const items = [];
+    let cursor = null;
+    do {
+      const response = await api.get(`/documents/project/${projectId}/outline`, {
+        params: cursor ? { cursor } : {},
+      });
+      items.push(...response.data.items);
+      cursor = response.data.next_cursor;
+    } while (cursor);
+    return items;
+  },
+
+  // Get a project's documents as a nested tree (no content); the browser revalidates it by ETag
+  getProjectTree: async (projectId) => {
+    const response = await api.get(`/projects/${projectId}/tree`);
+    return response.data;
+  },
+
+  // Get a project's word/character totals, daily progress for the last `days` days and per-chapter counts
+  getProjectStats: async (projectId, days = 30) => {
+    const response = await api.get(`/projects/${projectId}/stats`, {
+      params: { days },
+    });
+    return response.data;
+  },
+
+  // Get readability, sentence length, repetition, dialogue and passive voice metrics per document and overall
+  getProjectAnalysis: async (projectId) => {
+    const response = await api.get(`/projects/${projectId}/analysis`);
+    return response.data;
+  },
+
+  // Download the whole manuscript as 'markdown', 'text' or 'epub'; resolves to a Blob
+  exportProject: async (projectId, format = 'markdown') => {
+    const response = await api.get(`/projects/${projectId}/export`, {
+      params: { format },
+      responseType: 'blob'
+    });
+    return response.data;
+  },
+
+  // Import a zip of Markdown/text files; onProgress gets each progress line, the final line is returned
+  importProjectArchive: async (projectId, file, onProgress) => {
+    const formData = new FormData();
+    formData.append('file', file);
+    const parseLines = (text) => text.split('\n').filter(Boolean).map((line) => JSON.parse(line));
+    let seen = 0;
+    const response = await api.post(`/projects/${projectId}/import`, formData, {
+      headers: { 'Content-Type': 'multipart/form-data' },
+      responseType: 'text',
+      timeout: 0,
+      onDownloadProgress: (event) => {
+        const text = event.event?.target?.responseText || '';
+        const complete = text.slice(0, text.lastIndexOf('\n') + 1);
+        if (onProgress) {
+          parseLines(complete.slice(seen)).forEach(onProgress);
+        }
+        seen = complete.length;
+      },
+    });
+    const lines = parseLines(response.data);
+    const result = lines[lines.length - 1];
+    if (result?.error) {
+      throw new Error(result.error);
+    }
+    return result;
+  },
+
+  // Apply create/update/reorder/delete operations to a project's documents in one transaction
+  bulkDocumentOperations: async (projectId, operations) => {
+    const response = await api.post(`/documents/project/${projectId}/bulk`, { operations });
+    return response.data.results;
+  },
+
   // Create a document
   createDocument: async (documentData) => {
     const response = await api.post('/documents/', documentData);
@@ -55,6 +131,12 @@ export const projectService = {
     return response.data;
   },
 
+  // Apply text edits made against a document version
+  patchDocument: async (documentId, version, edits) => {
+    const response = await api.patch(`/documents/${documentId}`, { version, edits });
+    return response.data;
+  },
+
   // Delete a document
   deleteDocument: async (documentId) => {
     const response = await api.delete(`/documents/${documentId}`);
@@ -1,12 +1,13 @@
 import { create } from 'zustand';
 import { persist } from 'zustand/middleware';
-import api from '../services/api';
+import api, { setTokenRefresher } from '../services/api';
 
 export const useAuthStore = create(
   persist(
     (set, get) => ({
       user: null,
       token: null,
+      refreshToken: null,
       isAuthenticated: false,
       isLoading: false,
 
@@ -14,7 +15,7 @@ export const useAuthStore = create(
         set({ isLoading: true });
         try {
           const response = await api.post('/auth/login', credentials);
-          const { access_token } = response.data;
+          const { access_token, refresh_token } = response.data;
           
           // Set token in API headers
           api.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
@@ -24,6 +25,7 @@ export const useAuthStore = create(
           
           set({
             token: access_token,
+            refreshToken: refresh_token,
             user: userResponse.data,
             isAuthenticated: true,
             isLoading: false,
@@ -55,12 +57,19 @@ export const useAuthStore = create(
       },
 
       logout: () => {
+        // Revoke the refresh token; the local session ends either way
+        const { refreshToken } = get();
+        if (refreshToken) {
+          api.post('/auth/logout', { refresh_token: refreshToken }).catch(() => {});
+        }
+        
         // Remove token from API headers
         delete api.defaults.headers.common['Authorization'];
         
         set({
           user: null,
           token: null,
+          refreshToken: null,
           isAuthenticated: false,
         });
       },
@@ -82,6 +91,7 @@ export const useAuthStore = create(
       name: 'auth-storage',
       partialize: (state) => ({
         token: state.token,
+        refreshToken: state.refreshToken,
         user: state.user,
         isAuthenticated: state.isAuthenticated,
       }),
@@ -89,5 +99,38 @@ export const useAuthStore = create(
   )
 );
 
+// Renew the access token with the refresh token instead of asking for the password again
+setTokenRefresher(async () => {
+  const { refreshToken } = useAuthStore.getState();
+  if (!refreshToken) {
+    throw new Error('No refresh token');
+  }
+  
+  const response = await api.post('/auth/refresh', { refresh_token: refreshToken });
+  const { access_token, refresh_token } = response.data;
+  
+  api.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+  useAuthStore.setState({ token: access_token, refreshToken: refresh_token });
+  return access_token;
+});
+
+// Other tabs share the persisted tokens; pick up their refreshes and logouts
+// so this tab never presents a refresh token another tab already rotated
+if (typeof window !== 'undefined') {
+  window.addEventListener('storage', (event) => {
+    if (event.key !== 'auth-storage') {
+      return;
+    }
+    
+    useAuthStore.persist.rehydrate();
+    const { token } = useAuthStore.getState();
+    if (token) {
+      api.defaults.headers.common['Authorization'] = `Bearer ${token}`;
+    } else {
+      delete api.defaults.headers.common['Authorization'];
+    }
+  });
+}
+
 // Initialize auth on app start
 useAuthStore.getState().initializeAuth();